@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the PageCacheMonitor iteration end to end over probe directories of different
+sizes and eviction patterns, emitting one JSON record per scenario.
+The syscalls are the profiler estimation, they are not traced. Next to the costs, the
+min_cached_time reported is compared with the one of an exact search on the oracle, and
+the live probes the oracle evicted but the monitor kept are counted.
+
+The residency of the probes is decided by a fake oracle in place of the cache module, so
+the results are reproducible and do not depend on the memory pressure of the host.
+The time is simulated as well, every iteration advances the clock by the interval.
+
+Usage:
+    python benchmarks/tick_benchmark.py --samples 1000 10000 100000 --output results.jsonl
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from unittest.mock import patch
+
+from pagecache import pagecache_monitor, ring_probe_store
+from pagecache.clock import ProbeClock
+from pagecache.pagecache_monitor import NANOSECONDS, PageCacheMonitor
+
+START_TIME = 1693739406 * NANOSECONDS
+
+
+class CleanEviction(object):
+    """
+    Probes are evicted exactly in creation order once they are older than ttl
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def is_cached(self, probe, now):
+        return now - probe < self.ttl
+
+
+class OutOfOrderEviction(CleanEviction):
+    """
+    Like CleanEviction, but one out of every `every` probes is evicted early, once it is
+    older than half of the ttl
+    """
+
+    def __init__(self, ttl, every=50):
+        super().__init__(ttl)
+        self.every = every
+
+    def is_cached(self, probe, now):
+        age = now - probe
+        if age >= self.ttl // 2 and zlib.crc32(str(probe).encode()) % self.every == 0:
+            return False
+        return age < self.ttl
+
+
+class BurstyEviction(CleanEviction):
+    """
+    The ttl collapses to ttl / 10 during the first `burst` of every `period` (both in ns),
+    like a broker under heavy produce load from time to time
+    """
+
+    def __init__(self, ttl, period, burst):
+        super().__init__(ttl)
+        self.period = period
+        self.burst = burst
+
+    def is_cached(self, probe, now):
+        if (now - START_TIME) % self.period < self.burst:
+            return now - probe < self.ttl // 10
+        return now - probe < self.ttl
+
+
+class FakeCache(object):
+    """
+    Implements the calls of the cache module used by the monitor with an oracle deciding
+    the residency of every probe
+    """
+
+    def __init__(self, oracle, clock):
+        self.oracle = oracle
+        self.clock = clock
+        self.ring = None
+
+    def backend(self):
+        return "mincore"
+
+    def ratio_batch(self, paths):
+        now = self.clock.now
+        return [
+            (1, 1)
+            if self.oracle.is_cached(int(os.path.basename(path)), now)
+            else (0, 1)
+            for path in paths
+        ]
+
+    def residency(self, fd, offset=0, length=0):
+        now = self.clock.now
+        return bytes(self.ring.header_pages) + bytes(
+            1 if timestamp and self.oracle.is_cached(timestamp, now) else 0
+            for timestamp in self.ring.timestamps
+        )
+
+
+class FakeClock(object):
+    def __init__(self, start):
+        self.now = start
+
+    def time_ns(self):
+        return self.now
+
+
+def create_probe_directory(directory, samples, interval_ns):
+    """
+    Creates samples probe files, the newest one created one interval before START_TIME
+    """
+    for sample in range(1, samples + 1):
+        probe = START_TIME - sample * interval_ns
+        with open(os.path.join(directory, str(probe)), "w") as fd:
+            fd.write(str(probe))
+
+
+def get_exact_min_cached_time(oracle, probes, now, max_age_ns):
+    """
+    Returns the min_cached_time an exact linear search would report, probes sorted from
+    newest to oldest
+    """
+    oldest_cached = None
+    for probe in probes:
+        if probe < now - max_age_ns or not oracle.is_cached(probe, now):
+            break
+        oldest_cached = probe
+    if oldest_cached is None:
+        return None
+    return (now - oldest_cached) / NANOSECONDS
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return values[int(ratio * (len(values) - 1))]
+
+
+def run_scenario(samples, pattern, probe_store, search_mode, ticks, interval_seconds=1):
+    interval_ns = interval_seconds * NANOSECONDS
+    # Steady state, every iteration one probe is created and about one gets evicted
+    ttl = int((samples - 0.5) * interval_ns)
+    oracles = {
+        "clean": CleanEviction(ttl),
+        "out_of_order": OutOfOrderEviction(ttl),
+        "bursty": BurstyEviction(ttl, 60 * interval_ns, 5 * interval_ns),
+    }
+    clock = FakeClock(START_TIME)
+    fake_cache = FakeCache(oracles[pattern], clock)
+
+    directory = tempfile.mkdtemp(prefix="pagecache_bench_")
+    try:
+        with patch.object(pagecache_monitor, "cache", fake_cache), patch.object(
+            ring_probe_store, "cache", fake_cache
+        ), patch.object(ProbeClock, "time_ns", clock.time_ns):
+            if probe_store == "files":
+                create_probe_directory(directory, samples, interval_ns)
+            monitor = PageCacheMonitor(
+                directory,
+                interval_seconds,
+                samples * interval_seconds * 2,
+                None,
+                probe_store=probe_store,
+                search_mode=search_mode,
+                write_strategy="none",
+                profile=True,
+                profile_every_ticks=ticks,
+            )
+            if probe_store == "ring":
+                fake_cache.ring = monitor.ring_probe_store
+                for sample in range(samples, 0, -1):
+                    monitor.ring_probe_store.add_probe(
+                        START_TIME - sample * interval_ns
+                    )
+
+            oracle = oracles[pattern]
+            latencies = []
+            syscalls = []
+            probes = []
+            errors = []
+            missed_evictions = []
+            for tick in range(ticks):
+                # The new probe and the ones tracked before the iteration
+                candidates = [clock.now] + list(monitor._get_live_probes())
+                started = time.perf_counter()
+                min_cached_time = monitor._tick()
+                latencies.append(time.perf_counter() - started)
+                syscalls.append(monitor.tick_metrics["tick_syscalls_estimated"])
+                probes.append(monitor.tick_metrics.get("tick_probes", 0))
+                exact_min_cached_time = get_exact_min_cached_time(
+                    oracle, candidates, clock.now, monitor.max_time_window_ns
+                )
+                errors.append(abs(min_cached_time - exact_min_cached_time))
+                missed_evictions.append(
+                    sum(
+                        not oracle.is_cached(probe, clock.now)
+                        for probe in monitor._get_live_probes()
+                    )
+                )
+                clock.now += interval_ns
+
+            # Separate pass, tracing the allocations slows down the iteration
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+            monitor._tick()
+            traced_current, traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            live_probes = len(monitor._get_live_probes())
+    finally:
+        shutil.rmtree(directory)
+
+    return {
+        "probe_store": probe_store,
+        "search_mode": search_mode,
+        "pattern": pattern,
+        "samples": samples,
+        "ticks": ticks,
+        "live_probes": live_probes,
+        "tick_ms_p50": round(percentile(latencies, 0.50) * 1000, 4),
+        "tick_ms_p99": round(percentile(latencies, 0.99) * 1000, 4),
+        "tick_ms_max": round(max(latencies) * 1000, 4),
+        "estimated_syscalls_per_tick_p50": percentile(syscalls, 0.50),
+        "estimated_syscalls_per_tick_p99": percentile(syscalls, 0.99),
+        "probes_per_tick_p50": percentile(probes, 0.50),
+        "tick_peak_alloc_bytes": traced_peak - traced_current,
+        "min_cached_time_error_seconds_p50": percentile(errors, 0.50),
+        "min_cached_time_error_seconds_max": max(errors),
+        "missed_evictions_max": max(missed_evictions),
+    }
+
+
+def parseargs(argv=None):
+    parser = argparse.ArgumentParser(description="PageCache TTL tick benchmark")
+    parser.add_argument("--samples", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument(
+        "--patterns",
+        nargs="+",
+        choices=["clean", "out_of_order", "bursty"],
+        default=["clean", "out_of_order", "bursty"],
+    )
+    parser.add_argument(
+        "--probe-stores",
+        nargs="+",
+        choices=["files", "ring"],
+        default=["files", "ring"],
+    )
+    parser.add_argument(
+        "--search-modes",
+        nargs="+",
+        choices=["linear", "bisect"],
+        default=["linear", "bisect"],
+    )
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument(
+        "--output", type=str, default=None, help="JSON lines file, STDOUT by default"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseargs(argv)
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for samples in args.samples:
+            for pattern in args.patterns:
+                for probe_store in args.probe_stores:
+                    # The search mode only applies to the files store
+                    search_modes = (
+                        args.search_modes if probe_store == "files" else ["linear"]
+                    )
+                    for search_mode in search_modes:
+                        result = run_scenario(
+                            samples, pattern, probe_store, search_mode, args.ticks
+                        )
+                        output.write(json.dumps(result) + "\n")
+                        output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+
+from pagecache.clock import get_next_tick
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPageCacheMonitor(object):
+    """
+    Asyncio wrapper of a PageCacheMonitor to embed it in an event loop without a dedicated
+    thread of its own. The blocking probe syscalls run in an executor (the default one of
+    the loop if none is given) and the results are yielded by an async iterator:
+
+        async for metrics in AsyncPageCacheMonitor(monitor):
+            print(metrics["min_cached_time"])
+
+    Any number of them can share the same event loop, see run_monitors().
+    """
+
+    def __init__(self, monitor, executor=None, report=False, start_delay=0):
+        self.monitor = monitor
+        self.executor = executor
+        # Also reports through the sinks of the monitor (stdout, DogStatsD, Prometheus)
+        self.report = report
+        # Seconds before the first iteration, to stagger several monitors
+        self.start_delay = start_delay
+
+    def _run_tick(self):
+        # Same iteration as the synchronous loop: target files and profile dumps included
+        min_cached_time = self.monitor.run_once(report=self.report)
+        return self.monitor.get_metrics(min_cached_time)
+
+    async def tick(self):
+        """
+        Runs one iteration in the executor and returns its metrics
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, self._run_tick)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # An iteration can not be interrupted, it is left to finish so the probe index
+            # matches the directory when the monitor is used again
+            await asyncio.wait([future])
+            raise
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        # Ticks are scheduled on the monotonic clock of the loop, like run()
+        next_tick = loop.time() + self.start_delay
+        while True:
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+            yield await self.tick()
+            next_tick = get_next_tick(
+                next_tick, self.monitor.current_interval_seconds, loop.time()
+            )
+
+    async def run(self, callback):
+        """
+        Calls callback with the metrics of every iteration until cancelled,
+        callback can be a function or a coroutine function
+        """
+        async for metrics in self:
+            result = callback(metrics)
+            if asyncio.iscoroutine(result):
+                await result
+
+
+async def run_monitors(monitors, callback, executor=None):
+    """
+    Runs several PageCacheMonitor in the running loop until cancelled, their iterations are
+    staggered evenly over the interval of the first one. Cancelling it cancels all of them.
+    """
+    offset = monitors[0].interval_seconds / len(monitors)
+    tasks = [
+        asyncio.ensure_future(
+            AsyncPageCacheMonitor(monitor, executor, start_delay=position * offset).run(
+                callback
+            )
+        )
+        for position, monitor in enumerate(monitors)
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,32 +1,64 @@
 import argparse
+import importlib
 import logging
 import os
 import signal
 import sys
 
-import daemon
-from pid import PidFile
-
 from pagecache.configure_logging import configure_logging
 from pagecache.pagecache_monitor import PageCacheMonitor
+from pagecache.probe_writer import WRITE_STRATEGIES, measure_write_strategies
 
 logger = logging.getLogger(__name__)
 
+# Subcommands with their own arguments, `pagecache <subcommand> ...`, and their module
+SUBCOMMANDS = {"inventory": "pagecache.inventory", "simulate": "pagecache.simulate"}
+
 
 def parseargs():
     parser = argparse.ArgumentParser(description="PageCache TTL")
     parser.add_argument(
         "--tmp-dir",
         type=str,
-        default="tmp/",
-        help="Sets the tmp directory wher ehte program stores the tracking dummy files.",
-        required=True,
+        nargs="+",
+        default=None,
+        help="Sets the tmp directory wher ehte program stores the tracking dummy files. Several directories (e.g. one per filesystem) are monitored from the same process, tagged by directory.",
+        required=False,
     )
     parser.add_argument(
-        "--interval-seconds",
+        "--target-files",
+        type=str,
+        nargs="+",
+        default=[],
+        help="Besides the probes, tracks which ranges of these files stay cached and their churn every interval, reported through the same sinks. Without --tmp-dir only these files are tracked.",
+        required=False,
+    )
+    parser.add_argument(
+        "--target-ranges",
         type=int,
+        default=16,
+        help="Sets in how many ranges every target file is split to report its cached ratio.",
+        required=False,
+    )
+    parser.add_argument(
+        "--interval-seconds",
+        type=float,
         default=5,
-        help="Sets the interval to check oldest cached sample (in seconds)",
+        help="Sets the interval to check oldest cached sample (in seconds, fractions allowed)",
+        required=False,
+    )
+    parser.add_argument(
+        "--adaptive-error",
+        type=float,
+        default=None,
+        help="Enables the adaptive mode: the interval and the probes kept follow the measured min cached time within this relative error (e.g. 0.05), --interval-seconds becomes the minimum interval.",
+        required=False,
+    )
+    parser.add_argument(
+        "--max-interval-seconds",
+        type=float,
+        default=60,
+        help="Sets the maximum interval in adaptive mode (in seconds)",
         required=False,
     )
     parser.add_argument(
@@ -36,6 +68,87 @@ def parseargs():
         help="Sets the maximum time to check keep track of page cache (in seconds)",
         required=False,
     )
+    parser.add_argument(
+        "--probe-store",
+        type=str,
+        choices=["files", "ring"],
+        default="files",
+        help="Sets how probes are stored: one file per sample or a single preallocated ring file.",
+        required=False,
+    )
+    parser.add_argument(
+        "--search-mode",
+        type=str,
+        choices=["linear", "bisect"],
+        default="linear",
+        help="Sets how the first not cached probe file is searched: probing every file or bisecting the list.",
+        required=False,
+    )
+    parser.add_argument(
+        "--boundary-check-probes",
+        type=int,
+        default=3,
+        help="Sets how many files before the bisected boundary are also probed to catch out of order evictions.",
+        required=False,
+    )
+    parser.add_argument(
+        "--write-strategy",
+        type=str,
+        choices=WRITE_STRATEGIES,
+        default="fsync",
+        help="Sets how the probes are synced to disk after writing them.",
+        required=False,
+    )
+    parser.add_argument(
+        "--active-probes",
+        required=False,
+        default=False,
+        action="store_true",
+        help="Also tracks probes read twice to be promoted to the active list, reported as active_min_cached_time.",
+    )
+    parser.add_argument(
+        "--stats-windows",
+        type=int,
+        nargs="+",
+        default=[],
+        help="Also reports the rolling min, p50, p99 and max of the min cached time over these windows (in seconds), e.g. 60 300 3600.",
+        required=False,
+    )
+    parser.add_argument(
+        "--eviction-curve",
+        required=False,
+        default=False,
+        action="store_true",
+        help="Also fits the residency by age of all the probes and reports the ages when 50%%, 90%% and 99%% of them are evicted.",
+    )
+    parser.add_argument(
+        "--proc-estimator",
+        required=False,
+        default=False,
+        action="store_true",
+        help="Also reports the inactive list turnover estimated from /proc/meminfo and /proc/vmstat as estimated_inactive_ttl_seconds.",
+    )
+    parser.add_argument(
+        "--proc-root",
+        type=str,
+        default="/proc",
+        help="Sets the proc filesystem read by the estimator.",
+        required=False,
+    )
+    parser.add_argument(
+        "--checkpoint-every-ticks",
+        type=int,
+        default=0,
+        help="Sets how many iterations between checkpoints of the probe state used to resume after a restart, e.g. every few minutes. 0 (default) disables them.",
+        required=False,
+    )
+    parser.add_argument(
+        "--report-write-costs",
+        required=False,
+        default=False,
+        action="store_true",
+        help="Print the cost of every write strategy in the tmp directory and exit.",
+    )
     parser.add_argument(
         "--daemon",
         required=False,
@@ -43,6 +156,20 @@ def parseargs():
         action="store_true",
         help="Execute the program in daemon mode.",
     )
+    parser.add_argument(
+        "--once",
+        required=False,
+        default=False,
+        action="store_true",
+        help="Run a single iteration against the existing probes, print the result and exit.",
+    )
+    parser.add_argument(
+        "--pidfile",
+        type=str,
+        default="/var/run/pagecache_ttl.pid",
+        help="Sets the pid file used in daemon mode.",
+        required=False,
+    )
     parser.add_argument(
         "--send-metrics-to-dogstatsd",
         required=False,
@@ -50,6 +177,62 @@ def parseargs():
         action="store_true",
         help="Send metrics to local DogStatsD https://docs.datadoghq.com/developers/dogstatsd/",
     )
+    parser.add_argument(
+        "--dogstatsd-address",
+        type=str,
+        default="127.0.0.1:8125",
+        help="Sets the DogStatsD address, host:port for UDP or unix:///path/to/dsd.socket for a Unix domain socket.",
+        required=False,
+    )
+    parser.add_argument(
+        "--ndjson-output",
+        type=str,
+        default=None,
+        help="Writes the metrics as newline delimited JSON records to STDOUT (-), a file or a Unix socket (unix:///path) instead of printing them.",
+        required=False,
+    )
+    parser.add_argument(
+        "--ndjson-flush-every-ticks",
+        type=int,
+        default=1,
+        help="Sets how many records are buffered before writing them.",
+        required=False,
+    )
+    parser.add_argument(
+        "--ndjson-buffer-bytes",
+        type=int,
+        default=1048576,
+        help="Sets the size of the NDJSON buffer, records are dropped while it is full.",
+        required=False,
+    )
+    parser.add_argument(
+        "--prometheus-port",
+        type=int,
+        default=None,
+        help="Serves the metrics in Prometheus/OpenMetrics text format on this port.",
+        required=False,
+    )
+    parser.add_argument(
+        "--prometheus-address",
+        type=str,
+        default="0.0.0.0",
+        help="Sets the address the Prometheus exporter listens on.",
+        required=False,
+    )
+    parser.add_argument(
+        "--profile",
+        required=False,
+        default=False,
+        action="store_true",
+        help="Times every phase of the iterations, reports them as metrics and prints a per-phase breakdown to STDERR.",
+    )
+    parser.add_argument(
+        "--profile-every-ticks",
+        type=int,
+        default=60,
+        help="Sets how many iterations are summarized in every per-phase breakdown.",
+        required=False,
+    )
     parser.add_argument(
         "--log-level",
         type=str,
@@ -65,7 +248,10 @@ def parseargs():
         help="Sets the tmp directory wher ehte program stores the tracking dummy files.",
         required=False,
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.tmp_dir is None and not args.target_files:
+        parser.error("--tmp-dir is required unless --target-files is used")
+    return args
 
 
 def signal_term_handler(signal, frame):
@@ -78,33 +264,160 @@ def signal_term_handler(signal, frame):
     sys.exit(0)
 
 
+def build_pagecache_monitor(
+    args, tmp_dir, tags=None, prometheus_port=None, ndjson_output=None
+):
+    return PageCacheMonitor(
+        tmp_dir,
+        args.interval_seconds,
+        args.max_time_window_seconds,
+        args.log_file,
+        args.send_metrics_to_dogstatsd,
+        probe_store=args.probe_store,
+        search_mode=args.search_mode,
+        boundary_check_probes=args.boundary_check_probes,
+        write_strategy=args.write_strategy,
+        prometheus_port=prometheus_port,
+        prometheus_address=args.prometheus_address,
+        profile=args.profile,
+        profile_every_ticks=args.profile_every_ticks,
+        checkpoint_every_ticks=args.checkpoint_every_ticks,
+        active_probes=args.active_probes,
+        tags=tags,
+        stats_windows=args.stats_windows,
+        adaptive_error=args.adaptive_error,
+        max_interval_seconds=args.max_interval_seconds,
+        proc_estimator=args.proc_estimator,
+        proc_root=args.proc_root,
+        dogstatsd_address=args.dogstatsd_address,
+        ndjson_output=ndjson_output,
+        ndjson_flush_every_ticks=args.ndjson_flush_every_ticks,
+        ndjson_buffer_bytes=args.ndjson_buffer_bytes,
+        eviction_curve=args.eviction_curve,
+    )
+
+
+def build_target_tracker(args, prometheus_port):
+    """
+    Returns a TargetFileTracker with its own sinks, used when there are not probes
+    """
+    from pagecache.target_tracker import TargetFileTracker
+
+    tracker = TargetFileTracker(
+        args.target_files, args.interval_seconds, args.target_ranges
+    )
+    if args.send_metrics_to_dogstatsd:
+        from pagecache.dogstatsd_sink import DogStatsDSink
+
+        tracker.statsd = DogStatsDSink(args.dogstatsd_address)
+    if prometheus_port is not None:
+        from pagecache.prometheus_exporter import PrometheusExporter
+
+        tracker.prometheus_exporter = PrometheusExporter(
+            args.prometheus_address, prometheus_port
+        )
+        tracker.prometheus_exporter.start()
+    if args.ndjson_output is not None:
+        from pagecache.ndjson_sink import NDJSONSink
+
+        tracker.ndjson_sink = NDJSONSink(
+            args.ndjson_output,
+            args.ndjson_buffer_bytes,
+            args.ndjson_flush_every_ticks,
+        )
+    return tracker
+
+
+def attach_target_tracker(args, monitor, prometheus_exporter, ndjson_sink):
+    """
+    Runs the target files tracker in the iterations of the probe monitor, reporting
+    through its sinks
+    """
+    from pagecache.target_tracker import TargetFileTracker
+
+    tracker = TargetFileTracker(
+        args.target_files, args.interval_seconds, args.target_ranges
+    )
+    if monitor.send_metrics_to_dogstatsd:
+        tracker.statsd = monitor.statsd
+    tracker.prometheus_exporter = prometheus_exporter
+    tracker.ndjson_sink = ndjson_sink
+    monitor.target_tracker = tracker
+
+
+def build_monitor(args):
+    """
+    Returns a PageCacheMonitor, or a MultiDirectoryMonitor sharing the scheduler and the
+    Prometheus exporter when there are several tmp directories. The target files are
+    tracked in the iterations of the (first) monitor, or by a TargetFileTracker alone
+    when there are not tmp directories
+    """
+    # Nothing would be scraped from a single iteration
+    prometheus_port = None if args.once else args.prometheus_port
+    if args.tmp_dir is None:
+        return build_target_tracker(args, prometheus_port)
+
+    if len(args.tmp_dir) == 1:
+        monitor = build_pagecache_monitor(
+            args, args.tmp_dir[0], None, prometheus_port, args.ndjson_output
+        )
+        if args.target_files:
+            attach_target_tracker(
+                args, monitor, monitor.prometheus_exporter, monitor.ndjson_sink
+            )
+        return monitor
+
+    from pagecache.multi_monitor import MultiDirectoryMonitor
+
+    monitors = [
+        build_pagecache_monitor(args, tmp_dir, {"tmp_dir": tmp_dir})
+        for tmp_dir in args.tmp_dir
+    ]
+    ndjson_sink = None
+    if args.ndjson_output is not None:
+        from pagecache.ndjson_sink import NDJSONSink
+
+        # A single sink, so the records of the directories are never interleaved
+        ndjson_sink = NDJSONSink(
+            args.ndjson_output,
+            args.ndjson_buffer_bytes,
+            args.ndjson_flush_every_ticks,
+        )
+        for monitor in monitors:
+            monitor.ndjson_sink = ndjson_sink
+    multi_monitor = MultiDirectoryMonitor(
+        monitors,
+        args.interval_seconds,
+        prometheus_port=prometheus_port,
+        prometheus_address=args.prometheus_address,
+    )
+    if args.target_files:
+        attach_target_tracker(
+            args, monitors[0], multi_monitor.prometheus_exporter, ndjson_sink
+        )
+    return multi_monitor
+
+
 def load_daemon_mode(args, log_file_fd):
+    # Only needed in daemon mode, imported here to keep the startup fast
+    import daemon
+    from pid import PidFile
+
     context = daemon.DaemonContext(
         umask=0o002,
-        pidfile=PidFile(pidname="/var/run/pagecache_ttl.pid"),
+        pidfile=PidFile(pidname=args.pidfile),
     )
     context.files_preserve = [log_file_fd]
     context.signal_map = {signal.SIGTERM: signal_term_handler}
 
     with context:
-        pagecache_monitor = PageCacheMonitor(
-            args.tmp_dir,
-            args.interval_seconds,
-            args.max_time_window_seconds,
-            args.log_file,
-            args.send_metrics_to_dogstatsd,
-        )
+        # Built once daemonized, so the exporter thread and fds belong to the daemon
+        pagecache_monitor = build_monitor(args)
         pagecache_monitor.run()
 
 
 def load_script_mode(args):
-    pagecache_monitor = PageCacheMonitor(
-        args.tmp_dir,
-        args.interval_seconds,
-        args.max_time_window_seconds,
-        args.log_file,
-        args.send_metrics_to_dogstatsd,
-    )
+    pagecache_monitor = build_monitor(args)
 
     signal.signal(signal.SIGTERM, signal_term_handler)
     signal.signal(signal.SIGINT, signal_term_handler)
@@ -112,10 +425,25 @@ def load_script_mode(args):
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        # Imported only when used, to keep the startup fast
+        module = importlib.import_module(SUBCOMMANDS[sys.argv[1]])
+        return module.main(sys.argv[2:])
+
     args = parseargs()
     log_file_fd = configure_logging(args.log_level, args.log_file)
 
-    if args.daemon:
+    if args.report_write_costs:
+        for tmp_dir in args.tmp_dir or []:
+            for write_strategy, cost in measure_write_strategies(tmp_dir).items():
+                print({"tmp_dir": tmp_dir, "write_strategy": write_strategy, **cost})
+        return
+
+    if args.once:
+        os.environ["EXECUTION_MODE"] = "once"
+        logger.info("Running a single PageCache TTL iteration...")
+        build_monitor(args).run_once()
+    elif args.daemon:
         os.environ["EXECUTION_MODE"] = "daemon"
         logger.info("Starting PageCache TTL service as daemon mode...")
         load_daemon_mode(args, log_file_fd)
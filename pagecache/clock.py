@@ -0,0 +1,32 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ProbeClock(object):
+    """
+    Wall clock timestamps in nanoseconds which only advance with the monotonic clock.
+    The wall clock is read once, so a clock step (NTP, manual change) never reorders the
+    probe ids, which are bisected assuming they are sorted by creation time
+    """
+
+    def __init__(self):
+        self.offset_ns = time.time_ns() - time.monotonic_ns()
+
+    def time_ns(self):
+        return time.monotonic_ns() + self.offset_ns
+
+
+def get_next_tick(previous_tick, interval_seconds, now):
+    """
+    Returns the tick following previous_tick on the interval grid (monotonic seconds).
+    Ticks missed during a stall are skipped instead of run back to back, a burst would
+    create probes a few microseconds apart
+    """
+    next_tick = previous_tick + interval_seconds
+    if next_tick < now:
+        missed = int((now - next_tick) // interval_seconds) + 1
+        logger.warning("Skipping {} missed iterations".format(missed))
+        next_tick += missed * interval_seconds
+    return next_tick
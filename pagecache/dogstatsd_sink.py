@@ -0,0 +1,94 @@
+import logging
+import socket
+
+logger = logging.getLogger(__name__)
+
+UNIX_SCHEME = "unix://"
+# Default payload sizes of the DogStatsD clients, fitting in a single packet
+UDP_MAX_PACKET_SIZE = 1432
+UDS_MAX_PACKET_SIZE = 8192
+
+
+class DogStatsDSink(object):
+    """
+    Buffered DogStatsD client: the metrics of an iteration are added with gauge() and sent
+    by flush() coalesced in as few datagrams as possible.
+    The socket is non-blocking, when the agent is slow or down the datagrams are dropped
+    and counted instead of blocking the iteration.
+    The address is either "host:port" (UDP) or "unix:///path/to/dsd.socket" (UDS).
+    """
+
+    def __init__(self, address="127.0.0.1:8125", max_packet_size=None):
+        self.address = address
+        if address.startswith(UNIX_SCHEME):
+            self.family = socket.AF_UNIX
+            self.target = address.replace(UNIX_SCHEME, "", 1)
+            default_max_packet_size = UDS_MAX_PACKET_SIZE
+        else:
+            host, port = address.rsplit(":", 1)
+            self.family = socket.AF_INET
+            self.target = (host, int(port))
+            default_max_packet_size = UDP_MAX_PACKET_SIZE
+        self.max_packet_size = max_packet_size or default_max_packet_size
+        self.socket = None
+        self.lines = []
+        self.dropped_packets = 0
+
+    def _connect(self):
+        sock = socket.socket(self.family, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        try:
+            sock.connect(self.target)
+        except OSError:
+            sock.close()
+            raise
+        self.socket = sock
+
+    def gauge(self, name, value, tags=None):
+        line = "{}:{}|g".format(name, value)
+        if tags:
+            line += "|#" + ",".join(tags)
+        self.lines.append(line.encode())
+
+    def _get_packets(self):
+        packet = []
+        size = 0
+        for line in self.lines:
+            if packet and size + 1 + len(line) > self.max_packet_size:
+                yield b"\n".join(packet)
+                packet = []
+                size = 0
+            size += len(line) + (1 if packet else 0)
+            packet.append(line)
+        if packet:
+            yield b"\n".join(packet)
+
+    def flush(self):
+        """
+        Sends the buffered metrics, returns how many datagrams were sent
+        """
+        packets = list(self._get_packets())
+        self.lines = []
+        sent = 0
+        for idx, packet in enumerate(packets):
+            try:
+                if self.socket is None:
+                    self._connect()
+                self.socket.send(packet)
+                sent += 1
+            except (BlockingIOError, InterruptedError):
+                # The agent is not keeping up, the rest of the datagrams would block too
+                self.dropped_packets += len(packets) - idx
+                break
+            except OSError as error:
+                # The agent is down, connected again on the next flush
+                logger.debug("Can't send metrics to DogStatsD: {}".format(error))
+                self.dropped_packets += len(packets) - idx
+                self.close()
+                break
+        return sent
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
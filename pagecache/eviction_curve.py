@@ -0,0 +1,74 @@
+import itertools
+from array import array
+
+# Fraction of evicted pages reported by default, e.g. 0.9 is the age when 90% are evicted
+DEFAULT_EVICTED_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def fit_survival_curve(ages, resident):
+    """
+    Fits the probability of a page being resident by its age with an isotonic (non
+    increasing) regression, pooling adjacent violators in a single pass.
+    ages must be sorted ascending and resident has 1 or 0 for every age, one point per
+    live probe, so the input is bounded by the time window over the probe interval.
+    Adjacent probes with the same residency always end up in the same block, so every run
+    is pooled up front, counted and summed by builtins, and the loop runs once per run:
+    a few times with clean evictions instead of once per probe.
+    Returns the (mean age, resident probability) of every pooled block sorted by age.
+    """
+    # Sums of ages, residents and probes of every block, as arrays of the pooled blocks
+    age_sums = array("d")
+    resident_sums = array("d")
+    weights = array("d")
+    start = 0
+    for is_resident, run in itertools.groupby(resident):
+        weight = sum(1 for _ in run)
+        end = start + weight
+        age_sums.append(sum(ages[start:end]))
+        resident_sums.append(is_resident * weight)
+        weights.append(weight)
+        start = end
+        # Merge while the previous block is not more resident than the last one
+        while len(weights) > 1:
+            if resident_sums[-2] * weights[-1] > resident_sums[-1] * weights[-2]:
+                break
+            age_sum, resident_sum, weight = (
+                age_sums.pop(),
+                resident_sums.pop(),
+                weights.pop(),
+            )
+            age_sums[-1] += age_sum
+            resident_sums[-1] += resident_sum
+            weights[-1] += weight
+    return [
+        (age_sum / weight, resident_sum / weight)
+        for age_sum, resident_sum, weight in zip(age_sums, resident_sums, weights)
+    ]
+
+
+def get_eviction_age(curve, evicted):
+    """
+    Returns the age when the evicted fraction of pages is evicted, linearly interpolated
+    between the blocks of the curve, None if the curve never gets there
+    """
+    survival = 1 - evicted
+    previous = None
+    for age, resident in curve:
+        if resident <= survival:
+            if previous is None or previous[1] == resident:
+                return age
+            previous_age, previous_resident = previous
+            return previous_age + (age - previous_age) * (
+                previous_resident - survival
+            ) / (previous_resident - resident)
+        previous = (age, resident)
+    return None
+
+
+def get_eviction_ages(ages, resident, quantiles=DEFAULT_EVICTED_QUANTILES):
+    """
+    Returns the eviction age of every quantile of the fitted survival curve
+    Example: {0.5: 1843.2, 0.9: 2210.0, 0.99: None}
+    """
+    curve = fit_survival_curve(ages, resident)
+    return {evicted: get_eviction_age(curve, evicted) for evicted in quantiles}
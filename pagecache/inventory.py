@@ -0,0 +1,189 @@
+import argparse
+import heapq
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cache
+
+logger = logging.getLogger(__name__)
+
+
+def walk_files(path):
+    """
+    Yields the paths of the regular files under path with os.scandir, symlinks are not
+    followed. Only the directories pending to be read are kept in memory
+    """
+    pending = [path]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry.path
+                    except OSError:
+                        continue
+        except OSError as error:
+            logger.warning("Can't list {}: {}".format(directory, error))
+
+
+def batch_paths(paths, batch_size):
+    batch = []
+    for path in paths:
+        batch.append(path)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class CacheInventory(object):
+    """
+    Resident pages of every file of a directory tree, keeping only the top files, and the
+    resident pages of every directory including its subdirectories.
+    Residency checks are done in batches by a thread pool, the C module releases the GIL
+    while probing. The batches in flight are bounded, so the walk never gets far ahead.
+    """
+
+    def __init__(self, path, top=20, workers=8, batch_size=256):
+        self.path = os.path.abspath(path)
+        self.top = top
+        self.workers = workers
+        self.batch_size = batch_size
+        self.files = 0
+        self.cached_pages = 0
+        self.total_pages = 0
+        # Min heap with the (cached pages, total pages, path) of the top files
+        self.top_files = []
+        # Cached pages of the files directly in every directory
+        self.directory_pages = {}
+
+    def _add_results(self, paths, results):
+        for path, result in zip(paths, results):
+            if result is None:
+                continue
+            cached, total = result
+            self.files += 1
+            self.cached_pages += cached
+            self.total_pages += total
+            if not cached:
+                continue
+            directory = os.path.dirname(path)
+            self.directory_pages[directory] = (
+                self.directory_pages.get(directory, 0) + cached
+            )
+            if len(self.top_files) < self.top:
+                heapq.heappush(self.top_files, (cached, total, path))
+            elif cached > self.top_files[0][0]:
+                heapq.heapreplace(self.top_files, (cached, total, path))
+
+    def scan(self, on_progress=None, progress_seconds=1):
+        """
+        Walks the tree probing every file, on_progress is called with the progress
+        every progress_seconds
+        """
+        started = time.monotonic()
+        next_progress = started + progress_seconds
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for batch in batch_paths(walk_files(self.path), self.batch_size):
+                in_flight.append((batch, executor.submit(cache.ratio_batch, batch)))
+                while len(in_flight) >= 2 * self.workers:
+                    batch, future = in_flight.popleft()
+                    self._add_results(batch, future.result())
+                if on_progress is not None and time.monotonic() >= next_progress:
+                    on_progress(self.get_progress(time.monotonic() - started))
+                    next_progress += progress_seconds
+            while in_flight:
+                batch, future = in_flight.popleft()
+                self._add_results(batch, future.result())
+        return self.get_progress(time.monotonic() - started)
+
+    def get_progress(self, elapsed):
+        return {
+            "files": self.files,
+            "cached_pages": self.cached_pages,
+            "total_pages": self.total_pages,
+            "files_per_second": round(self.files / elapsed) if elapsed else 0,
+        }
+
+    def get_top_files(self):
+        return [
+            {"path": path, "cached_pages": cached, "total_pages": total}
+            for cached, total, path in sorted(self.top_files, reverse=True)
+        ]
+
+    def get_top_directories(self):
+        """
+        Returns the top directories by cached pages, including their subdirectories
+        """
+        totals = dict(self.directory_pages)
+        # Directories without cached files of their own up to the root
+        for directory in self.directory_pages:
+            while directory != self.path:
+                directory = os.path.dirname(directory)
+                if directory in totals:
+                    break
+                totals[directory] = 0
+        # Deepest first, so every directory is complete before adding it to its parent
+        for directory in sorted(totals, key=lambda d: d.count(os.sep), reverse=True):
+            if directory == self.path:
+                continue
+            parent = os.path.dirname(directory)
+            totals[parent] = totals.get(parent, 0) + totals[directory]
+        top = heapq.nlargest(self.top, totals.items(), key=lambda item: item[1])
+        return [
+            {"path": directory, "cached_pages": cached} for directory, cached in top
+        ]
+
+
+def parseargs(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="pagecache inventory",
+        description="Lists the files and directories using more page cache",
+    )
+    parser.add_argument("path", type=str, help="Root of the directory tree to scan.")
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=20,
+        help="Sets how many files and directories are listed.",
+        required=False,
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Sets the threads checking the residency of the files.",
+        required=False,
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=256,
+        help="Sets how many files are checked by every call to the cache module.",
+        required=False,
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseargs(argv)
+    inventory = CacheInventory(args.path, args.top, args.workers, args.batch_size)
+    # Partial results are streamed to STDERR, the final result to STDOUT
+    progress = inventory.scan(
+        on_progress=lambda progress: print(progress, file=sys.stderr)
+    )
+    print(progress, file=sys.stderr)
+    for top_file in inventory.get_top_files():
+        print({"type": "file", **top_file})
+    for top_directory in inventory.get_top_directories():
+        print({"type": "directory", **top_directory})
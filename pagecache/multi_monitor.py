@@ -0,0 +1,103 @@
+import heapq
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
+from pagecache.clock import get_next_tick
+
+logger = logging.getLogger(__name__)
+
+
+class MultiDirectoryMonitor(object):
+    """
+    Runs the iterations of several PageCacheMonitor, one per probe directory, from a single
+    process with a shared scheduler.
+    The iterations are staggered over the interval, so the probe writes and syncs of the
+    different filesystems do not line up, and run in a shared thread pool. The C module
+    releases the GIL while probing, so directories are probed concurrently.
+    """
+
+    def __init__(
+        self,
+        monitors,
+        interval_seconds,
+        max_workers=None,
+        prometheus_port=None,
+        prometheus_address="0.0.0.0",
+    ):
+        self.monitors = monitors
+        self.interval_seconds = interval_seconds
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or min(len(monitors), 8),
+            thread_name_prefix="pagecache-monitor",
+        )
+        # Iteration of every monitor still running
+        self.running = [None] * len(monitors)
+
+        self.prometheus_exporter = None
+        if prometheus_port is not None:
+            # Imported only when enabled, http.server is slow to import
+            from pagecache.prometheus_exporter import PrometheusExporter
+
+            # A single exporter, every monitor updates the samples with its own labels
+            self.prometheus_exporter = PrometheusExporter(
+                prometheus_address, prometheus_port
+            )
+            self.prometheus_exporter.start()
+            for monitor in self.monitors:
+                monitor.prometheus_exporter = self.prometheus_exporter
+
+    def _get_schedule(self, start):
+        """
+        Returns a heap with the (next iteration time, monitor position) of every monitor,
+        spread evenly over the interval
+        """
+        offset = self.interval_seconds / len(self.monitors)
+        schedule = [
+            (start + position * offset, position)
+            for position in range(len(self.monitors))
+        ]
+        heapq.heapify(schedule)
+        return schedule
+
+    def run_once(self):
+        """
+        Single concurrent iteration of every monitor, returns their min cached times
+        """
+        futures = [self.executor.submit(monitor.run_once) for monitor in self.monitors]
+        return [future.result() for future in futures]
+
+    def run(self):
+        """
+        Main loop which will live until the process gets a Signal
+        """
+        schedule = self._get_schedule(time.monotonic())
+        while True:
+            next_tick, position = heapq.heappop(schedule)
+            sleep(max(0, next_tick - time.monotonic()))
+            running = self.running[position]
+            if running is not None and not running.done():
+                logger.warning(
+                    "Skipping iteration of {}, the previous one is still running".format(
+                        self.monitors[position].tmp_directory
+                    )
+                )
+            else:
+                if running is not None:
+                    # Raises the exception of the previous iteration, if any
+                    running.result()
+                self.running[position] = self.executor.submit(
+                    self.monitors[position].run_once
+                )
+            heapq.heappush(
+                schedule,
+                (
+                    get_next_tick(
+                        next_tick,
+                        self.monitors[position].current_interval_seconds,
+                        time.monotonic(),
+                    ),
+                    position,
+                ),
+            )
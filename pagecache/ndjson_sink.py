@@ -0,0 +1,131 @@
+import atexit
+import json
+import logging
+import os
+import socket
+import stat
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+UNIX_SCHEME = "unix://"
+
+
+class NDJSONSink(object):
+    """
+    Streams the metrics as newline delimited JSON records to STDOUT ("-"), a file or a
+    Unix socket ("unix:///path/to/socket").
+    Records are appended to a bounded buffer which is written every flush_every_ticks
+    records without blocking: what the reader does not take stays in the buffer, and
+    new records are dropped and counted while the buffer is full, so a slow reader never
+    stalls the monitor. Several monitors can share one sink.
+    O_NONBLOCK belongs to the open file description, which STDOUT shares with the parent
+    process and its siblings, so it is never set on it: a pipe is reopened through
+    /proc/self/fd with a description of its own and a socket is written with MSG_DONTWAIT.
+    """
+
+    def __init__(self, target="-", max_buffer_bytes=1048576, flush_every_ticks=1):
+        self.target = target
+        self.max_buffer_bytes = max_buffer_bytes
+        self.flush_every_ticks = flush_every_ticks
+        self.buffer = bytearray()
+        self.pending_records = 0
+        self.dropped_records = 0
+        self.lock = threading.Lock()
+        self.fd = None
+        self.socket = None
+        # Records still buffered are written when the process exits
+        atexit.register(self.flush)
+        if target == "-":
+            self._open_stdout()
+        elif not target.startswith(UNIX_SCHEME):
+            self.fd = os.open(
+                target, os.O_WRONLY | os.O_CREAT | os.O_APPEND | os.O_CLOEXEC, 0o644
+            )
+
+    def _open_stdout(self):
+        stdout = sys.stdout.fileno()
+        mode = os.fstat(stdout).st_mode
+        if stat.S_ISFIFO(mode):
+            try:
+                self.fd = os.open(
+                    "/proc/self/fd/{}".format(stdout),
+                    os.O_WRONLY | os.O_NONBLOCK | os.O_CLOEXEC,
+                )
+                return
+            except OSError as error:
+                logger.warning(
+                    "Can't reopen STDOUT non-blocking, writing blocking: {}".format(
+                        error
+                    )
+                )
+        elif stat.S_ISSOCK(mode):
+            self.socket = socket.socket(fileno=os.dup(stdout))
+            return
+        # Terminals and regular files, writes do not wait for a reader
+        self.fd = os.dup(stdout)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.target.replace(UNIX_SCHEME, "", 1))
+        except OSError:
+            sock.close()
+            raise
+        sock.setblocking(False)
+        self.socket = sock
+
+    def write(self, record):
+        """
+        Adds a record (a dict) to the buffer, flushing it every flush_every_ticks records
+        """
+        line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+        with self.lock:
+            if len(self.buffer) + len(line) > self.max_buffer_bytes:
+                self.dropped_records += 1
+            else:
+                self.buffer += line
+            self.pending_records += 1
+            if self.pending_records >= self.flush_every_ticks:
+                self._flush()
+
+    def _write_buffer(self):
+        if self.fd is not None:
+            return os.write(self.fd, self.buffer)
+        if self.socket is None:
+            self._connect()
+        # Per call, the socket may be STDOUT shared with other processes
+        return self.socket.send(self.buffer, socket.MSG_DONTWAIT)
+
+    def _flush(self):
+        self.pending_records = 0
+        while self.buffer:
+            try:
+                written = self._write_buffer()
+            except (BlockingIOError, InterruptedError):
+                # The reader is not keeping up, the rest is written on the next flush
+                return
+            except OSError as error:
+                # The reader went away, the buffered records are lost
+                logger.debug("Can't write NDJSON records: {}".format(error))
+                self.dropped_records += self.buffer.count(b"\n")
+                self.buffer.clear()
+                if self.socket is not None and self.target != "-":
+                    # Reconnected on the next write
+                    self.socket.close()
+                    self.socket = None
+                return
+            del self.buffer[:written]
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        self.flush()
+        atexit.unregister(self.flush)
+        if self.fd is not None:
+            os.close(self.fd)
+        if self.socket is not None:
+            self.socket.close()
@@ -1,17 +1,50 @@
 #!/usr/bin/env python3
 
 import logging
+import math
 import os
+import sys
 import time
 from time import sleep
 
-from datadog import initialize, statsd
-
 import cache
+from pagecache.clock import ProbeClock, get_next_tick
+from pagecache.dogstatsd_sink import DogStatsDSink
+from pagecache.eviction_curve import get_eviction_ages
 from pagecache.exceptions import TmpDirDoesNotExist
+from pagecache.ndjson_sink import NDJSONSink
+from pagecache.probe_index import ProbeIndex, count_newer_probes
+from pagecache.probe_state import ProbeStateCheckpoint
+from pagecache.probe_writer import write_probe_file
+from pagecache.proc_estimator import ProcEstimator
+from pagecache.profiling import TickProfiler
+from pagecache.ring_probe_store import RingProbeStore
+from pagecache.ttl_stats import TTLStatsStore
 
 logger = logging.getLogger(__name__)
 
+NANOSECONDS = 1000000000
+# Probe names are timestamps in nanoseconds, or in seconds for the legacy ones, from
+# 2001-09-09 until the largest int64 nanosecond timestamp (2262-04-11)
+MIN_PROBE_SECONDS = 10**9
+MAX_PROBE_SECONDS = 2**63 // NANOSECONDS
+
+
+def parse_probe_name(name):
+    """
+    Returns the timestamp in nanoseconds of a probe file name, or None if the name is not
+    a plausible probe timestamp
+    Example: "1693739406" -> 1693739406000000000, "1693739406000000000" -> 1693739406000000000
+    """
+    if not name.isdigit():
+        return None
+    probe = int(name)
+    if MIN_PROBE_SECONDS <= probe < MAX_PROBE_SECONDS:
+        return probe * NANOSECONDS
+    if MIN_PROBE_SECONDS * NANOSECONDS <= probe < MAX_PROBE_SECONDS * NANOSECONDS:
+        return probe
+    return None
+
 
 class PageCacheMonitor(object):
     def __init__(
@@ -21,35 +54,194 @@ class PageCacheMonitor(object):
         max_time_window_seconds,
         logfile,
         send_metrics_to_dogstatsd=False,
+        probe_store="files",
+        search_mode="linear",
+        boundary_check_probes=3,
+        write_strategy="fsync",
+        prometheus_port=None,
+        prometheus_address="0.0.0.0",
+        profile=False,
+        profile_every_ticks=60,
+        checkpoint_every_ticks=0,
+        active_probes=False,
+        promote_probes=False,
+        tags=None,
+        stats_windows=(),
+        adaptive_error=None,
+        max_interval_seconds=60,
+        proc_estimator=False,
+        proc_root="/proc",
+        dogstatsd_address="127.0.0.1:8125",
+        ndjson_output=None,
+        ndjson_flush_every_ticks=1,
+        ndjson_buffer_bytes=1048576,
+        eviction_curve=False,
     ):
         self.interval_seconds = interval_seconds
+        # Interval until the next iteration, it only changes in adaptive mode
+        self.current_interval_seconds = interval_seconds
+        self.max_interval_seconds = max_interval_seconds
         self.max_time_window_seconds = max_time_window_seconds
+        self.max_time_window_ns = int(max_time_window_seconds * NANOSECONDS)
+        # Probe ids and ages, wall clock based but immune to clock steps
+        self.clock = ProbeClock()
         self.tmp_directory = tmp_directory
         self.send_metrics_to_dogstatsd = send_metrics_to_dogstatsd
+        self.probe_store = probe_store
+        self.search_mode = search_mode
+        self.boundary_check_probes = boundary_check_probes
+        self.write_strategy = write_strategy
+        self.profile_every_ticks = profile_every_ticks
+        self.checkpoint_every_ticks = checkpoint_every_ticks
+        self.promote_probes = promote_probes
+        # Tags of every reported metric, e.g. {"tmp_dir": "/data1/pagecache"}
+        self.tags = tags
+        # Estimation of the inactive list turnover from the kernel counters
+        self.proc_estimator = None
+        if proc_estimator:
+            self.proc_estimator = ProcEstimator(proc_root)
+        # Fits the residency by age of all the live probes, evicted probes are kept
+        # until they expire as they are the tail of the curve
+        self.eviction_curve = eviction_curve
+        if self.eviction_curve and probe_store == "ring":
+            logger.warning(
+                "The eviction curve is not supported by the ring probe store, disabling it"
+            )
+            self.eviction_curve = False
+        # Residency of every live probe of the last linear search
+        self.probe_statuses = None
+        # Relative error of the min cached time in adaptive mode, None disables it
+        self.adaptive_error = adaptive_error
+        if self.adaptive_error is not None and probe_store == "ring":
+            logger.warning(
+                "Adaptive mode is not supported by the ring probe store, using a fixed interval"
+            )
+            self.adaptive_error = None
+        # Rolling statistics of the min cached time, e.g. windows (60, 300, 3600)
+        self.ttl_stats = None
+        if stats_windows:
+            self.ttl_stats = TTLStatsStore(stats_windows, interval_seconds)
+        self.profiler = TickProfiler(profile, profile_every_ticks)
 
         if not os.path.isdir(self.tmp_directory):
             logger.error("Tmp directory does not exist!")
             raise TmpDirDoesNotExist()
 
+        # Additional metrics of the last iteration reported alongside min_cached_time
+        self.tick_metrics = {}
+        # Eviction boundary of the last iteration, timestamps in nanoseconds
+        self.last_tick_time = None
+        self.oldest_cached_probe = None
+        self.first_evicted_probe = None
+        logger.info("Page cache residency backend: {}".format(cache.backend()))
+
+        self.ring_probe_store = None
+        self.probe_index = ProbeIndex()
+        self.probe_index_drift = False
+        self.probe_state = None
+        self.ticks_since_checkpoint = 0
+        # Time when the directory is reconciled after resuming from a checkpoint
+        self.deferred_reconcile_time = None
+        if self.probe_store == "ring":
+            # One slot per sample within the time window plus the one being written
+            slots = math.ceil(self.max_time_window_seconds / self.interval_seconds) + 1
+            self.ring_probe_store = RingProbeStore(
+                self.tmp_directory, slots, self.write_strategy
+            )
+        else:
+            if self.checkpoint_every_ticks > 0:
+                self.probe_state = ProbeStateCheckpoint(self.tmp_directory)
+            if not self._load_probe_state():
+                self._reconcile_probe_index()
+
+        # Promoted probes tracked in their own subdirectory with their own boundary,
+        # bisected so they add O(log n) probes per iteration
+        self.active_monitor = None
+        if active_probes:
+            active_directory = os.path.join(self.tmp_directory, "active")
+            os.makedirs(active_directory, exist_ok=True)
+            self.active_monitor = PageCacheMonitor(
+                active_directory,
+                self.interval_seconds,
+                self.max_time_window_seconds,
+                logfile,
+                search_mode="bisect",
+                boundary_check_probes=self.boundary_check_probes,
+                write_strategy=self.write_strategy,
+                checkpoint_every_ticks=self.checkpoint_every_ticks,
+                promote_probes=True,
+                adaptive_error=self.adaptive_error,
+            )
+            # Its phases and counters are added to the ones of this monitor
+            self.active_monitor.profiler = self.profiler
+
+        self.prometheus_exporter = None
+        if prometheus_port is not None:
+            # Imported only when enabled, http.server is slow to import
+            from pagecache.prometheus_exporter import PrometheusExporter
+
+            self.prometheus_exporter = PrometheusExporter(
+                prometheus_address, prometheus_port
+            )
+            self.prometheus_exporter.start()
+
+        # Real files tracked every iteration besides the probes, reported through the
+        # same sinks
+        self.target_tracker = None
+
+        # Records written as newline delimited JSON instead of printing the metrics
+        self.ndjson_sink = None
+        if ndjson_output is not None:
+            self.ndjson_sink = NDJSONSink(
+                ndjson_output, ndjson_buffer_bytes, ndjson_flush_every_ticks
+            )
+
         if send_metrics_to_dogstatsd:
-            self.dogstatsd_options = {"statsd_host": "127.0.0.1", "statsd_port": 8125}
-            initialize(**self.dogstatsd_options)
             self.dogstatsd_metric_name = "pagecache_ttl.min_cached_time_seconds"
-            self.statsd = statsd
+            self.dogstatsd_tags = None
+            if tags:
+                self.dogstatsd_tags = [
+                    "{}:{}".format(key, value) for key, value in tags.items()
+                ]
+            # Buffered and non-blocking, all the metrics of an iteration are sent at once
+            self.statsd = DogStatsDSink(dogstatsd_address)
+
+    def _get_new_probe_id(self):
+        """
+        Returns the current timestamp in nanoseconds, always greater than the newest probe
+        so two probes created within the same clock tick never collide, nor a probe created
+        before a restart with the wall clock stepped back
+        """
+        probe_id = self.clock.time_ns()  # Current TimeStamp
+        newest_probe = self.probe_index.newest()
+        if newest_probe is not None and probe_id <= newest_probe:
+            probe_id = newest_probe + 1
+        return probe_id
 
     def _create_new_file(self):
         """
         Create a new file with dummy content, the content
         will satisfy only one page, so it's smaller than page_size 4k
-        Filename is the current timestamp to avoid extra system calls to stat the files
+        Filename is the current timestamp in nanoseconds to avoid extra system calls to stat the files
         """
 
-        filename = str(int(time.time()))  # Current TimeStamp
-        fd = open("{}/{}".format(self.tmp_directory, filename), "w")
-        fd.write(filename)  # dummy write
-        # Force write to disk https://docs.python.org/3/library/os.html#os.fsync
-        fd.flush()
-        os.fsync(fd)
+        filename = str(self._get_new_probe_id())
+        # Dummy write, synced to disk according to the write strategy
+        write_probe_file(
+            "{}/{}".format(self.tmp_directory, filename),
+            filename.encode(),
+            self.write_strategy,
+            self.promote_probes,
+        )
+        # open, pwrite, close and the sync
+        self.profiler.count(
+            "syscalls_estimated", 3 if self.write_strategy == "none" else 4
+        )
+        if self.promote_probes:
+            # Two preads
+            self.profiler.count("syscalls_estimated", 2)
+        self.profiler.count("files_created")
+        self.probe_index.append(int(filename))
         logger.debug("Created file {}".format(filename))
 
     def _delete_files(self, existing_files, index_to_start_deletion):
@@ -66,8 +258,90 @@ class PageCacheMonitor(object):
             )
         )
         for file_to_delete in existing_files[index_to_start_deletion:]:
-            os.remove("{}/{}".format(self.tmp_directory, file_to_delete))
+            try:
+                os.remove("{}/{}".format(self.tmp_directory, file_to_delete))
+            except FileNotFoundError:
+                # Somebody else removed it, the index does not match the directory anymore
+                logger.warning(
+                    "File {} to delete does not exist, the probe index will be reconciled".format(
+                        file_to_delete
+                    )
+                )
+                self.probe_index_drift = True
+                continue
+            finally:
+                self.profiler.count("syscalls_estimated")
+            self.profiler.count("files_deleted")
             logger.debug("Deleted file {}".format(file_to_delete))
+        self.probe_index.trim(index_to_start_deletion)
+
+    def _get_eviction_curve_metrics(self, existing_files, now):
+        """
+        Returns the ages (in seconds) when 50%, 90% and 99% of the probes are evicted,
+        fitted from the residency of all the live probes. The linear search already
+        probed all of them, otherwise they are probed in a single call
+        """
+        page_cache_statuses = self.probe_statuses
+        if page_cache_statuses is None:
+            page_cache_statuses = self._probe_files(existing_files)
+        # Sorted from the youngest to the oldest
+        ages = [(now - probe) / NANOSECONDS for probe in existing_files]
+        resident = [
+            1 if status is not None and status[0] > 0 else 0
+            for status in page_cache_statuses
+        ]
+        metrics = {}
+        for evicted, age in get_eviction_ages(ages, resident).items():
+            if age is not None:
+                metrics["evicted_{:g}_age_seconds".format(evicted * 100)] = age
+        return metrics
+
+    def _get_probes_to_thin(self, existing_files, now):
+        """
+        Returns the probes which can be deleted keeping the gap between every pair of
+        consecutive probes smaller than adaptive_error times the age of the older one.
+        The newest and the oldest probes are always kept.
+        Example with adaptive_error 0.5, ages in seconds:
+            ages = [1, 2, 3, 4, 8, 10]
+            thinned ages = [3], as the gap 2-4 is not bigger than 0.5 * 4
+        """
+        probes_to_thin = []
+        newer_probe = existing_files[0] if len(existing_files) else None
+        for idx in range(1, len(existing_files) - 1):
+            older_probe = existing_files[idx + 1]
+            if newer_probe - older_probe <= self.adaptive_error * (now - older_probe):
+                probes_to_thin.append(existing_files[idx])
+            else:
+                newer_probe = existing_files[idx]
+        return probes_to_thin
+
+    def _thin_probes(self, existing_files, now):
+        """
+        Deletes the probes not needed to measure the min cached time within adaptive_error,
+        keeping the number of live probes bounded
+        """
+        probes_to_thin = self._get_probes_to_thin(existing_files, now)
+        for probe in probes_to_thin:
+            try:
+                os.remove("{}/{}".format(self.tmp_directory, probe))
+            except FileNotFoundError:
+                self.probe_index_drift = True
+            self.profiler.count("syscalls_estimated")
+        if probes_to_thin:
+            self.probe_index.remove(probes_to_thin)
+            self.profiler.count("files_deleted", len(probes_to_thin))
+            logger.debug("Thinned probes {}".format(probes_to_thin))
+
+    def _update_interval(self, min_cached_time):
+        """
+        Adapts the interval to the measured min cached time, the sampling near the eviction
+        boundary is adaptive_error relative to it
+        """
+        self.current_interval_seconds = min(
+            max(self.adaptive_error * min_cached_time, self.interval_seconds),
+            self.max_interval_seconds,
+        )
+        self.tick_metrics["interval_seconds"] = self.current_interval_seconds
 
     def _get_first_expired_file(self, existing_files, now):
         """
@@ -75,55 +349,195 @@ class PageCacheMonitor(object):
         with the index and the filename
         If there is not any expired file in the list we return -1
         """
-        # Find the first file in the list older than self.max_time_window_seconds
-        for idx, file in enumerate(existing_files):
-            if int(file) < now - self.max_time_window_seconds:
-                logger.debug(
-                    "First expired file in list: {}, list index location: {}".format(
-                        file, idx
-                    )
+        # The list is sorted from newest to oldest, bisect the first file older than self.max_time_window_seconds
+        expiration = now - self.max_time_window_ns
+        low, high = 0, len(existing_files)
+        while low < high:
+            middle = (low + high) // 2
+            if int(existing_files[middle]) < expiration:
+                high = middle
+            else:
+                low = middle + 1
+        if low < len(existing_files):
+            logger.debug(
+                "First expired file in list: {}, list index location: {}".format(
+                    existing_files[low], low
                 )
-                return (idx, file)
+            )
+            return (low, existing_files[low])
         # All files are within self.max_time_window_seconds or there are not files, return a negative index
         logger.debug(
             "Can't get first expired file ocurrence in the list, either all files are within the max_time_window_seconds or empty list"
         )
         return (-1, None)
 
+    def _probe_files(self, files):
+        """
+        Returns the (cached, total) pages of every file, None for the ones which could not be probed.
+        A probe which can't be probed was removed by somebody else, the index has drifted
+        """
+        # open, fstat, close plus cachestat or mmap, mincore and munmap per file
+        syscalls_per_file = 4 if cache.backend() == "cachestat" else 6
+        self.profiler.count("probes", len(files))
+        self.profiler.count("syscalls_estimated", len(files) * syscalls_per_file)
+        page_cache_statuses = cache.ratio_batch(
+            ["{}/{}".format(self.tmp_directory, file) for file in files]
+        )
+        if None in page_cache_statuses:
+            self.probe_index_drift = True
+        return page_cache_statuses
+
+    def _is_file_cached(self, file):
+        page_cache_status = self._probe_files([file])[0]
+        return page_cache_status is not None and page_cache_status[0] > 0
+
+    def _get_first_not_cached_file_bisect(self, existing_files):
+        """
+        Probes are created in time order and leave the inactive list roughly in time order,
+        so the first not cached file is bisected with O(log n) probes.
+        Then the boundary_check_probes files right before it are probed as well, in case
+        some of them were evicted out of order.
+        Returns the same touple as _get_first_not_cached_file
+        """
+        low, high = 0, len(existing_files)
+        while low < high:
+            middle = (low + high) // 2
+            if self._is_file_cached(existing_files[middle]):
+                low = middle + 1
+            else:
+                high = middle
+
+        # Bounded linear check, all the files before the boundary are probed in a single call
+        check_start = max(0, low - self.boundary_check_probes)
+        page_cache_statuses = self._probe_files(existing_files[check_start:low])
+        for idx, page_cache_status in enumerate(page_cache_statuses, check_start):
+            if page_cache_status is None or page_cache_status[0] == 0:
+                logger.debug(
+                    "Found out of order not cached file {} before the bisected boundary {}".format(
+                        existing_files[idx], low
+                    )
+                )
+                low = idx
+                break
+
+        if low < len(existing_files):
+            logger.debug(
+                "First not cached file in list: {}, list index location: {}".format(
+                    existing_files[low], low
+                )
+            )
+            return (low, int(existing_files[low]))
+        logger.debug(
+            "Can't get first not cached file ocurrence in the list, either all files are cached or empty list"
+        )
+        return (-1, None)
+
     def _get_first_not_cached_file(self, existing_files):
         """
         Searches for the first ocurrence of a non-cached file in the existing_files and returns a touple
         with the index and the filename
         If all the existing files are cached in the list then we return -1
         """
-        for idx, file in enumerate(existing_files):
-            with open("{}/{}".format(self.tmp_directory, file), "r") as fd:
-                page_cache_status = cache.ratio(fd.fileno())
-                if (
-                    page_cache_status[0] == 0
-                ):  # First not cached file in the list, so the previous one was the last cached
-                    logger.debug(
-                        "First not cached file in list: {}, list index location: {}".format(
-                            file, idx
-                        )
+        if self.search_mode == "bisect":
+            return self._get_first_not_cached_file_bisect(existing_files)
+
+        # Probe every file in a single call, the C module releases the GIL meanwhile
+        page_cache_statuses = self._probe_files(existing_files)
+        self.probe_statuses = page_cache_statuses
+        for idx, page_cache_status in enumerate(page_cache_statuses):
+            if (
+                page_cache_status is None or page_cache_status[0] == 0
+            ):  # First not cached file in the list, so the previous one was the last cached
+                logger.debug(
+                    "First not cached file in list: {}, list index location: {}".format(
+                        existing_files[idx], idx
                     )
-                    return (idx, int(file))
+                )
+                return (idx, int(existing_files[idx]))
         # All files are cached or there are not files, return a negative index
         logger.debug(
             "Can't get first not cached file ocurrence in the list, either all files are cached or empty list"
         )
         return (-1, None)
 
+    def _reconcile_probe_index(self):
+        """
+        Rebuilds the probe index from the files in the tmp directory,
+        only done at startup or when the index does not match the directory.
+        Only regular files named after a plausible timestamp are adopted as probes
+        """
+        probes = []
+        self.profiler.count("syscalls_estimated")
+        with os.scandir(self.tmp_directory) as entries:
+            for entry in entries:
+                probe = parse_probe_name(entry.name)
+                if probe is None or not entry.is_file(follow_symlinks=False):
+                    continue
+                if probe != int(entry.name):
+                    # Legacy name in seconds, renamed to nanoseconds keeping the same
+                    # inode, so it keeps its cached page
+                    os.rename(entry.path, "{}/{}".format(self.tmp_directory, probe))
+                probes.append(probe)
+        self.probe_index.reset(probes)
+        self.probe_index_drift = False
+        logger.debug("Reconciled probe index: {}".format(self.probe_index))
+
+    def _load_probe_state(self):
+        """
+        Resumes the probe index and the last eviction boundary from the checkpoint.
+        Probes created after the last checkpoint are not indexed, so the directory is
+        reconciled once every checkpointed probe is expired.
+        Returns False if there is not a valid checkpoint
+        """
+        if self.probe_state is None:
+            return False
+        boundary = self.probe_state.load(self.probe_index)
+        if boundary is None:
+            return False
+        (
+            self.last_tick_time,
+            self.oldest_cached_probe,
+            self.first_evicted_probe,
+        ) = boundary
+        self.deferred_reconcile_time = self.clock.time_ns() + self.max_time_window_ns
+        logger.info(
+            "Resumed {} probes from the checkpoint {}".format(
+                len(self.probe_index), self.probe_state.path
+            )
+        )
+        return True
+
+    def _checkpoint_probe_state(self):
+        """
+        Persists the probe index and the eviction boundary every checkpoint_every_ticks iterations
+        """
+        if self.probe_state is None:
+            return
+        self.ticks_since_checkpoint += 1
+        if self.ticks_since_checkpoint < self.checkpoint_every_ticks:
+            return
+        self.ticks_since_checkpoint = 0
+        self.probe_state.save(
+            self.probe_index,
+            self.last_tick_time,
+            self.oldest_cached_probe,
+            self.first_evicted_probe,
+        )
+        # open, write, fsync, close and rename, then open, fsync and close of the directory
+        self.profiler.count("syscalls_estimated", 8)
+
     def _get_existing_files(self):
         """
-        Returns a list of filenames sorted and reverse
+        Returns the probe index, sorted from newest to oldest
         Example : [1693739406, 1693739405, 1693739404]
         """
-        existing_files = [int(file) for file in os.listdir(self.tmp_directory)]
-        existing_files.sort()
-        existing_files.reverse()
-        logger.debug("Sorted existing files: {}".format(existing_files))
-        return existing_files
+        if self.deferred_reconcile_time is not None:
+            if self.clock.time_ns() >= self.deferred_reconcile_time:
+                self.deferred_reconcile_time = None
+                self.probe_index_drift = True
+        if self.probe_index_drift:
+            self._reconcile_probe_index()
+        return self.probe_index
 
     def _balance_files(self, idx_to_start_deletion, existing_files):
         """
@@ -187,40 +601,235 @@ class PageCacheMonitor(object):
 
     def _deliver_metrics_to_dogstatsd(self, min_cached_time):
         """
-        Sends metrics to DogStatsD (localhost)
+        Sends metrics to DogStatsD, coalesced in as few datagrams as possible
         """
-        self.statsd.gauge(self.dogstatsd_metric_name, min_cached_time)
-        logger.debug(
-            "Delivered metric to DogStatsD: {}:{}".format(
-                self.dogstatsd_metric_name, min_cached_time
+        self.statsd.gauge(
+            self.dogstatsd_metric_name, min_cached_time, tags=self.dogstatsd_tags
+        )
+        for name, value in self.tick_metrics.items():
+            self.statsd.gauge(
+                "pagecache_ttl.{}".format(name), value, tags=self.dogstatsd_tags
             )
+        self.statsd.gauge(
+            "pagecache_ttl.dogstatsd_dropped_packets",
+            self.statsd.dropped_packets,
+            tags=self.dogstatsd_tags,
         )
+        # Including the gauges queued by the target files tracker
+        queued = len(self.statsd.lines)
+        sent = self.statsd.flush()
+        logger.debug(
+            "Delivered {} metrics to DogStatsD in {} datagrams".format(queued, sent)
+        )
+
+    def _get_live_probes(self):
+        """
+        Returns the timestamps of the probes still cached, sorted from newest to oldest
+        """
+        if self.ring_probe_store is not None:
+            return self.ring_probe_store.live_probes()
+        if self.eviction_curve and self.first_evicted_probe is not None:
+            # The evicted probes are kept in the index until they expire
+            cached_probes = count_newer_probes(
+                self.probe_index, self.oldest_cached_probe
+            )
+            return self.probe_index[:cached_probes]
+        return self.probe_index
+
+    def get_metrics(self, min_cached_time):
+        """
+        Returns the tags, the min cached time and the additional metrics of the last iteration
+        Example: {"tmp_dir": "/data1/pagecache", "min_cached_time": 1843.2, "tick_probes": 12}
+        """
+        metrics = dict(self.tags or {})
+        metrics["min_cached_time"] = min_cached_time
+        metrics.update(self.tick_metrics)
+        return metrics
+
+    def get_record(self, min_cached_time):
+        """
+        Returns get_metrics() with the time of the iteration and the eviction boundary,
+        timestamps in seconds
+        """
+        record = {"timestamp": self.last_tick_time / NANOSECONDS}
+        record.update(self.get_metrics(min_cached_time))
+        record["live_probes"] = len(self._get_live_probes())
+        for name, timestamp in (
+            ("oldest_cached_probe", self.oldest_cached_probe),
+            ("first_evicted_probe", self.first_evicted_probe),
+        ):
+            record[name] = timestamp / NANOSECONDS if timestamp is not None else None
+        return record
 
     def _report_metric(self, min_cached_time):
+        if self.prometheus_exporter is not None:
+            self.prometheus_exporter.update(
+                min_cached_time,
+                self.last_tick_time,
+                self._get_live_probes(),
+                self.oldest_cached_probe,
+                self.first_evicted_probe,
+                self.tick_metrics,
+                labels=self.tags,
+            )
+        # Every configured sink gets the metrics, they are printed when there are none
         if self.send_metrics_to_dogstatsd:
             self._deliver_metrics_to_dogstatsd(min_cached_time)
-        else:
-            print({"min_cached_time": min_cached_time})
+        if self.ndjson_sink is not None:
+            self.ndjson_sink.write(self.get_record(min_cached_time))
+        if not self.send_metrics_to_dogstatsd and self.ndjson_sink is None:
+            print(self.get_metrics(min_cached_time))
         logger.info(
             "Current min time page is cached: {} seconds".format(min_cached_time)
         )
 
-    def run(self):
+    def _tick_ring(self):
         """
-        Main loop which will live until the process gets a Signal
+        One iteration using the ring probe store, all the samples live in a single file
         """
-        while True:
+        now = self.clock.time_ns()  # Current TimeStamp
+        with self.profiler.phase("create_probe"):
+            self.ring_probe_store.add_probe(now)
+        # fadvise and pwrite of the page, pwrite of the slot timestamp plus the sync, two
+        # ranges with sync_file_range
+        self.profiler.count(
+            "syscalls_estimated",
+            {"none": 3, "sync_file_range": 5}.get(self.write_strategy, 4),
+        )
+        with self.profiler.phase("search_boundary"):
+            oldest_cached_probe = self.ring_probe_store.get_oldest_cached_probe(
+                now, self.max_time_window_ns
+            )
+        # A single fstat, mmap, mincore and munmap for all the probes, plus the header pwrite
+        self.profiler.count("probes", self.ring_probe_store.slots)
+        self.profiler.count("syscalls_estimated", 5)
+        self.last_tick_time = now
+        self.oldest_cached_probe = oldest_cached_probe
+        self.first_evicted_probe = self.ring_probe_store.first_released_probe
+        page_stats = self.ring_probe_store.get_page_stats()
+        if page_stats is not None:
+            self.profiler.count("syscalls_estimated", 2)
+            self.tick_metrics["probe_dirty_pages"] = page_stats["dirty"]
+            self.tick_metrics["probe_recently_evicted_pages"] = page_stats[
+                "recently_evicted"
+            ]
+        if oldest_cached_probe is None:
+            return 0.0
+        return (now - oldest_cached_probe) / NANOSECONDS
+
+    def _tick_files(self):
+        """
+        One iteration using one probe file per sample
+        """
+        with self.profiler.phase("create_probe"):
             self._create_new_file()
+        with self.profiler.phase("list_probes"):
             existing_files = self._get_existing_files()
-            now = int(time.time())  # Current TimeStamp
+        now = self.clock.time_ns()  # Current TimeStamp
 
+        self.probe_statuses = None
+        with self.profiler.phase("search_boundary"):
             index_to_start_deletion = self._get_index_to_start_deletion(
                 existing_files, now
             )
-            if index_to_start_deletion >= 0:
+            if self.probe_index_drift:
+                # A missing probe (e.g. listed by a stale checkpoint) is not an eviction,
+                # the index is reconciled with the directory and searched again
+                existing_files = self._get_existing_files()
+                self.probe_statuses = None
+                index_to_start_deletion = self._get_index_to_start_deletion(
+                    existing_files, now
+                )
+        self.last_tick_time = now
+        boundary_index = index_to_start_deletion
+        if self.eviction_curve:
+            with self.profiler.phase("eviction_curve"):
+                self.tick_metrics.update(
+                    self._get_eviction_curve_metrics(existing_files, now)
+                )
+            # Only the expired probes are deleted
+            index_to_start_deletion = self._get_first_expired_file(existing_files, now)[
+                0
+            ]
+        if boundary_index >= 0:
+            # Read before deleting, existing_files is the live probe index
+            self.oldest_cached_probe = existing_files[boundary_index - 1]
+            self.first_evicted_probe = existing_files[boundary_index]
+        else:
+            self.oldest_cached_probe = existing_files[-1]
+            self.first_evicted_probe = None
+        if index_to_start_deletion >= 0:
+            with self.profiler.phase("delete_probes"):
                 self._delete_files(existing_files, index_to_start_deletion)
-                min_cached_time = now - existing_files[index_to_start_deletion - 1]
-            else:
-                min_cached_time = now - existing_files[-1]
+        if self.adaptive_error is not None:
+            with self.profiler.phase("thin_probes"):
+                self._thin_probes(existing_files, now)
+            self._update_interval((now - self.oldest_cached_probe) / NANOSECONDS)
+        with self.profiler.phase("checkpoint"):
+            self._checkpoint_probe_state()
+        min_cached_time = now - self.oldest_cached_probe
+        return min_cached_time / NANOSECONDS
+
+    def _tick(self):
+        """
+        Creates a new probe, releases the expired or evicted ones and returns the min cached time
+        """
+        if self.ring_probe_store is not None:
+            min_cached_time = self._tick_ring()
+        else:
+            min_cached_time = self._tick_files()
+        if self.active_monitor is not None:
+            self.tick_metrics[
+                "active_min_cached_time"
+            ] = self.active_monitor._tick_files()
+        if self.proc_estimator is not None:
+            self.tick_metrics.update(self.proc_estimator.sample(self.last_tick_time))
+        if self.ttl_stats is not None:
+            self.ttl_stats.add(self.last_tick_time, min_cached_time)
+            self.tick_metrics.update(self.ttl_stats.get_metrics("min_cached_time"))
+        self.tick_metrics.update(self.profiler.end_tick())
+        # Rolling p50/p99 over the window, so every sink gets them and not only STDERR
+        self.tick_metrics.update(self.profiler.summary_metrics())
+        return min_cached_time
+
+    def _dump_profile(self):
+        """
+        Prints the per-phase breakdown of the last profile_every_ticks iterations to STDERR
+        """
+        breakdown = self.profiler.format_breakdown()
+        if self.tags:
+            breakdown = "{}\n{}".format(self.tags, breakdown)
+        print(breakdown, file=sys.stderr)
+        logger.info("Per-phase breakdown:\n{}".format(breakdown))
+
+    def run_once(self, report=True):
+        """
+        Single iteration against the existing probes, reports (unless report is False)
+        and returns the min cached time
+        """
+        min_cached_time = self._tick()
+        if self.target_tracker is not None:
+            target_reports = self.target_tracker.update()
+            if report:
+                # Its DogStatsD gauges are queued and flushed with the monitor ones
+                self.target_tracker.report(target_reports, flush=False)
+        if report:
             self._report_metric(min_cached_time)
-            sleep(self.interval_seconds)
+        if self.profiler.enabled:
+            if self.profiler.ticks % self.profile_every_ticks == 0:
+                self._dump_profile()
+        return min_cached_time
+
+    def run(self):
+        """
+        Main loop which will live until the process gets a Signal
+        """
+        # Ticks are scheduled on a monotonic clock, so the time spent probing does not
+        # drift the interval when it is sub-second
+        next_tick = time.monotonic()
+        while True:
+            self.run_once()
+            next_tick = get_next_tick(
+                next_tick, self.current_interval_seconds, time.monotonic()
+            )
+            sleep(max(0, next_tick - time.monotonic()))
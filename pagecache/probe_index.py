@@ -0,0 +1,103 @@
+from array import array
+
+
+def count_newer_probes(probes, cutoff):
+    """
+    Returns how many probes of the list sorted from newest to oldest are newer or equal to cutoff
+    """
+    low, high = 0, len(probes)
+    while low < high:
+        middle = (low + high) // 2
+        if probes[middle] < cutoff:
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+class ProbeIndex(object):
+    """
+    In-memory ordered index of the live probe files, so the tmp directory is not listed
+    and sorted every iteration.
+    Probes are stored oldest first in an array, new probes are appended at the end and the
+    oldest ones are trimmed by moving the start offset, compacting the array only when
+    half of it is unused.
+    It is read as a sequence sorted from newest to oldest, like the lists of existing files:
+        index = [1693739406, 1693739405, 1693739404]
+    """
+
+    def __init__(self, probes=()):
+        self._probes = array("q")
+        self._start = 0
+        self.reset(probes)
+
+    def reset(self, probes):
+        """
+        Replaces the content of the index with the given probes in any order
+        """
+        self._probes = array("q", sorted(probes))
+        self._start = 0
+
+    def load(self, data):
+        """
+        Replaces the content of the index with probes dumped by tobytes()
+        """
+        self._probes = array("q")
+        self._probes.frombytes(data)
+        self._start = 0
+
+    def tobytes(self):
+        """
+        Dumps the probes oldest first as native int64 values
+        """
+        start = self._start
+        return memoryview(self._probes)[start:].tobytes()
+
+    def append(self, probe):
+        """
+        Adds a new probe, it must be newer than any other probe in the index
+        """
+        self._probes.append(probe)
+
+    def trim(self, index_to_start_deletion):
+        """
+        Removes the probes from index_to_start_deletion (newest first order) until the end,
+        which are the oldest ones
+        """
+        self._start += len(self) - max(index_to_start_deletion, 0)
+        if self._start > len(self._probes) // 2:
+            del self._probes[: self._start]
+            self._start = 0
+
+    def remove(self, probes):
+        """
+        Removes the given probes from any position of the index, compacting the array
+        """
+        probes = set(probes)
+        start = self._start
+        self._probes = array(
+            "q", (probe for probe in self._probes[start:] if probe not in probes)
+        )
+        self._start = 0
+
+    def newest(self):
+        return self._probes[-1] if len(self) else None
+
+    def __len__(self):
+        return len(self._probes) - self._start
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("probe index out of range")
+        return self._probes[len(self._probes) - 1 - idx]
+
+    def __iter__(self):
+        for idx in range(len(self._probes) - 1, self._start - 1, -1):
+            yield self._probes[idx]
+
+    def __repr__(self):
+        return "ProbeIndex({})".format(list(self))
@@ -0,0 +1,80 @@
+import logging
+import os
+import struct
+
+logger = logging.getLogger(__name__)
+
+
+class ProbeStateCheckpoint(object):
+    """
+    Compact binary checkpoint of the probe index and the last eviction boundary, stored
+    alongside the probe files so a restart does not need to list and sort the tmp directory:
+
+        | header (magic, version, probes, boundary timestamps) | probes, oldest first |
+
+    Probe names are their creation timestamps, so the probe ids are stored once as int64.
+    A boundary timestamp of 0 means it was unknown. The checkpoint is written to a
+    temporary file, synced and renamed over the previous one, and the directory is synced,
+    so readers never see a partial write, not even after a crash.
+    """
+
+    FILENAME = ".pagecache_ttl.state"
+    HEADER_MAGIC = b"PCTTLSTA"
+    HEADER_VERSION = 1
+    # magic, version, probes, last_tick_time, oldest_cached_probe, first_evicted_probe
+    HEADER = struct.Struct("=8sIIqqq")
+
+    def __init__(self, tmp_directory):
+        self.path = os.path.join(tmp_directory, self.FILENAME)
+        self.tmp_path = self.path + ".tmp"
+
+    def save(
+        self, probe_index, last_tick_time, oldest_cached_probe, first_evicted_probe
+    ):
+        probes = probe_index.tobytes()
+        header = self.HEADER.pack(
+            self.HEADER_MAGIC,
+            self.HEADER_VERSION,
+            len(probe_index),
+            last_tick_time or 0,
+            oldest_cached_probe or 0,
+            first_evicted_probe or 0,
+        )
+        fd = os.open(self.tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, header + probes)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(self.tmp_path, self.path)
+        # Persists the rename
+        fd = os.open(os.path.dirname(self.path) or ".", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def load(self, probe_index):
+        """
+        Loads the checkpoint into probe_index with a single read and returns the boundary
+        timestamps (last_tick_time, oldest_cached_probe, first_evicted_probe),
+        None if there is not a valid checkpoint
+        """
+        try:
+            with open(self.path, "rb") as fd:
+                data = fd.read()
+        except FileNotFoundError:
+            return None
+        if len(data) < self.HEADER.size:
+            logger.warning("Ignoring truncated probe state checkpoint")
+            return None
+        magic, version, probes, *boundary = self.HEADER.unpack_from(data)
+        if (magic, version) != (self.HEADER_MAGIC, self.HEADER_VERSION):
+            logger.warning("Ignoring probe state checkpoint with another layout")
+            return None
+        header_size = self.HEADER.size
+        if len(data) != header_size + probes * 8:
+            logger.warning("Ignoring truncated probe state checkpoint")
+            return None
+        probe_index.load(data[header_size:])
+        return tuple(timestamp or None for timestamp in boundary)
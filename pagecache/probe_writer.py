@@ -0,0 +1,88 @@
+import logging
+import os
+import time
+
+import cache
+
+logger = logging.getLogger(__name__)
+
+# How a probe page is made durable after writing it:
+#   fsync: flushes data and metadata, waiting for the disk (original behaviour)
+#   fdatasync: flushes data and only the metadata needed to read it back
+#   sync_file_range: starts the writeback of the probe page without waiting for it
+#   none: leaves the page dirty for the kernel writeback, it is still a valid probe
+#         as dirty pages are in the inactive list too
+WRITE_STRATEGIES = ("fsync", "fdatasync", "sync_file_range", "none")
+
+
+def sync_probe(fd, offset, length, write_strategy):
+    """
+    Applies the write_strategy to the probe written at offset of the fd
+    """
+    if write_strategy == "fsync":
+        os.fsync(fd)
+    elif write_strategy == "fdatasync":
+        os.fdatasync(fd)
+    elif write_strategy == "sync_file_range":
+        cache.sync_file_range(fd, offset, length, cache.SYNC_FILE_RANGE_WRITE)
+    elif write_strategy != "none":
+        raise ValueError("Unknown write strategy: {}".format(write_strategy))
+
+
+def write_probe_file(path, content, write_strategy, promote=False):
+    """
+    Creates the probe file at path with content using raw os calls, the file is always closed.
+    With promote the page is read back twice, a page accessed twice while in the inactive
+    list is promoted to the active list.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o644)
+    try:
+        os.pwrite(fd, content, 0)
+        sync_probe(fd, 0, len(content), write_strategy)
+        if promote:
+            os.pread(fd, len(content), 0)
+            os.pread(fd, len(content), 0)
+    finally:
+        os.close(fd)
+
+
+def measure_write_strategies(tmp_directory, samples=20):
+    """
+    Writes samples probe files with every write strategy and returns its cost and whether
+    the written page is a valid probe (it is cached right after writing it).
+    Example:
+        {"fsync": {"mean_ms": 2.1, "max_ms": 3.4, "cached_ratio": 1.0, "dirty_pages": 0}, ...}
+    dirty_pages is None when the cachestat backend is not available.
+    """
+    report = {}
+    for write_strategy in WRITE_STRATEGIES:
+        latencies = []
+        cached = 0
+        dirty_pages = 0 if cache.backend() == "cachestat" else None
+        for sample in range(samples):
+            path = "{}/write_cost_{}_{}".format(tmp_directory, write_strategy, sample)
+            content = str(time.time_ns()).encode()
+            started = time.perf_counter()
+            write_probe_file(path, content, write_strategy)
+            latencies.append(time.perf_counter() - started)
+
+            fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+            try:
+                if cache.ratio(fd)[0] > 0:
+                    cached += 1
+                if dirty_pages is not None:
+                    dirty_pages += cache.stat(fd)["dirty"]
+            finally:
+                os.close(fd)
+                os.remove(path)
+
+        report[write_strategy] = {
+            "mean_ms": round(sum(latencies) / samples * 1000, 3),
+            "max_ms": round(max(latencies) * 1000, 3),
+            "cached_ratio": cached / samples,
+            "dirty_pages": dirty_pages,
+        }
+        logger.debug(
+            "Write strategy {} cost: {}".format(write_strategy, report[write_strategy])
+        )
+    return report
@@ -0,0 +1,159 @@
+import time
+from array import array
+
+
+class _Phase(object):
+    """
+    Reusable context manager timing one phase, so timing a phase does not allocate
+    """
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.started = 0
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add_duration(self.name, time.perf_counter_ns() - self.started)
+        return False
+
+
+class _NoPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class TickProfiler(object):
+    """
+    Times the phases of every iteration of the monitor and counts the probes and an
+    estimation of the syscalls done (from the calls each operation makes, not traced), keeping the last window iterations in fixed size ring buffers for rolling summaries.
+    When it is disabled every call is a no-op.
+    Example of summary():
+        {"create_probe": {"last": 0.0021, "p50": 0.0019, "p99": 0.0034, "max": 0.0035}, ...}
+    """
+
+    def __init__(self, enabled=False, window=60):
+        self.enabled = enabled
+        self.window = window
+        self.ticks = 0
+        self._phases = {}
+        self._no_phase = _NoPhase()
+        # Durations (ns) and counts of the current iteration
+        self.current_durations = {}
+        self.current_counts = {}
+        # Ring buffers with the last window iterations
+        self._durations = {}
+        self._counts = {}
+
+    def phase(self, name):
+        if not self.enabled:
+            return self._no_phase
+        if name not in self._phases:
+            self._phases[name] = _Phase(self, name)
+        return self._phases[name]
+
+    def add_duration(self, name, duration_ns):
+        self.current_durations[name] = self.current_durations.get(name, 0) + duration_ns
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.current_counts[name] = self.current_counts.get(name, 0) + value
+
+    def end_tick(self):
+        """
+        Stores the current iteration in the ring buffers and returns its metrics
+        """
+        if not self.enabled:
+            return {}
+        slot = self.ticks % self.window
+        for rings, current in (
+            (self._durations, self.current_durations),
+            (self._counts, self.current_counts),
+        ):
+            for name in set(rings) | set(current):
+                if name not in rings:
+                    rings[name] = array("d", bytes(8 * self.window))
+                rings[name][slot] = current.get(name, 0)
+        self.ticks += 1
+
+        # Phases and counters seen in previous iterations are reported as 0, not left stale
+        metrics = {
+            "phase_{}_seconds".format(name): self.current_durations.get(name, 0) / 1e9
+            for name in self._durations
+        }
+        for name in self._counts:
+            metrics["tick_{}".format(name)] = self.current_counts.get(name, 0)
+        self.current_durations = {}
+        self.current_counts = {}
+        return metrics
+
+    def _summarize(self, rings, scale):
+        summary = {}
+        last_slot = (self.ticks - 1) % self.window
+        for name, ring in rings.items():
+            values = sorted(ring[: min(self.ticks, self.window)])
+            if not values:
+                continue
+            summary[name] = {
+                "last": ring[last_slot] * scale,
+                "p50": values[int(0.50 * (len(values) - 1))] * scale,
+                "p99": values[int(0.99 * (len(values) - 1))] * scale,
+                "max": values[-1] * scale,
+            }
+        return summary
+
+    def summary(self):
+        """
+        Rolling summary of the durations (in seconds) of every phase over the window
+        """
+        return self._summarize(self._durations, 1e-9)
+
+    def counts_summary(self):
+        """
+        Rolling summary of the probes and syscalls done per iteration over the window
+        """
+        return self._summarize(self._counts, 1)
+
+    def summary_metrics(self):
+        """
+        Returns the rolling p50 and p99 of every phase and counter as flat metrics, e.g.
+        {"phase_create_probe_seconds_p50": 0.0019, "tick_probes_p99": 12, ...}
+        """
+        metrics = {}
+        for prefix, suffix, summary in (
+            ("phase_", "_seconds", self.summary()),
+            ("tick_", "", self.counts_summary()),
+        ):
+            for name, stats in summary.items():
+                for key in ("p50", "p99"):
+                    metrics["{}{}{}_{}".format(prefix, name, suffix, key)] = stats[key]
+        return metrics
+
+    def format_breakdown(self):
+        """
+        Returns a table with the per-phase breakdown, durations in milliseconds
+        """
+        lines = [
+            "{:<20}{:>12}{:>12}{:>12}{:>12}".format(
+                "phase", "last", "p50", "p99", "max"
+            )
+        ]
+        for name, stats in sorted(self.summary().items()):
+            lines.append(
+                "{:<20}{:>12.3f}{:>12.3f}{:>12.3f}{:>12.3f}".format(
+                    name, *(stats[key] * 1000 for key in ("last", "p50", "p99", "max"))
+                )
+            )
+        for name, stats in sorted(self.counts_summary().items()):
+            lines.append(
+                "{:<20}{:>12.0f}{:>12.0f}{:>12.0f}{:>12.0f}".format(
+                    name, *(stats[key] for key in ("last", "p50", "p99", "max"))
+                )
+            )
+        return "\n".join(lines)
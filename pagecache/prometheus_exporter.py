@@ -0,0 +1,218 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pagecache.probe_index import count_newer_probes
+
+logger = logging.getLogger(__name__)
+
+NANOSECONDS = 1000000000
+# Upper bounds (in seconds) of the buckets for the age of the probes still cached
+DEFAULT_AGE_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label_value(value):
+    """
+    Escapes a label value as the text exposition format requires: backslash, double quote
+    and line feed
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PrometheusExporter(object):
+    """
+    Serves the metrics of the last iteration in the Prometheus text exposition format.
+    The body is built once per iteration by update(), scrapes only return the bytes
+    already in memory, so they never touch the filesystem nor probe the page cache.
+    Several monitors can share one exporter, each one updating its own labels.
+    """
+
+    def __init__(self, address="0.0.0.0", port=9105, age_buckets=DEFAULT_AGE_BUCKETS):
+        self.address = address
+        self.port = port
+        self.age_buckets = age_buckets
+        self.body = b""
+        self.server = None
+        # Families of the last update of every set of labels
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        exporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                # A single attribute read, update() swaps the whole body at once
+                body = exporter.body
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("Prometheus exporter: " + format % args)
+
+        self.server = ThreadingHTTPServer((self.address, self.port), MetricsHandler)
+        self.server.daemon_threads = True
+        # Real port when started on port 0
+        self.port = self.server.server_address[1]
+        thread = threading.Thread(
+            target=self.server.serve_forever, name="prometheus-exporter", daemon=True
+        )
+        thread.start()
+        logger.info(
+            "Prometheus exporter listening on {}:{}".format(self.address, self.port)
+        )
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def update(
+        self,
+        min_cached_time,
+        now,
+        live_probes,
+        oldest_cached_probe=None,
+        first_evicted_probe=None,
+        extra_metrics=None,
+        labels=None,
+    ):
+        """
+        Rebuilds the exposition body, timestamps are in nanoseconds and live_probes is sorted
+        from newest to oldest.
+        Every set of labels (e.g. {"tmp_dir": "/data1"}) keeps its own samples, so several
+        monitors can share one exporter
+        """
+        label_pairs = [
+            '{}="{}"'.format(key, escape_label_value(value))
+            for key, value in (labels or {}).items()
+        ]
+
+        def sample(name, value, *extra_pairs):
+            pairs = label_pairs + list(extra_pairs)
+            if pairs:
+                return "{}{{{}}} {}".format(name, ",".join(pairs), value)
+            return "{} {}".format(name, value)
+
+        # Families as (name, type, help, samples)
+        families = [
+            (
+                "pagecache_ttl_min_cached_time_seconds",
+                "gauge",
+                "Age of the oldest probe still cached.",
+                [sample("pagecache_ttl_min_cached_time_seconds", min_cached_time)],
+            ),
+            (
+                "pagecache_ttl_live_probes",
+                "gauge",
+                "Probes currently tracked.",
+                [sample("pagecache_ttl_live_probes", len(live_probes))],
+            ),
+        ]
+
+        # The live probes are sorted, so every bucket is a bisect on the list
+        histogram = [
+            sample(
+                "pagecache_ttl_cached_probe_age_seconds_bucket",
+                count_newer_probes(live_probes, now - bucket * NANOSECONDS),
+                'le="{}"'.format(bucket),
+            )
+            for bucket in self.age_buckets
+        ]
+        ages_sum = (len(live_probes) * now - sum(live_probes)) / NANOSECONDS
+        histogram += [
+            sample(
+                "pagecache_ttl_cached_probe_age_seconds_bucket",
+                len(live_probes),
+                'le="+Inf"',
+            ),
+            sample("pagecache_ttl_cached_probe_age_seconds_sum", ages_sum),
+            sample("pagecache_ttl_cached_probe_age_seconds_count", len(live_probes)),
+        ]
+        families.append(
+            (
+                "pagecache_ttl_cached_probe_age_seconds",
+                "histogram",
+                "Age of the probes still cached.",
+                histogram,
+            )
+        )
+
+        boundaries = (
+            (
+                "oldest_cached_probe",
+                oldest_cached_probe,
+                "Creation time of the oldest probe still cached.",
+            ),
+            (
+                "first_evicted_probe",
+                first_evicted_probe,
+                "Creation time of the newest probe found evicted or expired in the last iteration.",
+            ),
+        )
+        for name, timestamp, description in boundaries:
+            if timestamp is None:
+                continue
+            name = "pagecache_ttl_{}_timestamp_seconds".format(name)
+            families.append(
+                (name, "gauge", description, [sample(name, timestamp / NANOSECONDS)])
+            )
+
+        for name, value in (extra_metrics or {}).items():
+            name = "pagecache_ttl_{}".format(name)
+            families.append((name, "gauge", None, [sample(name, value)]))
+
+        with self.lock:
+            self.series[tuple(label_pairs)] = families
+            self.body = self._render()
+
+    def update_gauges(self, metrics, labels):
+        """
+        Rebuilds the exposition body with the gauges of a set of labels which is not a
+        monitor, e.g. {"target_file": "/data/kafka/topic-0/00000000000000012345.log"}
+        """
+        label_pairs = tuple(
+            '{}="{}"'.format(key, escape_label_value(value))
+            for key, value in labels.items()
+        )
+        families = []
+        for name, value in metrics.items():
+            name = "pagecache_ttl_{}".format(name)
+            families.append(
+                (
+                    name,
+                    "gauge",
+                    None,
+                    ["{}{{{}}} {}".format(name, ",".join(label_pairs), value)],
+                )
+            )
+        with self.lock:
+            self.series[label_pairs] = families
+            self.body = self._render()
+
+    def _render(self):
+        """
+        Groups the samples of every set of labels by family, a family is declared only once
+        """
+        headers = {}
+        samples = {}
+        for families in self.series.values():
+            for name, metric_type, description, family_samples in families:
+                headers.setdefault(name, (metric_type, description))
+                samples.setdefault(name, []).extend(family_samples)
+
+        lines = []
+        for name, (metric_type, description) in headers.items():
+            if description is not None:
+                lines.append("# HELP {} {}".format(name, description))
+            lines.append("# TYPE {} {}".format(name, metric_type))
+            lines += samples[name]
+        return ("\n".join(lines) + "\n").encode()
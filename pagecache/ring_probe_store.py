@@ -0,0 +1,220 @@
+import logging
+import os
+import struct
+from array import array
+
+import cache
+from pagecache.probe_writer import sync_probe
+
+logger = logging.getLogger(__name__)
+
+
+class RingProbeStore(object):
+    """
+    Keeps every probe sample as one page of a single preallocated file.
+    The file starts with a header holding the creation timestamp of every slot,
+    followed by one page per slot which is rewritten in ring order:
+
+        | header (magic, slots, timestamps) | slot 0 | slot 1 | ... | slot N-1 |
+
+    A timestamp of 0 marks an empty slot. The residency of all the samples is
+    read with a single mmap+mincore of the file instead of one per probe file.
+    """
+
+    FILENAME = "pagecache_ttl.ring"
+    HEADER_MAGIC = b"PCTTLRNG"
+    HEADER_VERSION = 1
+    # magic, version, slots
+    HEADER_PREFIX = struct.Struct("=8sII")
+    TIMESTAMP = struct.Struct("=q")
+
+    def __init__(self, tmp_directory, slots, write_strategy="fsync"):
+        self.slots = slots
+        self.write_strategy = write_strategy
+        self.path = os.path.join(tmp_directory, self.FILENAME)
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        header_size = self.HEADER_PREFIX.size + self.slots * self.TIMESTAMP.size
+        self.header_pages = (header_size + self.page_size - 1) // self.page_size
+        self.file_size = (self.header_pages + self.slots) * self.page_size
+
+        self.timestamps = array("q", bytes(self.slots * self.TIMESTAMP.size))
+        self.next_slot = 0
+        # Newest probe released by the last get_oldest_cached_probe() call
+        self.first_released_probe = None
+        # Reusable page buffer, a full page write never needs to read the page first
+        self.page = bytearray(self.page_size)
+
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if not self._load_header():
+            self._preallocate()
+
+    def _load_header(self):
+        """
+        Loads the slot timestamps from an existing ring file,
+        returns False if the file does not exist or was created with another layout
+        """
+        if os.fstat(self.fd).st_size != self.file_size:
+            return False
+        prefix = os.pread(self.fd, self.HEADER_PREFIX.size, 0)
+        if self.HEADER_PREFIX.unpack(prefix) != (
+            self.HEADER_MAGIC,
+            self.HEADER_VERSION,
+            self.slots,
+        ):
+            return False
+
+        self.timestamps = array(
+            "q",
+            os.pread(
+                self.fd,
+                self.slots * self.TIMESTAMP.size,
+                self.HEADER_PREFIX.size,
+            ),
+        )
+        newest_slot = max(range(self.slots), key=self.timestamps.__getitem__)
+        if self.timestamps[newest_slot] != 0:
+            self.next_slot = (newest_slot + 1) % self.slots
+        logger.debug(
+            "Loaded ring probe file {} with {} slots".format(self.path, self.slots)
+        )
+        return True
+
+    def _preallocate(self):
+        """
+        (Re)creates the ring file with its full size allocated on disk and an empty header
+        """
+        os.ftruncate(self.fd, 0)
+        os.posix_fallocate(self.fd, 0, self.file_size)
+        self._write_header()
+        os.fsync(self.fd)
+        logger.debug(
+            "Preallocated ring probe file {} with {} slots".format(
+                self.path, self.slots
+            )
+        )
+
+    def _write_header(self):
+        prefix = self.HEADER_PREFIX.pack(
+            self.HEADER_MAGIC, self.HEADER_VERSION, self.slots
+        )
+        os.pwrite(self.fd, prefix + self.timestamps.tobytes(), 0)
+
+    def _timestamp_offset(self, slot):
+        return self.HEADER_PREFIX.size + slot * self.TIMESTAMP.size
+
+    def _write_timestamps(self, first_slot, last_slot):
+        """
+        Writes the timestamps of the slots from first_slot until last_slot (excluded) to
+        the header, only the header pages holding them are dirtied
+        """
+        os.pwrite(
+            self.fd,
+            memoryview(self.timestamps)[first_slot:last_slot].tobytes(),
+            self._timestamp_offset(first_slot),
+        )
+
+    def _slot_offset(self, slot):
+        return (self.header_pages + slot) * self.page_size
+
+    def add_probe(self, timestamp):
+        """
+        Writes a new probe page in the next slot of the ring and records its timestamp
+        """
+        slot = self.next_slot
+        offset = self._slot_offset(slot)
+        # The previous probe of the slot may still be cached, rewriting it would be a second
+        # access promoting the page to the active list, so it is dropped first.
+        # Dirty pages are not dropped, they are written back long before the ring wraps
+        os.posix_fadvise(self.fd, offset, self.page_size, os.POSIX_FADV_DONTNEED)
+        self.TIMESTAMP.pack_into(self.page, 0, timestamp)
+        os.pwrite(self.fd, self.page, offset)
+        self.timestamps[slot] = timestamp
+        self.next_slot = (slot + 1) % self.slots
+        self._write_timestamps(slot, slot + 1)
+        if self.write_strategy == "sync_file_range":
+            # Only the header page of the slot timestamp and the probe page are written back
+            header_page = (
+                self._timestamp_offset(slot) // self.page_size * self.page_size
+            )
+            sync_probe(self.fd, header_page, self.page_size, self.write_strategy)
+            sync_probe(self.fd, offset, self.page_size, self.write_strategy)
+        else:
+            # Only the header page and the probe page are dirty, a whole file sync
+            # writes back just those two pages
+            sync_probe(self.fd, 0, 0, self.write_strategy)
+        logger.debug("Created probe {} in ring slot {}".format(timestamp, slot))
+
+    def get_oldest_cached_probe(self, now, max_age):
+        """
+        Walks the slots from the newest to the oldest one and returns the timestamp of the
+        oldest probe still cached, the first expired or not cached probe and all the older
+        ones are released. Probes older than now - max_age are expired.
+        If there is not any cached probe we return None
+        """
+        mincore_vec = cache.residency(self.fd)
+        oldest_cached = None
+        self.first_released_probe = None
+        for step in range(1, self.slots + 1):
+            slot = (self.next_slot - step) % self.slots
+            timestamp = self.timestamps[slot]
+            if timestamp == 0:
+                break
+            expired = timestamp < now - max_age
+            cached = mincore_vec[self.header_pages + slot] & 1
+            if expired or not cached:
+                logger.debug(
+                    "First expired or not cached probe in ring: {}, slot: {}".format(
+                        timestamp, slot
+                    )
+                )
+                self.first_released_probe = timestamp
+                self._release_slots(step)
+                break
+            oldest_cached = timestamp
+        return oldest_cached
+
+    def live_probes(self):
+        """
+        Returns the timestamps of the probes in the ring sorted from newest to oldest
+        """
+        probes = []
+        for step in range(1, self.slots + 1):
+            timestamp = self.timestamps[(self.next_slot - step) % self.slots]
+            if timestamp == 0:
+                break
+            probes.append(timestamp)
+        return probes
+
+    def _release_slots(self, first_step):
+        """
+        Empties the slots from first_step positions behind the newest one until the oldest one,
+        only the cleared timestamps are written, in one or two ranges when the ring wraps
+        """
+        released_slots = []
+        for step in range(first_step, self.slots + 1):
+            slot = (self.next_slot - step) % self.slots
+            if self.timestamps[slot] == 0:
+                break
+            self.timestamps[slot] = 0
+            released_slots.append(slot)
+        # Walked from the newest to the oldest slot, so they are descending until it wraps
+        ranges = []
+        for slot in released_slots:
+            if ranges and ranges[-1][0] == slot + 1:
+                ranges[-1][0] = slot
+            else:
+                ranges.append([slot, slot + 1])
+        for first_slot, last_slot in ranges:
+            self._write_timestamps(first_slot, last_slot)
+
+    def get_page_stats(self):
+        """
+        Returns the cachestat() counters (dirty, recently evicted...) of the probe pages,
+        None if the cachestat backend is not available
+        """
+        if cache.backend() != "cachestat":
+            return None
+        return cache.stat(self.fd, self.header_pages * self.page_size)
+
+    def close(self):
+        os.close(self.fd)
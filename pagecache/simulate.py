@@ -0,0 +1,431 @@
+import argparse
+import itertools
+import sys
+
+PAGE_SIZE = 4096
+PAGES_PER_MB = 1024 * 1024 // PAGE_SIZE
+# State of every page
+NOT_CACHED = 0
+INACTIVE = 1
+ACTIVE = 2
+# Accesses of a text trace read at once, ~16MB
+TRACE_CHUNK_LINES = 1048576
+
+
+def import_numpy():
+    # Optional dependency, only needed by the simulator
+    import numpy
+
+    return numpy
+
+
+def get_inactive_ratio(capacity_pages):
+    """
+    Returns the active:inactive ratio the kernel keeps for this much memory,
+    sqrt(10 * GB) or 1 under 1GB (mm/vmscan.c inactive_is_low)
+    """
+    gigabytes = capacity_pages * PAGE_SIZE >> 30
+    if not gigabytes:
+        return 1
+    return int((10 * gigabytes) ** 0.5)
+
+
+class PageList(object):
+    """
+    LRU list as a FIFO of page ids in a numpy buffer, the oldest pages first. Pages are
+    never removed from the middle: when a page leaves the list its entry just becomes
+    stale, and stale entries are skipped when the oldest pages are popped.
+    An entry is live if the page is still in this list and its slot points to the entry.
+    """
+
+    def __init__(self, numpy, list_state, state, slot, size=1024):
+        self.numpy = numpy
+        self.list_state = list_state
+        # Shared by both lists, indexed by page id
+        self.state = state
+        self.slot = slot
+        self.pages = numpy.empty(size, dtype=numpy.int64)
+        self.times = numpy.empty(size, dtype=numpy.float64)
+        # Absolute positions of the oldest entry, of the next entry and of pages[0]
+        self.start = 0
+        self.end = 0
+        self.offset = 0
+        # Live pages in the list
+        self.size = 0
+
+    def _reserve(self, count):
+        if self.end - self.offset + count <= len(self.pages):
+            return
+        used = self.end - self.start
+        head = self.start - self.offset
+        tail = head + used
+        pages = self.pages[head:tail]
+        times = self.times[head:tail]
+        if used + count > len(self.pages) // 2:
+            # Grows the buffers, otherwise the entries are compacted in place
+            size = max(2 * len(self.pages), used + count)
+            self.pages = self.numpy.empty(size, dtype=self.numpy.int64)
+            self.times = self.numpy.empty(size, dtype=self.numpy.float64)
+        self.pages[:used] = pages
+        self.times[:used] = times
+        self.offset = self.start
+
+    def push(self, pages, times):
+        """
+        Adds the pages, which must be unique, as the newest ones of the list
+        """
+        count = len(pages)
+        if not count:
+            return
+        self._reserve(count)
+        head = self.end - self.offset
+        tail = head + count
+        self.pages[head:tail] = pages
+        self.times[head:tail] = times
+        self.state[pages] = self.list_state
+        self.slot[pages] = self.numpy.arange(self.end, self.end + count)
+        self.end += count
+        self.size += count
+
+    def _live(self, first, last):
+        head = first - self.offset
+        tail = last - self.offset
+        pages = self.pages[head:tail]
+        return (self.state[pages] == self.list_state) & (
+            self.slot[pages] == self.numpy.arange(first, last)
+        )
+
+    def pop_oldest(self, count):
+        """
+        Removes up to count of the oldest live pages and returns them with their times
+        """
+        popped_pages = []
+        popped_times = []
+        while count > 0 and self.start < self.end:
+            last = min(self.end, self.start + max(2 * count, 1024))
+            live = self._live(self.start, last)
+            positions = self.numpy.flatnonzero(live)[:count]
+            if len(positions) == count:
+                last = self.start + int(positions[-1]) + 1
+            head = self.start - self.offset
+            popped_pages.append(self.pages[head + positions])
+            popped_times.append(self.times[head + positions])
+            count -= len(positions)
+            self.start = last
+        pages = self.numpy.concatenate(popped_pages or [[]]).astype(self.numpy.int64)
+        self.state[pages] = NOT_CACHED
+        self.size -= len(pages)
+        return pages, self.numpy.concatenate(popped_times or [[]])
+
+    def oldest_time(self):
+        """
+        Returns the time the oldest live page was added, skipping the stale entries
+        """
+        while self.start < self.end:
+            last = min(self.end, self.start + 1024)
+            positions = self.numpy.flatnonzero(self._live(self.start, last))
+            if len(positions):
+                self.start += int(positions[0])
+                return float(self.times[self.start - self.offset])
+            self.start = last
+        return None
+
+
+class LRUSimulator(object):
+    """
+    Replays page accesses through a two list LRU model of the page cache with a fixed
+    capacity: a page enters the inactive list when it is read or written, it is promoted
+    to the active list when accessed again, the active list is shrunk into the inactive
+    one to keep the kernel ratio between them, and pages are evicted from the inactive list.
+    Accesses are processed in batches with numpy, a batch being a small fraction of the
+    inactive list so pages are still evicted in order.
+    min_cached_time is what PageCacheMonitor would report: the age of the oldest page
+    written once which is still cached, the oldest page of the inactive list.
+    """
+
+    def __init__(self, capacity_pages, pages, batch_size=65536, interval_seconds=5):
+        numpy = self.numpy = import_numpy()
+        self.capacity_pages = capacity_pages
+        self.inactive_ratio = get_inactive_ratio(capacity_pages)
+        # A small fraction of the inactive list, so batching does not change the order
+        inactive_pages = capacity_pages // (self.inactive_ratio + 1)
+        self.batch_size = max(1, min(batch_size, inactive_pages // 16))
+        self.interval_seconds = interval_seconds
+        # One byte and one slot per page id, no per page objects
+        self.state = numpy.zeros(pages, dtype=numpy.int8)
+        self.slot = numpy.zeros(pages, dtype=numpy.int64)
+        self.inactive = PageList(numpy, INACTIVE, self.state, self.slot)
+        self.active = PageList(numpy, ACTIVE, self.state, self.slot)
+        self.accesses = 0
+        self.hits = 0
+        self.evicted_pages = 0
+        self.next_sample_time = None
+        # min_cached_time every interval, once the cache is full
+        self.samples = []
+
+    def _access(self, pages, times):
+        numpy = self.numpy
+        pages, first, counts = numpy.unique(
+            pages, return_index=True, return_counts=True
+        )
+        # Back to the order of the first access
+        order = numpy.argsort(first, kind="stable")
+        pages, first, counts = pages[order], first[order], counts[order]
+        states = self.state[pages]
+
+        missed = states == NOT_CACHED
+        activated = (states == INACTIVE) | (missed & (counts > 1))
+        self.accesses += int(counts.sum())
+        self.hits += int(counts.sum()) - int(missed.sum())
+
+        self.inactive.size -= int((states == INACTIVE).sum())
+        self.active.push(pages[activated], times[first[activated]])
+        added = missed & ~activated
+        self.inactive.push(pages[added], times[first[added]])
+
+    def _reclaim(self, now):
+        excess = self.inactive.size + self.active.size - self.capacity_pages
+        if excess <= 0:
+            return
+        # Keeps active <= inactive * ratio once the excess is evicted
+        target_active = (
+            self.capacity_pages * self.inactive_ratio // (self.inactive_ratio + 1)
+        )
+        demoted = max(
+            self.active.size - target_active,
+            excess - self.inactive.size,
+            0,
+        )
+        if demoted:
+            pages, _ = self.active.pop_oldest(demoted)
+            self.inactive.push(pages, self.numpy.full(len(pages), now))
+        evicted, _ = self.inactive.pop_oldest(excess)
+        self.evicted_pages += len(evicted)
+
+    def _sample(self, now):
+        if self.next_sample_time is None:
+            self.next_sample_time = now
+        if now < self.next_sample_time:
+            return
+        self.next_sample_time = now + self.interval_seconds
+        oldest_time = self.inactive.oldest_time()
+        if self.evicted_pages and oldest_time is not None:
+            self.samples.append(now - oldest_time)
+
+    def replay(self, times, pages):
+        """
+        Replays a chunk of accesses, sorted by time (in seconds), of dense page ids
+        """
+        for first in range(0, len(pages), self.batch_size):
+            last = first + self.batch_size
+            batch_times = times[first:last]
+            now = float(batch_times[-1])
+            self._access(pages[first:last], batch_times)
+            self._reclaim(now)
+            self._sample(now)
+
+    def get_result(self):
+        """
+        Returns the hit ratio and the min, p50 and max of the min_cached_time samples
+        """
+        result = {
+            "memory_mb": self.capacity_pages / PAGES_PER_MB,
+            "accesses": self.accesses,
+            "hit_ratio": self.hits / self.accesses if self.accesses else None,
+            "evicted_pages": self.evicted_pages,
+        }
+        samples = sorted(self.samples)
+        if not samples:
+            # The cache never filled up, pages stay cached for the whole trace
+            result["min_cached_time"] = None
+            return result
+        result["min_cached_time"] = self.samples[-1]
+        result["min_cached_time_min"] = samples[0]
+        result["min_cached_time_p50"] = samples[(len(samples) - 1) // 2]
+        result["min_cached_time_max"] = samples[-1]
+        return result
+
+
+def read_trace(path, chunk_lines=TRACE_CHUNK_LINES):
+    """
+    Yields chunks of (times, page ids) of a recorded trace sorted by time, a .npz file with
+    the `times` (seconds) and `pages` arrays or a text file with one `time page` access per
+    line. Page ids are any integer, e.g. (inode << 32) | page index.
+    A .npz trace is a single chunk, a text trace is read chunk_lines accesses at a time and
+    must be in time order across chunks
+    """
+    numpy = import_numpy()
+    if path.endswith(".npz"):
+        with numpy.load(path) as trace:
+            times, pages = trace["times"], trace["pages"]
+        order = numpy.argsort(times, kind="stable")
+        yield times[order].astype(numpy.float64), pages[order].astype(numpy.int64)
+        return
+
+    dtype = numpy.dtype([("time", numpy.float64), ("page", numpy.int64)])
+    last_time = None
+    with open(path) as trace:
+        while True:
+            lines = list(itertools.islice(trace, chunk_lines))
+            if not lines:
+                return
+            chunk = numpy.loadtxt(lines, dtype=dtype, ndmin=1)
+            if not len(chunk):
+                # Only blank lines or comments
+                continue
+            order = numpy.argsort(chunk["time"], kind="stable")
+            times, pages = chunk["time"][order], chunk["page"][order]
+            if last_time is not None and times[0] < last_time:
+                raise ValueError(
+                    "The trace {} is not sorted by time, {} is after {}".format(
+                        path, times[0], last_time
+                    )
+                )
+            last_time = times[-1]
+            yield times, pages
+
+
+def load_trace(path, chunk_lines=TRACE_CHUNK_LINES):
+    """
+    Returns the number of distinct pages of a recorded trace and an iterator of chunks of
+    (times, dense page ids) to replay. The trace is read twice, first to collect the
+    distinct page ids, so only one chunk and the page ids are kept in memory
+    """
+    numpy = import_numpy()
+    page_ids = numpy.empty(0, dtype=numpy.int64)
+    for _, pages in read_trace(path, chunk_lines):
+        page_ids = numpy.union1d(page_ids, pages)
+
+    def dense_chunks():
+        for times, pages in read_trace(path, chunk_lines):
+            yield times, numpy.searchsorted(page_ids, pages)
+
+    return len(page_ids), dense_chunks()
+
+
+def generate_workload(
+    produce_mb_per_second, consumer_lags, duration_seconds, chunk_seconds=10
+):
+    """
+    Yields chunks of (times, pages) of a log written at produce_mb_per_second and read by
+    one consumer per lag (in seconds) behind the producer, like a Kafka broker. Page ids
+    are the positions in the log, so they are dense
+    """
+    numpy = import_numpy()
+    rate = produce_mb_per_second * PAGES_PER_MB
+    chunk_start = 0
+    while chunk_start < duration_seconds:
+        chunk_end = min(chunk_start + chunk_seconds, duration_seconds)
+        written = numpy.arange(int(chunk_start * rate), int(chunk_end * rate))
+        times = [written / rate]
+        pages = [written]
+        for lag in consumer_lags:
+            read = written - int(lag * rate)
+            read = read[read >= 0]
+            times.append(read / rate + lag)
+            pages.append(read)
+        times = numpy.concatenate(times)
+        pages = numpy.concatenate(pages)
+        # Writes before reads at the same time
+        order = numpy.argsort(times, kind="stable")
+        yield times[order], pages[order]
+        chunk_start = chunk_end
+
+
+def simulate(chunks, pages, memory_mb, batch_size=65536, interval_seconds=5):
+    """
+    Replays the chunks of accesses through a simulator for every memory size, returns
+    their results
+    """
+    simulators = [
+        LRUSimulator(int(memory * PAGES_PER_MB), pages, batch_size, interval_seconds)
+        for memory in memory_mb
+    ]
+    for times, chunk_pages in chunks:
+        for simulator in simulators:
+            simulator.replay(times, chunk_pages)
+    return [simulator.get_result() for simulator in simulators]
+
+
+def parseargs(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="pagecache simulate",
+        description="Predicts the min_cached_time for several memory sizes replaying an access trace or a produce/consume workload",
+    )
+    parser.add_argument(
+        "--memory-mb",
+        type=float,
+        nargs="+",
+        required=True,
+        help="Sets the page cache sizes to simulate (in MB).",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        default=None,
+        help="Replays a recorded trace: a .npz file with `times` and `pages` arrays or a text file with one `time page` access per line.",
+        required=False,
+    )
+    parser.add_argument(
+        "--produce-mb-per-second",
+        type=float,
+        default=None,
+        help="Simulates a log written at this rate instead of a trace.",
+        required=False,
+    )
+    parser.add_argument(
+        "--consumer-lags",
+        type=float,
+        nargs="+",
+        default=[0],
+        help="Sets how far behind the producer every consumer reads (in seconds).",
+        required=False,
+    )
+    parser.add_argument(
+        "--duration-seconds",
+        type=float,
+        default=3600,
+        help="Sets how long the produce/consume workload runs (in seconds).",
+        required=False,
+    )
+    parser.add_argument(
+        "--interval-seconds",
+        type=float,
+        default=5,
+        help="Sets the interval the min_cached_time is sampled at, like the monitor.",
+        required=False,
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=65536,
+        help="Sets the maximum accesses processed together, capped to 1/16 of the inactive list.",
+        required=False,
+    )
+    args = parser.parse_args(argv)
+    if (args.trace is None) == (args.produce_mb_per_second is None):
+        parser.error("either --trace or --produce-mb-per-second is required")
+    try:
+        import_numpy()
+    except ImportError:
+        parser.error("pagecache simulate requires numpy, pip install numpy")
+    return args
+
+
+def main(argv=None):
+    args = parseargs(argv)
+    if args.trace is not None:
+        total_pages, chunks = load_trace(args.trace)
+    else:
+        chunks = generate_workload(
+            args.produce_mb_per_second, args.consumer_lags, args.duration_seconds
+        )
+        total_pages = int(
+            args.produce_mb_per_second * PAGES_PER_MB * args.duration_seconds
+        )
+    results = simulate(
+        chunks, total_pages, args.memory_mb, args.batch_size, args.interval_seconds
+    )
+    for result in results:
+        print(result)
+    sys.stdout.flush()
@@ -1,7 +1,12 @@
 #include <Python.h>
 
+#include <errno.h>
+#include <fcntl.h>
+#include <limits.h>
 #include <unistd.h>
 #include <sys/mman.h>
+#include <sys/stat.h>
+#include <sys/syscall.h>
 
 // This module is needed in order to access the POSIX operating system API and use mincore()
 // mincore() returns a vector that indicates whether pages of the
@@ -10,18 +15,185 @@
 // kernel returns residency information about the pages starting at
 // the address addr, and continuing for length bytes.
 
+// Maximum number of pages mapped and probed by a single mincore() call,
+// 128MiB with 4K pages. Bigger ranges are walked in windows of this size,
+// so the vector memory does not grow with the file size.
+#define MAX_VEC_PAGES 32768
 
-static PyObject *cache_ratio(PyObject *self, PyObject *args) {
-    int fd;
+// cachestat() (Linux 6.5+) reports the page cache state of a file range without mapping it,
+// it is used by default when the running kernel supports it, falling back to mmap+mincore.
+// The syscall number is the same on every architecture.
+#ifndef __NR_cachestat
+#define __NR_cachestat 451
+#endif
+
+struct cachestat_range {
+    unsigned long long off;
+    unsigned long long len;
+};
+
+struct cachestat {
+    unsigned long long nr_cache;
+    unsigned long long nr_dirty;
+    unsigned long long nr_writeback;
+    unsigned long long nr_evicted;
+    unsigned long long nr_recently_evicted;
+};
+
+static int cachestat_supported = 0;
+static int use_cachestat = 0;
+
+static int call_cachestat(int fd, off_t start, size_t length, struct cachestat *cstat) {
+    struct cachestat_range range = {start, length};
+
+    if(syscall(__NR_cachestat, fd, &range, cstat, 0) != 0) {
+        return errno;
+    }
+    return 0;
+}
+
+// An invalid fd fails with EBADF when the syscall exists, and with ENOSYS
+// (or EPERM under some seccomp profiles) when it does not.
+static int detect_cachestat(void) {
+    struct cachestat cstat;
+
+    return call_cachestat(-1, 0, 0, &cstat) == EBADF;
+}
+
+
+// Page aligned range of a file to probe
+struct page_range {
+    off_t start;
+    size_t pages;
+};
+
+// Clips the [offset, offset + length) range to the file size and aligns it to pages.
+// A length of 0 means until the end of the file.
+static int get_page_range(int fd, long long offset, long long length, struct page_range *range) {
+    struct stat file_stat;
+    size_t page_size = getpagesize();
+    off_t end;
+
+    if(offset < 0 || length < 0) {
+        return EINVAL;
+    }
+
+    if(fstat(fd, &file_stat) < 0) {
+        return errno;
+    }
+
+    end = file_stat.st_size;
+    if(length > 0 && offset + length < end) {
+        end = offset + length;
+    }
+
+    range->start = offset - offset % page_size;
+    range->pages = 0;
+    if(end > range->start) {
+        range->pages = (end - range->start + page_size - 1) / page_size;
+    }
+    return 0;
+}
+
+// mmap()s the pages of the range and fills vec with their residency.
+// It does not touch any Python object so it can be called with the GIL released.
+// Returns 0 on success or the errno of the failing call.
+static int mincore_range(int fd, off_t start, size_t pages, unsigned char *vec) {
     void *file_mmap;
+    size_t length = pages * getpagesize();
+    int error = 0;
+
+    file_mmap = mmap((void *)0, length, PROT_NONE, MAP_SHARED, fd, start);
+    if(file_mmap == MAP_FAILED) {
+        return errno;
+    }
+
+    if(mincore(file_mmap, length, vec) != 0) {
+        error = errno;
+    }
+
+    munmap(file_mmap, length);
+    return error;
+}
+
+// Counts the cached pages of the range walking it in windows of vec_pages pages,
+// vec must have room for vec_pages entries.
+static int count_cached_range(int fd, off_t start, size_t pages, unsigned char *vec, size_t vec_pages, long *cached) {
+    size_t page_size = getpagesize();
+    size_t done_pages = 0;
+    size_t window_pages;
+    size_t page_index;
+    struct cachestat cstat;
+    int error;
+
+    *cached = 0;
+    if(use_cachestat) {
+        error = call_cachestat(fd, start, pages * page_size, &cstat);
+        if(error == 0) {
+            *cached = cstat.nr_cache;
+        }
+        return error;
+    }
+
+    while(done_pages < pages) {
+        window_pages = pages - done_pages < vec_pages ? pages - done_pages : vec_pages;
+        error = mincore_range(fd, start + done_pages * page_size, window_pages, vec);
+        if(error != 0) {
+            return error;
+        }
+        for (page_index = 0; page_index < window_pages; page_index++) {
+            if (vec[page_index]&1) {
+                ++*cached;
+            }
+        }
+        done_pages += window_pages;
+    }
+    return 0;
+}
+
+// Counts the cached and total pages of a range of an open file with a bounded vector.
+static int count_cached_pages(int fd, long long offset, long long length, long *cached, long *total) {
+    struct page_range range = {0, 0};
     unsigned char *mincore_vec;
+    size_t vec_pages;
+    int error;
+
+    *cached = 0;
+    *total = 0;
+
+    error = get_page_range(fd, offset, length, &range);
+    if(error != 0 || range.pages == 0) {
+        return error;
+    }
+
+    // cachestat() does not need any vector
+    vec_pages = range.pages < MAX_VEC_PAGES ? range.pages : MAX_VEC_PAGES;
+    mincore_vec = use_cachestat ? NULL : malloc(vec_pages);
+    if(!use_cachestat && mincore_vec == NULL) {
+        return ENOMEM;
+    }
+
+    error = count_cached_range(fd, range.start, range.pages, mincore_vec, vec_pages, cached);
+    if(error == 0) {
+        *total = range.pages;
+    }
+
+    free(mincore_vec);
+    return error;
+}
+
+static PyObject *cache_ratio(PyObject *self, PyObject *args, PyObject *kwargs) {
+    static char *kwlist[] = {"fd", "offset", "length", NULL};
+    int fd;
+    long long offset = 0;
+    long long length = 0;
+    long cached;
+    long total;
     struct stat file_stat;
-    ssize_t page_size = getpagesize();
-    size_t page_index;
-    ssize_t vec_size;
+    int error;
 
-    // Validate and convert argument of FD
-    if(!PyArg_ParseTuple(args, "i", &fd)) {
+    // Validate and convert argument of FD and the optional range
+    if(!PyArg_ParseTupleAndKeywords(args, kwargs, "i|LL", kwlist, &fd, &offset, &length)) {
         return NULL;
     }
 
@@ -35,42 +207,369 @@ static PyObject *cache_ratio(PyObject *self, PyObject *args) {
         return NULL;
     }
 
-    file_mmap = mmap((void *)0, file_stat.st_size, PROT_NONE, MAP_SHARED, fd, 0);
+    Py_BEGIN_ALLOW_THREADS
+    error = count_cached_pages(fd, offset, length, &cached, &total);
+    Py_END_ALLOW_THREADS
 
-    if(file_mmap == MAP_FAILED) {
-        PyErr_SetString(PyExc_IOError, "Could not mmap file");
+    if(error != 0) {
+        errno = error;
+        return PyErr_SetFromErrno(PyExc_OSError);
+    }
+
+    return Py_BuildValue("(ll)", cached, total);
+}
+
+// Returns the raw mincore() vector of the file as a bytes object, one byte per page.
+// The vector is written straight into the bytes buffer, so callers can check the
+// residency of many pages of the same file with a single mmap+mincore.
+static PyObject *cache_residency(PyObject *self, PyObject *args, PyObject *kwargs) {
+    static char *kwlist[] = {"fd", "offset", "length", NULL};
+    int fd;
+    long long offset = 0;
+    long long length = 0;
+    PyObject *mincore_vec;
+    struct stat file_stat;
+    struct page_range range = {0, 0};
+    int error;
+
+    // Validate and convert argument of FD and the optional range
+    if(!PyArg_ParseTupleAndKeywords(args, kwargs, "i|LL", kwlist, &fd, &offset, &length)) {
         return NULL;
     }
 
-    vec_size = (file_stat.st_size + page_size - 1) / page_size;
-    mincore_vec = calloc(1, vec_size);
+    if(fstat(fd, &file_stat) < 0) {
+        PyErr_SetString(PyExc_IOError, "Could not fstat file");
+        return NULL;
+    }
 
-    if(mincore_vec == NULL) {
-        return PyErr_NoMemory();
+    if ( file_stat.st_size == 0 ) {
+        PyErr_SetString(PyExc_IOError, "Cannot mmap zero size file");
+        return NULL;
+    }
+
+    error = get_page_range(fd, offset, length, &range);
+    if(error != 0) {
+        errno = error;
+        return PyErr_SetFromErrno(PyExc_OSError);
+    }
+
+    mincore_vec = PyBytes_FromStringAndSize(NULL, range.pages);
+    if(mincore_vec == NULL || range.pages == 0) {
+        return mincore_vec;
+    }
+
+    // The bytes object is not shared yet, so mincore() can fill it without the GIL
+    Py_BEGIN_ALLOW_THREADS
+    error = mincore_range(fd, range.start, range.pages, (unsigned char *)PyBytes_AS_STRING(mincore_vec));
+    Py_END_ALLOW_THREADS
+
+    if(error != 0) {
+        Py_DECREF(mincore_vec);
+        errno = error;
+        return PyErr_SetFromErrno(PyExc_OSError);
     }
 
-    if(mincore(file_mmap, file_stat.st_size, mincore_vec) != 0) {
-        PyErr_SetString(PyExc_OSError, "Could not call mincore for file");
+    return mincore_vec;
+}
+
+// Walks the range in fixed windows of window_size bytes and returns the cached pages of
+// every window. Only a vector of one window is allocated whatever the file size is.
+static PyObject *cache_scan(PyObject *self, PyObject *args, PyObject *kwargs) {
+    static char *kwlist[] = {"fd", "window_size", "offset", "length", NULL};
+    int fd;
+    long long window_size;
+    long long offset = 0;
+    long long length = 0;
+    size_t page_size = getpagesize();
+    struct page_range range = {0, 0};
+    size_t window_pages;
+    size_t vec_pages;
+    size_t windows;
+    size_t window_index;
+    unsigned char *mincore_vec = NULL;
+    long *cached = NULL;
+    PyObject *result;
+    int error;
+
+    if(!PyArg_ParseTupleAndKeywords(args, kwargs, "iL|LL", kwlist, &fd, &window_size, &offset, &length)) {
         return NULL;
     }
 
-    int cached = 0;
-    for (page_index = 0; page_index <= file_stat.st_size/page_size; page_index++) {
-        if (mincore_vec[page_index]&1) {
-            ++cached;
+    if(window_size <= 0) {
+        PyErr_SetString(PyExc_ValueError, "window_size must be greater than 0");
+        return NULL;
+    }
+
+    error = get_page_range(fd, offset, length, &range);
+    if(error != 0) {
+        errno = error;
+        return PyErr_SetFromErrno(PyExc_OSError);
+    }
+
+    window_pages = (window_size + page_size - 1) / page_size;
+    windows = (range.pages + window_pages - 1) / window_pages;
+    vec_pages = window_pages < MAX_VEC_PAGES ? window_pages : MAX_VEC_PAGES;
+
+    mincore_vec = use_cachestat ? NULL : malloc(vec_pages);
+    cached = PyMem_Calloc(windows + 1, sizeof(long));
+    if((!use_cachestat && mincore_vec == NULL) || cached == NULL) {
+        free(mincore_vec);
+        PyMem_Free(cached);
+        return PyErr_NoMemory();
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    for (window_index = 0; window_index < windows; window_index++) {
+        size_t done_pages = window_index * window_pages;
+        size_t pages = range.pages - done_pages < window_pages ? range.pages - done_pages : window_pages;
+        error = count_cached_range(fd, range.start + done_pages * page_size, pages, mincore_vec, vec_pages, &cached[window_index]);
+        if(error != 0) {
+            break;
         }
     }
+    Py_END_ALLOW_THREADS
 
     free(mincore_vec);
-    munmap(file_mmap, file_stat.st_size);
+    if(error != 0) {
+        PyMem_Free(cached);
+        errno = error;
+        return PyErr_SetFromErrno(PyExc_OSError);
+    }
+
+    result = PyList_New(windows);
+    if(result != NULL) {
+        for (window_index = 0; window_index < windows; window_index++) {
+            PyObject *value = PyLong_FromLong(cached[window_index]);
+            if(value == NULL) {
+                Py_CLEAR(result);
+                break;
+            }
+            PyList_SET_ITEM(result, window_index, value);
+        }
+    }
+    PyMem_Free(cached);
+    return result;
+}
+
+// Same as ratio() for many files in one call, the items can be file descriptors or paths.
+// All the probing happens with the GIL released, a failing item returns None instead of
+// raising so one vanished file does not discard the results of the whole batch.
+static PyObject *cache_ratio_batch(PyObject *self, PyObject *args) {
+    PyObject *items;
+    PyObject *sequence;
+    PyObject *result = NULL;
+    PyObject **paths = NULL;
+    int *fds = NULL;
+    long *cached = NULL;
+    long *total = NULL;
+    int *errors = NULL;
+    Py_ssize_t items_count;
+    Py_ssize_t index;
+
+    if(!PyArg_ParseTuple(args, "O", &items)) {
+        return NULL;
+    }
+
+    sequence = PySequence_Fast(items, "ratio_batch() expects a sequence of fds or paths");
+    if(sequence == NULL) {
+        return NULL;
+    }
+    items_count = PySequence_Fast_GET_SIZE(sequence);
+
+    paths = PyMem_Calloc(items_count + 1, sizeof(PyObject *));
+    fds = PyMem_Calloc(items_count + 1, sizeof(int));
+    cached = PyMem_Calloc(items_count + 1, sizeof(long));
+    total = PyMem_Calloc(items_count + 1, sizeof(long));
+    errors = PyMem_Calloc(items_count + 1, sizeof(int));
+    if(paths == NULL || fds == NULL || cached == NULL || total == NULL || errors == NULL) {
+        PyErr_NoMemory();
+        goto done;
+    }
 
-    int total_pages = (int)ceil( (double)file_stat.st_size / (double)page_size );
-    return Py_BuildValue("(ii)", cached, total_pages);
+    // Convert every item while holding the GIL, paths are kept as bytes objects
+    for (index = 0; index < items_count; index++) {
+        PyObject *item = PySequence_Fast_GET_ITEM(sequence, index);
+        if(PyLong_Check(item)) {
+            long fd = PyLong_AsLong(item);
+            if(fd == -1 && PyErr_Occurred()) {
+                goto done;
+            }
+            // A truncated value would be another, valid, fd
+            if(fd > INT_MAX || fd < INT_MIN) {
+                PyErr_SetString(PyExc_OverflowError, "fd is out of the int range");
+                goto done;
+            }
+            fds[index] = (int)fd;
+        } else if(!PyUnicode_FSConverter(item, &paths[index])) {
+            goto done;
+        }
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    for (index = 0; index < items_count; index++) {
+        int fd = fds[index];
+        if(paths[index] != NULL) {
+            fd = open(PyBytes_AS_STRING(paths[index]), O_RDONLY | O_CLOEXEC);
+            if(fd < 0) {
+                errors[index] = errno;
+                continue;
+            }
+        }
+        errors[index] = count_cached_pages(fd, 0, 0, &cached[index], &total[index]);
+        // Same as ratio(), an empty file can't be mapped so it fails instead of (0, 0)
+        if(errors[index] == 0 && total[index] == 0) {
+            errors[index] = EINVAL;
+        }
+        if(paths[index] != NULL) {
+            close(fd);
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    result = PyList_New(items_count);
+    if(result == NULL) {
+        goto done;
+    }
+    for (index = 0; index < items_count; index++) {
+        PyObject *value;
+        if(errors[index] != 0) {
+            Py_INCREF(Py_None);
+            value = Py_None;
+        } else {
+            value = Py_BuildValue("(ll)", cached[index], total[index]);
+            if(value == NULL) {
+                Py_CLEAR(result);
+                goto done;
+            }
+        }
+        PyList_SET_ITEM(result, index, value);
+    }
+
+done:
+    if(paths != NULL) {
+        for (index = 0; index < items_count; index++) {
+            Py_XDECREF(paths[index]);
+        }
+    }
+    PyMem_Free(paths);
+    PyMem_Free(fds);
+    PyMem_Free(cached);
+    PyMem_Free(total);
+    PyMem_Free(errors);
+    Py_DECREF(sequence);
+    return result;
+}
+
+// Returns the full cachestat() counters of the file or offset/length range,
+// only available with the cachestat backend.
+static PyObject *cache_stat(PyObject *self, PyObject *args, PyObject *kwargs) {
+    static char *kwlist[] = {"fd", "offset", "length", NULL};
+    int fd;
+    long long offset = 0;
+    long long length = 0;
+    struct page_range range = {0, 0};
+    struct cachestat cstat = {0, 0, 0, 0, 0};
+    int error;
+
+    if(!PyArg_ParseTupleAndKeywords(args, kwargs, "i|LL", kwlist, &fd, &offset, &length)) {
+        return NULL;
+    }
+
+    if(!cachestat_supported) {
+        errno = ENOSYS;
+        return PyErr_SetFromErrno(PyExc_OSError);
+    }
+
+    error = get_page_range(fd, offset, length, &range);
+    if(error == 0 && range.pages > 0) {
+        Py_BEGIN_ALLOW_THREADS
+        error = call_cachestat(fd, range.start, range.pages * getpagesize(), &cstat);
+        Py_END_ALLOW_THREADS
+    }
+
+    if(error != 0) {
+        errno = error;
+        return PyErr_SetFromErrno(PyExc_OSError);
+    }
+
+    return Py_BuildValue(
+        "{s:K,s:K,s:K,s:K,s:K}",
+        "cached", cstat.nr_cache,
+        "dirty", cstat.nr_dirty,
+        "writeback", cstat.nr_writeback,
+        "evicted", cstat.nr_evicted,
+        "recently_evicted", cstat.nr_recently_evicted
+    );
+}
+
+// Python does not expose sync_file_range(), used to start the writeback of a probe
+// page without waiting for it nor flushing the file metadata.
+static PyObject *cache_sync_file_range(PyObject *self, PyObject *args) {
+    int fd;
+    long long offset;
+    long long nbytes;
+    unsigned int flags;
+    int result;
+
+    if(!PyArg_ParseTuple(args, "iLLI", &fd, &offset, &nbytes, &flags)) {
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    result = sync_file_range(fd, offset, nbytes, flags);
+    Py_END_ALLOW_THREADS
+
+    if(result != 0) {
+        return PyErr_SetFromErrno(PyExc_OSError);
+    }
+
+    Py_RETURN_NONE;
+}
+
+static PyObject *cache_backend(PyObject *self, PyObject *args) {
+    return PyUnicode_FromString(use_cachestat ? "cachestat" : "mincore");
+}
+
+static PyObject *cache_set_backend(PyObject *self, PyObject *args) {
+    const char *backend;
+
+    if(!PyArg_ParseTuple(args, "s", &backend)) {
+        return NULL;
+    }
+
+    if(strcmp(backend, "mincore") == 0) {
+        use_cachestat = 0;
+    } else if(strcmp(backend, "cachestat") == 0) {
+        if(!cachestat_supported) {
+            PyErr_SetString(PyExc_OSError, "cachestat() is not supported by the running kernel");
+            return NULL;
+        }
+        use_cachestat = 1;
+    } else {
+        PyErr_Format(PyExc_ValueError, "Unknown backend: %s", backend);
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
 }
 
 static PyMethodDef CacheMethods[] = {
-    {"ratio",  cache_ratio, METH_VARARGS,
-     "Get cached and total pages."},
+    {"ratio",  (PyCFunction)cache_ratio, METH_VARARGS | METH_KEYWORDS,
+     "Get cached and total pages, optionally of the offset/length range only."},
+    {"residency",  (PyCFunction)cache_residency, METH_VARARGS | METH_KEYWORDS,
+     "Get the mincore() vector of the file or offset/length range, one byte per page."},
+    {"scan",  (PyCFunction)cache_scan, METH_VARARGS | METH_KEYWORDS,
+     "Get the cached pages of every window_size window of the file or offset/length range."},
+    {"ratio_batch",  cache_ratio_batch, METH_VARARGS,
+     "Get cached and total pages of many fds or paths, None for the ones that failed."},
+    {"stat",  (PyCFunction)cache_stat, METH_VARARGS | METH_KEYWORDS,
+     "Get the cachestat() counters of the file or offset/length range."},
+    {"sync_file_range",  cache_sync_file_range, METH_VARARGS,
+     "Call sync_file_range(fd, offset, nbytes, flags)."},
+    {"backend",  cache_backend, METH_NOARGS,
+     "Get the active backend, cachestat or mincore."},
+    {"set_backend",  cache_set_backend, METH_VARARGS,
+     "Set the active backend, cachestat or mincore."},
     {NULL, NULL, 0, NULL}        /* Sentinel */
 };
 
@@ -85,5 +584,21 @@ static struct PyModuleDef cachemodule = {
 
 PyMODINIT_FUNC PyInit_cache(void)
 {
-    return PyModule_Create(&cachemodule);
+    PyObject *module;
+
+    cachestat_supported = detect_cachestat();
+    use_cachestat = cachestat_supported;
+
+    module = PyModule_Create(&cachemodule);
+    if(module == NULL) {
+        return NULL;
+    }
+
+    if(PyModule_AddIntConstant(module, "SYNC_FILE_RANGE_WAIT_BEFORE", SYNC_FILE_RANGE_WAIT_BEFORE) < 0 ||
+       PyModule_AddIntConstant(module, "SYNC_FILE_RANGE_WRITE", SYNC_FILE_RANGE_WRITE) < 0 ||
+       PyModule_AddIntConstant(module, "SYNC_FILE_RANGE_WAIT_AFTER", SYNC_FILE_RANGE_WAIT_AFTER) < 0) {
+        Py_DECREF(module);
+        return NULL;
+    }
+    return module;
 };
@@ -0,0 +1,223 @@
+import logging
+import os
+import time
+import zlib
+from collections import deque
+from time import sleep
+
+import cache
+from pagecache.clock import get_next_tick
+
+logger = logging.getLogger(__name__)
+
+# Maps every mincore() byte to 1 if the page is resident and 0 otherwise
+RESIDENT = bytes(page & 1 for page in range(256))
+# From empty to fully cached range
+HEATMAP_CHARS = " .:-=+*#%@"
+# Numeric fields of a report sent to the metric sinks, prefixed with target_
+REPORTED_FIELDS = (
+    "pages",
+    "cached_ratio",
+    "loaded_pages",
+    "evicted_pages",
+    "churn_ratio",
+)
+NANOSECONDS = 1000000000
+
+
+def xor_bitmaps(bitmap, other):
+    """
+    Returns the pages which changed between two bitmaps of the same length
+    """
+    return (
+        int.from_bytes(bitmap, "little") ^ int.from_bytes(other, "little")
+    ).to_bytes(len(bitmap), "little")
+
+
+def resize_bitmap(bitmap, pages):
+    """
+    Truncates or pads with not cached pages a bitmap, files grow and shrink between ticks
+    """
+    if len(bitmap) >= pages:
+        return bitmap[:pages]
+    return bitmap + bytes(pages - len(bitmap))
+
+
+def format_heatmap(ratios):
+    """
+    Returns one character per range, from " " (not cached) to "@" (fully cached)
+    """
+    return "".join(
+        HEATMAP_CHARS[min(int(ratio * len(HEATMAP_CHARS)), len(HEATMAP_CHARS) - 1)]
+        for ratio in ratios
+    )
+
+
+class TrackedFile(object):
+    def __init__(self, path, history):
+        self.path = path
+        # Residency of every page of the last tick, one byte with 0 or 1 per page
+        self.bitmap = b""
+        # (timestamp, pages, zlib compressed xor with the previous bitmap), newest last
+        self.diffs = deque(maxlen=history)
+
+
+class TargetFileTracker(object):
+    """
+    Tracks which ranges of real files (e.g. active Kafka segments and indexes) stay cached.
+    Every tick reads the residency of each file with a single mmap+mincore and reports the
+    cached ratio of `ranges` equal ranges of the file and the churn since the previous tick.
+    Only the compressed xor with the previous bitmap is kept in the history, which is
+    mostly zeros and compresses to a few bytes per GB.
+    Example of a report:
+        {"path": "/data/kafka/topic-0/00000000000000012345.log", "pages": 262144,
+         "cached_ratio": 0.41, "loaded_pages": 12, "evicted_pages": 2048,
+         "churn_ratio": 0.0079, "heatmap": "      .:=#@@@@", "range_cached_ratios": [...]}
+    """
+
+    def __init__(self, paths, interval_seconds=5, ranges=16, history=60):
+        self.interval_seconds = interval_seconds
+        self.ranges = ranges
+        self.files = [TrackedFile(path, history) for path in paths]
+        self.last_update_time = None
+        # Sinks of the reports, shared with the probe monitor when both run.
+        # Reports are printed unless they are sent to DogStatsD or NDJSON
+        self.statsd = None
+        self.prometheus_exporter = None
+        self.ndjson_sink = None
+
+    def _read_bitmap(self, path):
+        fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        try:
+            if os.fstat(fd).st_size == 0:
+                return b""
+            return cache.residency(fd).translate(RESIDENT)
+        finally:
+            os.close(fd)
+
+    def _get_range_cached_ratios(self, bitmap):
+        pages = len(bitmap)
+        ranges = min(self.ranges, pages)
+        ratios = []
+        for idx in range(ranges):
+            start, end = idx * pages // ranges, (idx + 1) * pages // ranges
+            ratios.append(round(bitmap.count(1, start, end) / (end - start), 4))
+        return ratios
+
+    def _update_file(self, tracked_file, now):
+        try:
+            bitmap = self._read_bitmap(tracked_file.path)
+        except OSError as error:
+            logger.warning(
+                "Can't read residency of {}: {}".format(tracked_file.path, error)
+            )
+            return None
+        pages = len(bitmap)
+        previous = resize_bitmap(tracked_file.bitmap, pages)
+        diff = xor_bitmaps(bitmap, previous)
+        tracked_file.bitmap = bitmap
+        tracked_file.diffs.append((now, pages, zlib.compress(diff, 1)))
+
+        cached = bitmap.count(1)
+        changed = diff.count(1)
+        # Loaded minus evicted pages is the change of cached pages
+        loaded = (changed + cached - previous.count(1)) // 2
+        range_cached_ratios = self._get_range_cached_ratios(bitmap)
+        return {
+            "path": tracked_file.path,
+            "pages": pages,
+            "cached_ratio": round(cached / pages, 4) if pages else 0.0,
+            "loaded_pages": loaded,
+            "evicted_pages": changed - loaded,
+            "churn_ratio": round(changed / pages, 4) if pages else 0.0,
+            "heatmap": format_heatmap(range_cached_ratios),
+            "range_cached_ratios": range_cached_ratios,
+        }
+
+    def update(self):
+        """
+        Takes a new residency bitmap of every file and returns their reports,
+        files which can't be read are skipped
+        """
+        now = time.time_ns()
+        self.last_update_time = now
+        reports = []
+        for tracked_file in self.files:
+            report = self._update_file(tracked_file, now)
+            if report is not None:
+                reports.append(report)
+        return reports
+
+    def get_bitmaps(self, path):
+        """
+        Yields (timestamp, bitmap) of the history of a file from newest to oldest,
+        rebuilt from the last bitmap and the compressed diffs. Pages truncated from the
+        file are rebuilt as not cached
+        """
+        for tracked_file in self.files:
+            if tracked_file.path != path:
+                continue
+            bitmap = tracked_file.bitmap
+            for idx in range(len(tracked_file.diffs) - 1, -1, -1):
+                timestamp, pages, diff = tracked_file.diffs[idx]
+                bitmap = resize_bitmap(bitmap, pages)
+                yield timestamp, bitmap
+                bitmap = xor_bitmaps(bitmap, zlib.decompress(diff))
+
+    def report(self, reports, flush=True):
+        """
+        Sends the reports through the configured sinks, tagged by file, the cached ratio
+        of every range is also tagged by range. Without flush the DogStatsD gauges are
+        only queued, to be sent together with the metrics of the probe monitor sharing
+        the sink
+        """
+        for report in reports:
+            labels = {"target_file": report["path"]}
+            metrics = {
+                "target_{}".format(field): report[field] for field in REPORTED_FIELDS
+            }
+            range_labels = [
+                {"target_file": report["path"], "range": idx}
+                for idx in range(len(report["range_cached_ratios"]))
+            ]
+            if self.prometheus_exporter is not None:
+                self.prometheus_exporter.update_gauges(metrics, labels)
+                for range_label, ratio in zip(
+                    range_labels, report["range_cached_ratios"]
+                ):
+                    self.prometheus_exporter.update_gauges(
+                        {"target_range_cached_ratio": ratio}, range_label
+                    )
+            if self.statsd is not None:
+                tags = ["target_file:{}".format(report["path"])]
+                for name, value in metrics.items():
+                    self.statsd.gauge("pagecache_ttl.{}".format(name), value, tags=tags)
+                for idx, ratio in enumerate(report["range_cached_ratios"]):
+                    self.statsd.gauge(
+                        "pagecache_ttl.target_range_cached_ratio",
+                        ratio,
+                        tags=tags + ["range:{}".format(idx)],
+                    )
+            if self.ndjson_sink is not None:
+                record = {"timestamp": self.last_update_time / NANOSECONDS}
+                record.update(report)
+                self.ndjson_sink.write(record)
+            if self.statsd is None and self.ndjson_sink is None:
+                print(report)
+        if self.statsd is not None and flush:
+            self.statsd.flush()
+
+    def run_once(self):
+        self.report(self.update())
+
+    def run(self):
+        """
+        Main loop which will live until the process gets a Signal
+        """
+        next_tick = time.monotonic()
+        while True:
+            self.run_once()
+            next_tick = get_next_tick(
+                next_tick, self.interval_seconds, time.monotonic()
+            )
+            sleep(max(0, next_tick - time.monotonic()))
@@ -0,0 +1,145 @@
+import math
+from array import array
+from collections import deque
+
+# Log spaced histogram bins of the readings (in seconds), 1ms to ~115 days
+# with ~12% of relative error
+BINS_PER_DECADE = 20
+MIN_BIN_VALUE = 0.001
+BINS = 10 * BINS_PER_DECADE + 1
+
+
+def get_bin(value):
+    if value <= MIN_BIN_VALUE:
+        return 0
+    return min(int(math.log10(value / MIN_BIN_VALUE) * BINS_PER_DECADE) + 1, BINS - 1)
+
+
+def get_bin_value(idx):
+    """
+    Geometric middle of the bin idx
+    """
+    if idx == 0:
+        return MIN_BIN_VALUE
+    return MIN_BIN_VALUE * 10 ** ((idx - 0.5) / BINS_PER_DECADE)
+
+
+def format_window(seconds):
+    """
+    Returns the name of a window, e.g. 60 -> "1m", 3600 -> "1h"
+    """
+    for unit, unit_seconds in (("h", 3600), ("m", 60)):
+        if seconds % unit_seconds == 0:
+            return "{}{}".format(seconds // unit_seconds, unit)
+    return "{}s".format(seconds)
+
+
+class RollingWindow(object):
+    """
+    Readings of the last `seconds` kept in fixed size array ring buffers.
+    Aggregates are updated incrementally when a reading is added or expires:
+    min and max with monotonic deques, percentiles with a histogram of log spaced bins,
+    so adding a reading and querying it costs O(1) amortized.
+    """
+
+    def __init__(self, seconds, capacity):
+        self.window_ns = int(seconds * 1000000000)
+        self.capacity = capacity
+        self.timestamps = array("q", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.bins = array("q", bytes(8 * BINS))
+        # Position of the oldest reading and number of readings
+        self.start = 0
+        self.count = 0
+        # (timestamp, value) with increasing values for the min and decreasing for the max
+        self.min_deque = deque()
+        self.max_deque = deque()
+
+    def _expire_oldest(self):
+        timestamp = self.timestamps[self.start]
+        self.bins[get_bin(self.values[self.start])] -= 1
+        if self.min_deque and self.min_deque[0][0] == timestamp:
+            self.min_deque.popleft()
+        if self.max_deque and self.max_deque[0][0] == timestamp:
+            self.max_deque.popleft()
+        self.start = (self.start + 1) % self.capacity
+        self.count -= 1
+
+    def add(self, timestamp, value):
+        """
+        Adds a reading, timestamps are in nanoseconds and must be increasing
+        """
+        cutoff = timestamp - self.window_ns
+        while self.count and (
+            self.count == self.capacity or self.timestamps[self.start] <= cutoff
+        ):
+            self._expire_oldest()
+
+        position = (self.start + self.count) % self.capacity
+        self.timestamps[position] = timestamp
+        self.values[position] = value
+        self.bins[get_bin(value)] += 1
+        self.count += 1
+        while self.min_deque and self.min_deque[-1][1] >= value:
+            self.min_deque.pop()
+        self.min_deque.append((timestamp, value))
+        while self.max_deque and self.max_deque[-1][1] <= value:
+            self.max_deque.pop()
+        self.max_deque.append((timestamp, value))
+
+    def percentile(self, ratio):
+        """
+        Approximated by the histogram, clamped to the min and max
+        """
+        rank = ratio * (self.count - 1)
+        seen = 0
+        for idx, bin_count in enumerate(self.bins):
+            seen += bin_count
+            if seen > rank:
+                break
+        value = get_bin_value(idx)
+        return min(max(value, self.min_deque[0][1]), self.max_deque[0][1])
+
+    def summary(self):
+        if not self.count:
+            return None
+        return {
+            "min": self.min_deque[0][1],
+            "p50": self.percentile(0.50),
+            "p99": self.percentile(0.99),
+            "max": self.max_deque[0][1],
+        }
+
+
+class TTLStatsStore(object):
+    """
+    Fixed memory store of the min cached time readings of every iteration with rolling
+    statistics over several windows.
+    Example of summary() with windows (60, 3600):
+        {"1m": {"min": 30.2, "p50": 41.0, "p99": 52.3, "max": 52.9}, "1h": {...}}
+    """
+
+    def __init__(self, windows, interval_seconds):
+        self.windows = {
+            format_window(seconds): RollingWindow(
+                seconds, math.ceil(seconds / interval_seconds) + 1
+            )
+            for seconds in windows
+        }
+
+    def add(self, timestamp, value):
+        for window in self.windows.values():
+            window.add(timestamp, value)
+
+    def summary(self):
+        return {name: window.summary() for name, window in self.windows.items()}
+
+    def get_metrics(self, name):
+        """
+        Returns the statistics as flat metrics, e.g. {"<name>_1m_p99": 52.3, ...}
+        """
+        metrics = {}
+        for window_name, window in self.windows.items():
+            for stat, value in (window.summary() or {}).items():
+                metrics["{}_{}_{}".format(name, window_name, stat)] = value
+        return metrics
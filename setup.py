@@ -32,6 +32,7 @@ setup(
     author_email="storage@adevinta.com",
     packages=find_packages(include=["pagecache"]),
     install_requires=get_install_requirements("requirements/requirements.txt"),
+    extras_require={"simulate": ["numpy"]},
     test_suite="tests",
     zip_safe=False,
     entry_points={"console_scripts": ["pagecache=pagecache.cli:main"]},
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+from unittest.mock import Mock, patch
+
+from pagecache.aio import AsyncPageCacheMonitor, run_monitors
+from pagecache.pagecache_monitor import PageCacheMonitor
+
+
+def test_async_iterator(tmp_path):
+    pcm = PageCacheMonitor(str(tmp_path), 0.01, 120, "var/log/pagecache.log")
+
+    async def collect():
+        results = []
+        async for metrics in AsyncPageCacheMonitor(pcm):
+            results.append(metrics)
+            if len(results) == 3:
+                break
+        return results
+
+    results = asyncio.run(collect())
+    assert [sorted(metrics) for metrics in results] == [["min_cached_time"]] * 3
+    assert len(pcm.probe_index) == 3
+
+
+def test_cancel_waits_for_iteration(tmp_path):
+    pcm = PageCacheMonitor(str(tmp_path), 1, 120, "var/log/pagecache.log")
+    started = threading.Event()
+    release = threading.Event()
+    tick = pcm._tick
+
+    def slow_tick():
+        started.set()
+        release.wait()
+        return tick()
+
+    pcm._tick = slow_tick
+
+    async def cancel():
+        loop = asyncio.get_running_loop()
+        task = asyncio.ensure_future(AsyncPageCacheMonitor(pcm).tick())
+        await loop.run_in_executor(None, started.wait)
+        task.cancel()
+        loop.call_later(0.05, release.set)
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(cancel())
+    # The cancelled iteration finished before the task was done
+    assert len(pcm.probe_index) == 1
+
+
+def test_run_monitors(tmp_path):
+    monitors = []
+    for idx in range(3):
+        tmp_dir = tmp_path / "disk{}".format(idx)
+        tmp_dir.mkdir()
+        monitors.append(
+            PageCacheMonitor(
+                str(tmp_dir),
+                0.01,
+                120,
+                "var/log/pagecache.log",
+                tags={"tmp_dir": str(tmp_dir)},
+            )
+        )
+
+    async def run():
+        results = []
+        task = asyncio.ensure_future(run_monitors(monitors, results.append))
+        while len({metrics["tmp_dir"] for metrics in results}) < 3:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return results
+
+    results = asyncio.run(run())
+    assert {metrics["tmp_dir"] for metrics in results} == {
+        monitor.tmp_directory for monitor in monitors
+    }
+
+
+def test_tick_same_as_run_once(tmp_path):
+    pcm = PageCacheMonitor(
+        str(tmp_path),
+        1,
+        120,
+        "var/log/pagecache.log",
+        profile=True,
+        profile_every_ticks=1,
+    )
+    pcm.target_tracker = Mock()
+    pcm.target_tracker.update.return_value = []
+
+    # Target files and profile dumps as in the synchronous loop, not reported
+    with patch.object(PageCacheMonitor, "_dump_profile") as mock_dump_profile, patch(
+        "builtins.print"
+    ) as mock_print:
+        metrics = asyncio.run(AsyncPageCacheMonitor(pcm).tick())
+    assert "min_cached_time" in metrics
+    pcm.target_tracker.update.assert_called_once_with()
+    pcm.target_tracker.report.assert_not_called()
+    mock_dump_profile.assert_called_once_with()
+    mock_print.assert_not_called()
+
+    # Reported through the sinks of the monitor
+    with patch.object(PageCacheMonitor, "_dump_profile"), patch(
+        "builtins.print"
+    ) as mock_print:
+        asyncio.run(AsyncPageCacheMonitor(pcm, report=True).tick())
+    pcm.target_tracker.report.assert_called_once_with([], flush=False)
+    mock_print.assert_called_once()
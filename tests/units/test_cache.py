@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+import cache
+
+
+def test_residency(tmp_path):
+    probe_file = tmp_path / "probe"
+    probe_file.write_bytes(b"x" * (os.sysconf("SC_PAGE_SIZE") * 3))
+
+    fd = os.open(probe_file, os.O_RDONLY)
+    mincore_vec = cache.residency(fd)
+    os.close(fd)
+
+    # One entry per page, just written pages are in the page cache
+    assert isinstance(mincore_vec, bytes)
+    assert len(mincore_vec) == 3
+    assert all(page & 1 for page in mincore_vec)
+
+
+def test_ratio_batch(tmp_path):
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    one_page_file = tmp_path / "one_page"
+    one_page_file.write_bytes(b"x" * page_size)
+    two_pages_file = tmp_path / "two_pages"
+    two_pages_file.write_bytes(b"x" * (page_size + 1))
+    empty_file = tmp_path / "empty"
+    empty_file.touch()
+
+    fd = os.open(two_pages_file, os.O_RDONLY)
+    ratios = cache.ratio_batch(
+        [
+            str(one_page_file),
+            fd,
+            bytes(empty_file),
+            str(tmp_path / "does_not_exist"),
+        ]
+    )
+    os.close(fd)
+
+    # Paths and fds can be mixed, failing items are reported as None
+    # An empty file fails like in ratio()
+    assert ratios == [(1, 1), (2, 2), None, None]
+    with open(empty_file) as fd, pytest.raises(IOError):
+        cache.ratio(fd.fileno())
+    with pytest.raises(OverflowError):
+        cache.ratio_batch([2**32 + 1])
+
+
+def test_ratio_range(tmp_path):
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    probe_file = tmp_path / "probe"
+    # Size is an exact multiple of the page size
+    probe_file.write_bytes(b"x" * (page_size * 8))
+
+    fd = os.open(probe_file, os.O_RDONLY)
+    assert cache.ratio(fd) == (8, 8)
+    # Range from the 4th page until the end of the file
+    assert cache.ratio(fd, page_size * 3) == (5, 5)
+    # Unaligned ranges cover every page they touch
+    assert cache.ratio(fd, offset=100, length=page_size) == (2, 2)
+    # Range out of the file
+    assert cache.ratio(fd, page_size * 100) == (0, 0)
+    assert len(cache.residency(fd, page_size * 2, page_size * 3)) == 3
+    os.close(fd)
+
+
+def test_scan(tmp_path):
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    probe_file = tmp_path / "probe"
+    probe_file.write_bytes(b"x" * (page_size * 10 + 1))
+
+    fd = os.open(probe_file, os.O_RDONLY)
+    # Cached pages of every window, the last one is partial
+    assert cache.scan(fd, page_size * 4) == [4, 4, 3]
+    assert cache.scan(fd, page_size * 3, offset=page_size, length=page_size * 5) == [
+        3,
+        2,
+    ]
+    os.close(fd)
+
+
+def test_backend(tmp_path):
+    backend = cache.backend()
+    assert backend in ("cachestat", "mincore")
+
+    probe_file = tmp_path / "probe"
+    probe_file.write_bytes(b"x" * (os.sysconf("SC_PAGE_SIZE") * 2))
+    fd = os.open(probe_file, os.O_RDONLY)
+    try:
+        # Both backends report the same cached pages
+        cache.set_backend("mincore")
+        assert cache.ratio(fd) == (2, 2)
+        if backend == "cachestat":
+            cache.set_backend("cachestat")
+            assert cache.ratio(fd) == (2, 2)
+            assert cache.stat(fd)["cached"] == 2
+        else:
+            with pytest.raises(OSError):
+                cache.stat(fd)
+        with pytest.raises(ValueError):
+            cache.set_backend("unknown")
+    finally:
+        os.close(fd)
+        cache.set_backend(backend)
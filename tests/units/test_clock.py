@@ -0,0 +1,25 @@
+import time
+from unittest.mock import patch
+
+from pagecache.clock import ProbeClock, get_next_tick
+
+
+def test_probe_clock_ignores_clock_steps():
+    with patch.object(time, "time_ns", return_value=1693739406000000000), patch.object(
+        time, "monotonic_ns", return_value=5000000000
+    ):
+        clock = ProbeClock()
+        assert clock.time_ns() == 1693739406000000000
+
+    # The wall clock steps back, the probe ids keep following the monotonic clock
+    with patch.object(time, "time_ns", return_value=1693739000000000000), patch.object(
+        time, "monotonic_ns", return_value=6000000000
+    ):
+        assert clock.time_ns() == 1693739407000000000
+
+
+def test_get_next_tick():
+    assert get_next_tick(100.0, 5, 101.0) == 105.0
+    # A stall of 12 seconds skips the missed ticks instead of running them back to back
+    assert get_next_tick(100.0, 5, 117.0) == 120.0
+    assert get_next_tick(100.0, 0.5, 100.7) == 101.0
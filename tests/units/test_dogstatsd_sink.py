@@ -0,0 +1,61 @@
+import socket
+
+from pagecache.dogstatsd_sink import DogStatsDSink
+
+
+def receive_all(server):
+    packets = []
+    try:
+        while True:
+            packets.append(server.recv(65536))
+    except BlockingIOError:
+        return packets
+
+
+def test_flush_udp():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    sink = DogStatsDSink("127.0.0.1:{}".format(server.getsockname()[1]), 64)
+
+    sink.gauge("pagecache_ttl.min_cached_time_seconds", 15.0, tags=["tmp_dir:/data1"])
+    sink.gauge("pagecache_ttl.tick_probes", 12)
+    sink.gauge("pagecache_ttl.tick_syscalls", 80)
+    assert sink.flush() == 2
+    server.settimeout(1)
+    packets = [server.recv(65536), server.recv(65536)]
+    server.close()
+    sink.close()
+
+    # Metrics are coalesced up to the max packet size
+    assert packets == [
+        b"pagecache_ttl.min_cached_time_seconds:15.0|g|#tmp_dir:/data1",
+        b"pagecache_ttl.tick_probes:12|g\npagecache_ttl.tick_syscalls:80|g",
+    ]
+    assert sink.lines == []
+
+
+def test_flush_uds(tmp_path):
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    server.bind(str(tmp_path / "dsd.socket"))
+    server.setblocking(False)
+    sink = DogStatsDSink("unix://{}".format(tmp_path / "dsd.socket"))
+
+    for idx in range(100):
+        sink.gauge("pagecache_ttl.metric_{}".format(idx), idx)
+    assert sink.flush() == 1
+    assert receive_all(server)[0].count(b"\n") == 99
+
+    # The agent does not read, the socket buffer fills up without blocking
+    for _ in range(10000):
+        sink.gauge("pagecache_ttl.min_cached_time_seconds", 15.0)
+        sink.flush()
+    assert sink.dropped_packets > 0
+    server.close()
+    sink.close()
+
+
+def test_flush_agent_down(tmp_path):
+    sink = DogStatsDSink("unix://{}".format(tmp_path / "missing.socket"))
+    sink.gauge("pagecache_ttl.min_cached_time_seconds", 15.0)
+    assert sink.flush() == 0
+    assert sink.dropped_packets == 1
@@ -0,0 +1,36 @@
+from pagecache.eviction_curve import (
+    fit_survival_curve,
+    get_eviction_age,
+    get_eviction_ages,
+)
+
+
+def test_fit_survival_curve():
+    # Out of order evictions are pooled so the curve never increases with the age
+    assert fit_survival_curve([1, 2, 3, 4, 5, 6], [1, 1, 0, 1, 0, 0]) == [
+        (1.5, 1.0),
+        (3.5, 0.5),
+        (5.5, 0.0),
+    ]
+    assert fit_survival_curve([], []) == []
+    # Runs of probes with the same residency are pooled as one block
+    assert fit_survival_curve([1, 2, 3, 4, 5], [1, 1, 1, 0, 0]) == [
+        (2.0, 1.0),
+        (4.5, 0.0),
+    ]
+    assert fit_survival_curve([1, 2, 3, 4], [0, 0, 1, 1]) == [(2.5, 0.5)]
+
+
+def test_get_eviction_age():
+    curve = [(1.5, 1.0), (3.5, 0.5), (5.5, 0.0)]
+    assert get_eviction_age(curve, 0.5) == 3.5
+    assert round(get_eviction_age(curve, 0.9), 4) == 5.1
+    # Nothing evicted yet
+    assert get_eviction_age([(1.0, 1.0)], 0.5) is None
+
+
+def test_get_eviction_ages():
+    ages = get_eviction_ages([1, 2, 3, 4, 5, 6], [1, 1, 0, 1, 0, 0])
+    assert ages[0.5] == 3.5
+    assert round(ages[0.99], 4) == 5.46
+    assert get_eviction_ages([1, 2], [1, 1]) == {0.5: None, 0.9: None, 0.99: None}
@@ -0,0 +1,57 @@
+import os
+
+from pagecache.inventory import CacheInventory, batch_paths, walk_files
+
+
+def create_tree(tmp_path):
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    (tmp_path / "topic-0" / "nested").mkdir(parents=True)
+    (tmp_path / "topic-1").mkdir()
+    sizes = {
+        "topic-0/00000000000000000000.log": 3,
+        "topic-0/nested/00000000000000000000.index": 1,
+        "topic-1/00000000000000000000.log": 2,
+        "empty": 0,
+    }
+    for name, pages in sizes.items():
+        (tmp_path / name).write_bytes(b"x" * (page_size * pages))
+    # Symlinks are not followed
+    os.symlink(tmp_path / "topic-1", tmp_path / "link")
+    return sizes
+
+
+def test_walk_files(tmp_path):
+    sizes = create_tree(tmp_path)
+    assert sorted(walk_files(str(tmp_path))) == sorted(
+        str(tmp_path / name) for name in sizes
+    )
+    assert list(batch_paths(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+def test_scan(tmp_path):
+    create_tree(tmp_path)
+    inventory = CacheInventory(str(tmp_path), top=2, workers=2, batch_size=1)
+
+    progress = inventory.scan()
+    # Empty files can't be probed, they are skipped like the vanished ones
+    assert progress["files"] == 3
+    assert progress["cached_pages"] == 6
+
+    # Just written files are cached
+    assert inventory.get_top_files() == [
+        {
+            "path": str(tmp_path / "topic-0/00000000000000000000.log"),
+            "cached_pages": 3,
+            "total_pages": 3,
+        },
+        {
+            "path": str(tmp_path / "topic-1/00000000000000000000.log"),
+            "cached_pages": 2,
+            "total_pages": 2,
+        },
+    ]
+    # Directories include their subdirectories
+    assert inventory.get_top_directories() == [
+        {"path": str(tmp_path), "cached_pages": 6},
+        {"path": str(tmp_path / "topic-0"), "cached_pages": 4},
+    ]
@@ -0,0 +1,56 @@
+import io
+import sys
+
+from pagecache.multi_monitor import MultiDirectoryMonitor
+from pagecache.pagecache_monitor import PageCacheMonitor
+
+
+def build_monitors(tmp_path, count):
+    monitors = []
+    for idx in range(count):
+        tmp_dir = tmp_path / "disk{}".format(idx)
+        tmp_dir.mkdir()
+        monitors.append(
+            PageCacheMonitor(
+                str(tmp_dir),
+                1,
+                120,
+                "var/log/pagecache.log",
+                tags={"tmp_dir": str(tmp_dir)},
+            )
+        )
+    return monitors
+
+
+def test_get_schedule(tmp_path):
+    multi_monitor = MultiDirectoryMonitor(build_monitors(tmp_path, 4), 2)
+
+    # Iterations are spread evenly over the interval
+    assert sorted(multi_monitor._get_schedule(100.0)) == [
+        (100.0, 0),
+        (100.5, 1),
+        (101.0, 2),
+        (101.5, 3),
+    ]
+
+
+def test_run_once(tmp_path):
+    monitors = build_monitors(tmp_path, 2)
+    multi_monitor = MultiDirectoryMonitor(monitors, 1, prometheus_port=0)
+    try:
+        captured_stdout = io.StringIO()
+        sys.stdout = captured_stdout
+        assert len(multi_monitor.run_once()) == 2
+        sys.stdout = sys.__stdout__
+    finally:
+        multi_monitor.prometheus_exporter.stop()
+
+    # Every directory has its probe and its metrics are tagged
+    body = multi_monitor.prometheus_exporter.body.decode()
+    for monitor in monitors:
+        tmp_dir = monitor.tmp_directory
+        assert len(monitor.probe_index) == 1
+        assert "'tmp_dir': '{}'".format(tmp_dir) in captured_stdout.getvalue()
+        assert 'pagecache_ttl_live_probes{{tmp_dir="{}"}} 1'.format(tmp_dir) in body
+    # Every family is declared once
+    assert body.count("# TYPE pagecache_ttl_live_probes gauge") == 1
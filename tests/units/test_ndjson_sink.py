@@ -0,0 +1,75 @@
+import json
+import os
+import socket
+import sys
+from unittest.mock import patch
+
+from pagecache.ndjson_sink import NDJSONSink
+
+
+def test_write_file(tmp_path):
+    output = tmp_path / "metrics.ndjson"
+    sink = NDJSONSink(str(output), max_buffer_bytes=64, flush_every_ticks=2)
+
+    sink.write({"min_cached_time": 15.0})
+    # Buffered until flush_every_ticks records
+    assert output.read_bytes() == b""
+    sink.write({"min_cached_time": 16.0})
+    assert (
+        output.read_bytes() == b'{"min_cached_time":15.0}\n{"min_cached_time":16.0}\n'
+    )
+
+    # Records which do not fit in the buffer are dropped
+    sink.write({"min_cached_time": 17.0, "padding": "x" * 64})
+    assert sink.dropped_records == 1
+    sink.close()
+
+
+def test_write_unix_socket_backpressure(tmp_path):
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(str(tmp_path / "ndjson.socket"))
+    server.listen(1)
+    sink = NDJSONSink("unix://{}".format(tmp_path / "ndjson.socket"), 4096)
+    # Connected on the first write
+    sink.write({"min_cached_time": 15.0, "tick": 0})
+    connection, _ = server.accept()
+
+    # The reader does not read, the socket and the buffer fill up without blocking
+    for idx in range(1, 100000):
+        sink.write({"min_cached_time": 15.0, "tick": idx})
+    assert sink.dropped_records > 0
+    assert len(sink.buffer) <= 4096
+
+    # Every record received is complete
+    connection.setblocking(False)
+    received = b""
+    try:
+        while True:
+            received += connection.recv(65536)
+    except BlockingIOError:
+        pass
+    lines = received.split(b"\n")[:-1]
+    assert [json.loads(line)["tick"] for line in lines[:2]] == [0, 1]
+    connection.close()
+    server.close()
+    sink.close()
+
+
+def test_write_stdout_pipe():
+    read_fd, write_fd = os.pipe()
+    try:
+        with patch.object(sys.stdout, "fileno", return_value=write_fd):
+            sink = NDJSONSink("-", max_buffer_bytes=4096)
+        # STDOUT itself is left blocking, the sink writes through its own description
+        assert os.get_blocking(write_fd)
+
+        # Nobody reads the pipe, it fills up without blocking
+        for idx in range(100000):
+            sink.write({"min_cached_time": 15.0, "tick": idx})
+        assert sink.dropped_records > 0
+        assert os.get_blocking(write_fd)
+        sink.close()
+        assert os.read(read_fd, 64).startswith(b'{"min_cached_time":15.0,"tick":0}\n')
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
@@ -1,25 +1,25 @@
 # import pytest
 
 import io
+import json
+import os
 import sys
-import time
 from pathlib import Path
 from unittest.mock import Mock, call, patch
 
-from datadog import statsd
-from mock_open import MockOpen
-
 import cache
-from pagecache.pagecache_monitor import PageCacheMonitor
+from pagecache.clock import ProbeClock
+from pagecache.pagecache_monitor import PageCacheMonitor, parse_probe_name
+from pagecache.prometheus_exporter import PrometheusExporter
 
 EXISTING_FILES = [
-    1693739406,
-    1693739405,
-    1693739404,
-    1693739403,
-    1693739402,
-    1693739349,
-    1693739348,
+    1693739406000000000,
+    1693739405000000000,
+    1693739404000000000,
+    1693739403000000000,
+    1693739402000000000,
+    1693739349000000000,
+    1693739348000000000,
 ]
 
 
@@ -33,7 +33,7 @@ def test_create_new_file(tmp_path):
 
     # Create object and test _create_new_file()
     pcm = PageCacheMonitor(pagecache_tmp_dir, 1, 5, "var/log/pagecache.log")
-    with patch.object(time, "time", return_value=filename):
+    with patch.object(ProbeClock, "time_ns", return_value=int(filename)):
         pcm._create_new_file()
 
     # Check if file exists and has the expected content
@@ -59,38 +59,54 @@ def test_delete_files(tmp_path):
     pcm._delete_files(EXISTING_FILES, index_to_start_deletion)
 
     # Check the existing files after deletion
-    assert pcm._get_existing_files() == EXISTING_FILES[:index_to_start_deletion]
+    assert list(pcm._get_existing_files()) == EXISTING_FILES[:index_to_start_deletion]
 
 
-def test_get_first_expired_file():
+def test_get_first_expired_file(tmp_path):
     max_time_window_seconds = 60
-    current_ts = 1693739410
+    current_ts = 1693739410000000000
 
-    # 1693739349, 1693739348 already expired
-    pcm = PageCacheMonitor("/tmp", 1, max_time_window_seconds, "var/log/pagecache.log")
+    # 1693739349000000000, 1693739348000000000 already expired
+    pcm = PageCacheMonitor(
+        str(tmp_path), 1, max_time_window_seconds, "var/log/pagecache.log"
+    )
     first_expired_file = pcm._get_first_expired_file(EXISTING_FILES, current_ts)
 
-    # First expired in position 5  (1693739410 - 60 = 1693739350)
-    assert first_expired_file == (5, 1693739349)
+    # First expired in position 5  (1693739410000000000 - 60 = 1693739350000000000)
+    assert first_expired_file == (5, 1693739349000000000)
 
     # Not expired file
     max_time_window_seconds = 120
-    pcm = PageCacheMonitor("/tmp", 1, max_time_window_seconds, "var/log/pagecache.log")
+    pcm = PageCacheMonitor(
+        str(tmp_path), 1, max_time_window_seconds, "var/log/pagecache.log"
+    )
     first_expired_file = pcm._get_first_expired_file(EXISTING_FILES, current_ts)
     assert first_expired_file == (-1, None)
 
 
-def test_get_first_not_cached_file():
-    first_not_cached_file = 1693739403
-    # If 1693739403 is not cached it must be deleted adn all the next iems on the list
-    pcm = PageCacheMonitor("/tmp", 1, 120, "var/log/pagecache.log")
+def test_get_first_not_cached_file(tmp_path):
+    first_not_cached_file = 1693739403000000000
+    # If 1693739403000000000 is not cached it must be deleted adn all the next iems on the list
+    pcm = PageCacheMonitor(str(tmp_path), 1, 120, "var/log/pagecache.log")
 
     # First not cached file is at index 3
     with patch.object(
-        cache, "ratio", side_effect=[(1, 1), (1, 1), (1, 1), (0, 0)]
-    ), patch("builtins.open", MockOpen()):
-        # First not cached file is at index 3
-        assert pcm._get_first_not_cached_file(EXISTING_FILES) == (
+        cache, "ratio_batch", return_value=[(1, 1), (1, 1), (1, 1), (0, 1), (1, 1)]
+    ) as mock_ratio_batch:
+        assert pcm._get_first_not_cached_file(EXISTING_FILES[:5]) == (
+            3,
+            first_not_cached_file,
+        )
+    # All the files are probed in a single call
+    mock_ratio_batch.assert_called_once_with(
+        ["{}/{}".format(tmp_path, file) for file in EXISTING_FILES[:5]]
+    )
+
+    # A file which could not be probed is handled as not cached
+    with patch.object(
+        cache, "ratio_batch", return_value=[(1, 1), (1, 1), (1, 1), None, (1, 1)]
+    ):
+        assert pcm._get_first_not_cached_file(EXISTING_FILES[:5]) == (
             3,
             first_not_cached_file,
         )
@@ -98,9 +114,9 @@ def test_get_first_not_cached_file():
     # non-cached file not found
     with patch.object(
         cache,
-        "ratio",
-        side_effect=[(1, 1), (1, 1), (1, 1), (1, 1), (1, 1), (1, 1), (1, 1)],
-    ), patch("builtins.open", MockOpen()):
+        "ratio_batch",
+        return_value=[(1, 1), (1, 1), (1, 1), (1, 1), (1, 1), (1, 1), (1, 1)],
+    ):
         assert pcm._get_first_not_cached_file(EXISTING_FILES) == (-1, None)
 
 
@@ -116,10 +132,10 @@ def test_get_existing_files(tmp_path):
     ]
 
     pcm = PageCacheMonitor(pagecache_tmp_dir, 1, 120, "var/log/pagecache.log")
-    assert pcm._get_existing_files() == EXISTING_FILES
+    assert list(pcm._get_existing_files()) == EXISTING_FILES
 
 
-def test_balance_files():
+def test_balance_files(tmp_path):
     idx_to_start_deletion = 2
 
     with patch.object(
@@ -132,7 +148,7 @@ def test_balance_files():
         mock_called_methods.attach_mock(mock_delete_files, "_delete_files")
         mock_called_methods.attach_mock(mock_create_new_file, "_create_new_file")
 
-        pcm = PageCacheMonitor("/tmp", 1, 120, "var/log/pagecache.log")
+        pcm = PageCacheMonitor(str(tmp_path), 1, 120, "var/log/pagecache.log")
         pcm._balance_files(idx_to_start_deletion, EXISTING_FILES)
 
         # Make sure _delete_files() and _create_new_file are called in a sorted mode
@@ -145,8 +161,8 @@ def test_balance_files():
         )
 
 
-def test_get_index_to_start_deletion():
-    current_ts = 1693739410
+def test_get_index_to_start_deletion(tmp_path):
+    current_ts = 1693739410000000000
 
     with patch.object(
         PageCacheMonitor, "_get_first_expired_file"
@@ -154,12 +170,12 @@ def test_get_index_to_start_deletion():
         PageCacheMonitor, "_get_first_not_cached_file"
     ) as mock_get_first_not_cached_file:
         # First text first_expired_file is the smallest idx
-        first_expired_file = (2, 1693739404)
-        first_not_cached_file = (3, 1693739403)
+        first_expired_file = (2, 1693739404000000000)
+        first_not_cached_file = (3, 1693739403000000000)
         mock_get_first_expired_file.return_value = first_expired_file
         mock_get_first_not_cached_file.return_value = first_not_cached_file
 
-        pcm = PageCacheMonitor("/tmp", 1, 120, "var/log/pagecache.log")
+        pcm = PageCacheMonitor(str(tmp_path), 1, 120, "var/log/pagecache.log")
         index_to_start_deletion = pcm._get_index_to_start_deletion(
             EXISTING_FILES, current_ts
         )
@@ -167,12 +183,12 @@ def test_get_index_to_start_deletion():
         assert index_to_start_deletion == first_expired_file[0]
 
         # Second text first_not_cached_file is the smallest idx
-        first_expired_file = (3, 1693739403)
-        first_not_cached_file = (1, 1693739405)
+        first_expired_file = (3, 1693739403000000000)
+        first_not_cached_file = (1, 1693739405000000000)
         mock_get_first_expired_file.return_value = first_expired_file
         mock_get_first_not_cached_file.return_value = first_not_cached_file
 
-        pcm = PageCacheMonitor("/tmp", 1, 120, "var/log/pagecache.log")
+        pcm = PageCacheMonitor(str(tmp_path), 1, 120, "var/log/pagecache.log")
         index_to_start_deletion = pcm._get_index_to_start_deletion(
             EXISTING_FILES, current_ts
         )
@@ -180,12 +196,12 @@ def test_get_index_to_start_deletion():
         assert index_to_start_deletion == first_not_cached_file[0]
 
         # Third text first_not_cached_file not found
-        first_expired_file = (3, 1693739403)
+        first_expired_file = (3, 1693739403000000000)
         first_not_cached_file = (-1, None)
         mock_get_first_expired_file.return_value = first_expired_file
         mock_get_first_not_cached_file.return_value = first_not_cached_file
 
-        pcm = PageCacheMonitor("/tmp", 1, 120, "var/log/pagecache.log")
+        pcm = PageCacheMonitor(str(tmp_path), 1, 120, "var/log/pagecache.log")
         index_to_start_deletion = pcm._get_index_to_start_deletion(
             EXISTING_FILES, current_ts
         )
@@ -194,11 +210,11 @@ def test_get_index_to_start_deletion():
 
         # Fourth text first_expired_file not found
         first_expired_file = (-1, None)
-        first_not_cached_file = (3, 1693739403)
+        first_not_cached_file = (3, 1693739403000000000)
         mock_get_first_expired_file.return_value = first_expired_file
         mock_get_first_not_cached_file.return_value = first_not_cached_file
 
-        pcm = PageCacheMonitor("/tmp", 1, 120, "var/log/pagecache.log")
+        pcm = PageCacheMonitor(str(tmp_path), 1, 120, "var/log/pagecache.log")
         index_to_start_deletion = pcm._get_index_to_start_deletion(
             EXISTING_FILES, current_ts
         )
@@ -211,7 +227,7 @@ def test_get_index_to_start_deletion():
         mock_get_first_expired_file.return_value = first_expired_file
         mock_get_first_not_cached_file.return_value = first_not_cached_file
 
-        pcm = PageCacheMonitor("/tmp", 1, 120, "var/log/pagecache.log")
+        pcm = PageCacheMonitor(str(tmp_path), 1, 120, "var/log/pagecache.log")
         index_to_start_deletion = pcm._get_index_to_start_deletion(
             EXISTING_FILES, current_ts
         )
@@ -219,27 +235,31 @@ def test_get_index_to_start_deletion():
         assert index_to_start_deletion == -1
 
 
-def test_deliver_metrics_to_dogstatsd():
+def test_deliver_metrics_to_dogstatsd(tmp_path):
     min_cached_time = 15
     pcm = PageCacheMonitor(
-        "/tmp", 1, 120, "var/log/pagecache.log", send_metrics_to_dogstatsd=True
+        str(tmp_path), 1, 120, "var/log/pagecache.log", send_metrics_to_dogstatsd=True
     )
 
-    with patch.object(statsd, "gauge") as mock_statsd_gauge:
+    with patch.object(pcm.statsd, "gauge") as mock_statsd_gauge, patch.object(
+        pcm.statsd, "flush"
+    ) as mock_statsd_flush:
         pcm._deliver_metrics_to_dogstatsd(min_cached_time)
 
     # Check the method was called with the proper argument of min_cached_time
-    mock_statsd_gauge.assert_called_once_with(
-        pcm.dogstatsd_metric_name, min_cached_time
+    mock_statsd_gauge.assert_any_call(
+        pcm.dogstatsd_metric_name, min_cached_time, tags=None
     )
+    # All the metrics are sent at once
+    mock_statsd_flush.assert_called_once_with()
 
 
-def test_report_metric():
+def test_report_metric(tmp_path):
     # First test send_metrics_to_dogstatsd=True
     min_cached_time = 15
 
     pcm = PageCacheMonitor(
-        "/tmp", 1, 120, "var/log/pagecache.log", send_metrics_to_dogstatsd=True
+        str(tmp_path), 1, 120, "var/log/pagecache.log", send_metrics_to_dogstatsd=True
     )
 
     with patch.object(
@@ -251,7 +271,7 @@ def test_report_metric():
 
     # Second test only prints to STDOUT
     pcm = PageCacheMonitor(
-        "/tmp", 1, 120, "var/log/pagecache.log", send_metrics_to_dogstatsd=False
+        str(tmp_path), 1, 120, "var/log/pagecache.log", send_metrics_to_dogstatsd=False
     )
     with patch.object(
         PageCacheMonitor, "_deliver_metrics_to_dogstatsd"
@@ -265,3 +285,448 @@ def test_report_metric():
         assert captured_stdout.getvalue().strip() == "{{'{}': {}}}".format(
             "min_cached_time", min_cached_time
         )
+
+
+def test_tick_ring(tmp_path):
+    current_ts = 1693739410000000000
+
+    pcm = PageCacheMonitor(
+        str(tmp_path), 1, 120, "var/log/pagecache.log", probe_store="ring"
+    )
+    assert pcm.ring_probe_store.slots == 121
+
+    with patch.object(ProbeClock, "time_ns", return_value=current_ts), patch.object(
+        pcm.ring_probe_store,
+        "get_oldest_cached_probe",
+        return_value=current_ts - 7500000000,
+    ) as mock_get_oldest_cached_probe:
+        assert pcm._tick() == 7.5
+    mock_get_oldest_cached_probe.assert_called_once_with(current_ts, 120000000000)
+    assert pcm.ring_probe_store.timestamps[0] == current_ts
+
+
+def test_report_tick_metrics(tmp_path):
+    min_cached_time = 15
+    pcm = PageCacheMonitor(str(tmp_path), 1, 120, "var/log/pagecache.log")
+    pcm.tick_metrics = {"probe_dirty_pages": 2}
+
+    captured_stdout = io.StringIO()
+    sys.stdout = captured_stdout
+    pcm._report_metric(min_cached_time)
+    sys.stdout = sys.__stdout__
+    assert captured_stdout.getvalue().strip() == str(
+        {"min_cached_time": min_cached_time, "probe_dirty_pages": 2}
+    )
+
+    pcm = PageCacheMonitor(
+        str(tmp_path), 1, 120, "var/log/pagecache.log", send_metrics_to_dogstatsd=True
+    )
+    pcm.tick_metrics = {"probe_dirty_pages": 2}
+    with patch.object(pcm.statsd, "gauge") as mock_statsd_gauge, patch.object(
+        pcm.statsd, "flush"
+    ):
+        pcm._deliver_metrics_to_dogstatsd(min_cached_time)
+    mock_statsd_gauge.assert_has_calls(
+        [
+            call(pcm.dogstatsd_metric_name, min_cached_time, tags=None),
+            call("pagecache_ttl.probe_dirty_pages", 2, tags=None),
+        ]
+    )
+
+
+def test_get_first_not_cached_file_bisect(tmp_path):
+    pcm = PageCacheMonitor(
+        str(tmp_path),
+        1,
+        120,
+        "var/log/pagecache.log",
+        search_mode="bisect",
+        boundary_check_probes=2,
+    )
+
+    def ratio_batch(not_cached_files):
+        return lambda paths: [
+            (0, 1) if int(path.split("/")[-1]) in not_cached_files else (1, 1)
+            for path in paths
+        ]
+
+    # Files evicted in order from 1693739403000000000, found with a logarithmic number of calls
+    with patch.object(
+        cache, "ratio_batch", side_effect=ratio_batch(EXISTING_FILES[3:])
+    ) as mock_ratio_batch:
+        assert pcm._get_first_not_cached_file(EXISTING_FILES) == (
+            3,
+            1693739403000000000,
+        )
+    assert mock_ratio_batch.call_count <= 4
+
+    # 1693739402000000000 was evicted out of order, bisect lands on 1693739348000000000 but the
+    # bounded check before it finds the first not cached file
+    with patch.object(
+        cache,
+        "ratio_batch",
+        side_effect=ratio_batch([1693739402000000000, 1693739348000000000]),
+    ):
+        assert pcm._get_first_not_cached_file(EXISTING_FILES) == (
+            4,
+            1693739402000000000,
+        )
+
+    # Every file is cached
+    with patch.object(cache, "ratio_batch", side_effect=ratio_batch([])):
+        assert pcm._get_first_not_cached_file(EXISTING_FILES) == (-1, None)
+
+
+def test_probe_index_drift(tmp_path):
+    pagecache_tmp_dir = tmp_path / "pagecache/"
+    pagecache_tmp_dir.mkdir()
+    [
+        Path("{}/{}".format(pagecache_tmp_dir, str(file))).touch()
+        for file in EXISTING_FILES
+    ]
+    # Files which are not probes are ignored
+    Path("{}/lost+found".format(pagecache_tmp_dir)).mkdir()
+
+    pcm = PageCacheMonitor(pagecache_tmp_dir, 1, 120, "var/log/pagecache.log")
+
+    # New probes are indexed without listing the directory again
+    with patch.object(
+        ProbeClock, "time_ns", return_value=1693739407000000000
+    ), patch.object(os, "listdir") as mock_listdir:
+        pcm._create_new_file()
+        assert list(pcm._get_existing_files()) == [1693739407000000000] + EXISTING_FILES
+    mock_listdir.assert_not_called()
+
+    # A probe removed by somebody else makes the index to be reconciled
+    os.remove("{}/{}".format(pagecache_tmp_dir, EXISTING_FILES[-1]))
+    pcm._delete_files(pcm._get_existing_files(), 6)
+    assert pcm.probe_index_drift
+    assert list(pcm._get_existing_files()) == [1693739407000000000] + EXISTING_FILES[:5]
+    assert not pcm.probe_index_drift
+
+
+def test_create_new_file_same_clock_tick(tmp_path):
+    pagecache_tmp_dir = tmp_path / "pagecache/"
+    pagecache_tmp_dir.mkdir()
+
+    pcm = PageCacheMonitor(pagecache_tmp_dir, 0.1, 5, "var/log/pagecache.log")
+    with patch.object(ProbeClock, "time_ns", return_value=1693739406000000000):
+        pcm._create_new_file()
+        pcm._create_new_file()
+
+    # The second probe does not overwrite the first one
+    assert list(pcm._get_existing_files()) == [
+        1693739406000000001,
+        1693739406000000000,
+    ]
+    assert sorted(os.listdir(pagecache_tmp_dir)) == [
+        "1693739406000000000",
+        "1693739406000000001",
+    ]
+
+
+def test_reconcile_legacy_probe_names(tmp_path):
+    pagecache_tmp_dir = tmp_path / "pagecache/"
+    pagecache_tmp_dir.mkdir()
+    Path("{}/1693739405".format(pagecache_tmp_dir)).touch()
+    Path("{}/1693739406000000000".format(pagecache_tmp_dir)).touch()
+    # Entries which are not probes are left alone
+    (pagecache_tmp_dir / "1693739404").mkdir()
+    Path("{}/42".format(pagecache_tmp_dir)).touch()
+    os.symlink("1693739405", "{}/1693739403".format(pagecache_tmp_dir))
+
+    # Second based probes are renamed to nanoseconds
+    pcm = PageCacheMonitor(pagecache_tmp_dir, 1, 120, "var/log/pagecache.log")
+    assert list(pcm._get_existing_files()) == [
+        1693739406000000000,
+        1693739405000000000,
+    ]
+    assert sorted(os.listdir(pagecache_tmp_dir)) == [
+        "1693739403",
+        "1693739404",
+        "1693739405000000000",
+        "1693739406000000000",
+        "42",
+    ]
+
+
+def test_parse_probe_name():
+    assert parse_probe_name("1693739406") == 1693739406000000000
+    assert parse_probe_name("1693739406000000000") == 1693739406000000000
+    assert parse_probe_name("42") is None
+    assert parse_probe_name("99999999999999999999") is None
+    assert parse_probe_name("1693739406.state") is None
+
+
+def test_report_metric_prometheus(tmp_path):
+    pcm = PageCacheMonitor(str(tmp_path), 1, 120, "var/log/pagecache.log")
+    pcm.prometheus_exporter = Mock()
+    pcm.probe_index.reset(EXISTING_FILES)
+    pcm.last_tick_time = 1693739410000000000
+    pcm.oldest_cached_probe = 1693739348000000000
+
+    pcm._report_metric(62.0)
+    pcm.prometheus_exporter.update.assert_called_once_with(
+        62.0,
+        1693739410000000000,
+        pcm.probe_index,
+        1693739348000000000,
+        None,
+        {},
+        labels=None,
+    )
+
+
+def test_tick_profile(tmp_path):
+    pcm = PageCacheMonitor(str(tmp_path), 1, 120, "var/log/pagecache.log", profile=True)
+    pcm._tick()
+    pcm._tick()
+
+    # Phases and counters of the last iteration are reported as metrics, with their
+    # rolling p50 and p99
+    names = {
+        "phase_create_probe_seconds",
+        "phase_list_probes_seconds",
+        "phase_search_boundary_seconds",
+        "phase_checkpoint_seconds",
+        "tick_syscalls_estimated",
+        "tick_files_created",
+        "tick_probes",
+    }
+    assert set(pcm.tick_metrics) == names | {
+        "{}_{}".format(name, key) for name in names for key in ("p50", "p99")
+    }
+    assert pcm.tick_metrics["tick_probes"] == 2
+    assert pcm.profiler.ticks == 2
+
+
+def test_run_once(tmp_path):
+    pagecache_tmp_dir = tmp_path / "pagecache/"
+    pagecache_tmp_dir.mkdir()
+    [
+        Path("{}/{}".format(pagecache_tmp_dir, str(file))).touch()
+        for file in EXISTING_FILES
+    ]
+    pcm = PageCacheMonitor(pagecache_tmp_dir, 1, 120, "var/log/pagecache.log")
+
+    # The new probe and the 4 newest existing ones are cached
+    captured_stdout = io.StringIO()
+    sys.stdout = captured_stdout
+    with patch.object(
+        ProbeClock, "time_ns", return_value=1693739410000000000
+    ), patch.object(cache, "ratio_batch", return_value=[(1, 1)] * 5 + [(0, 1)] * 3):
+        assert pcm.run_once() == 7.0
+    sys.stdout = sys.__stdout__
+    assert captured_stdout.getvalue().strip() == "{'min_cached_time': 7.0}"
+    assert len([file for file in os.listdir(pagecache_tmp_dir) if file.isdigit()]) == 5
+
+
+def test_resume_from_checkpoint(tmp_path):
+    pagecache_tmp_dir = tmp_path / "pagecache/"
+    pagecache_tmp_dir.mkdir()
+    [
+        Path("{}/{}".format(pagecache_tmp_dir, str(file))).touch()
+        for file in EXISTING_FILES
+    ]
+    pcm = PageCacheMonitor(
+        pagecache_tmp_dir, 1, 120, "var/log/pagecache.log", checkpoint_every_ticks=1
+    )
+    with patch.object(
+        ProbeClock, "time_ns", return_value=1693739407000000000
+    ), patch.object(cache, "ratio_batch", return_value=[(1, 1)] * 8):
+        pcm._tick()
+
+    # A probe created after the checkpoint, then the monitor is restarted
+    Path("{}/1693739408000000000".format(pagecache_tmp_dir)).touch()
+    with patch.object(
+        ProbeClock, "time_ns", return_value=1693739409000000000
+    ), patch.object(os, "listdir") as mock_listdir:
+        pcm = PageCacheMonitor(
+            pagecache_tmp_dir,
+            1,
+            120,
+            "var/log/pagecache.log",
+            checkpoint_every_ticks=1,
+        )
+        assert list(pcm._get_existing_files()) == [1693739407000000000] + EXISTING_FILES
+    mock_listdir.assert_not_called()
+    assert pcm.oldest_cached_probe == EXISTING_FILES[-1]
+    assert pcm.first_evicted_probe is None
+
+    # The directory is reconciled once every checkpointed probe is expired
+    with patch.object(ProbeClock, "time_ns", return_value=1693739529000000000):
+        existing_files = list(pcm._get_existing_files())
+    assert existing_files == [1693739408000000000, 1693739407000000000] + EXISTING_FILES
+
+
+def test_resume_from_stale_checkpoint(tmp_path):
+    pcm = PageCacheMonitor(
+        str(tmp_path), 1, 120, "var/log/pagecache.log", checkpoint_every_ticks=1
+    )
+    for now in (1693739406000000000, 1693739407000000000, 1693739408000000000):
+        with patch.object(ProbeClock, "time_ns", return_value=now):
+            pcm._tick()
+
+    # A checkpointed probe is removed by somebody else before the restart
+    os.remove("{}/1693739407000000000".format(tmp_path))
+    pcm = PageCacheMonitor(
+        str(tmp_path), 1, 120, "var/log/pagecache.log", checkpoint_every_ticks=1
+    )
+    with patch.object(ProbeClock, "time_ns", return_value=1693739409000000000):
+        # The missing probe is not taken as evicted, the cached ones are still measured
+        assert pcm._tick() == 3.0
+    assert pcm.first_evicted_probe is None
+    assert list(pcm.probe_index) == [
+        1693739409000000000,
+        1693739408000000000,
+        1693739406000000000,
+    ]
+
+
+def test_tick_active_probes(tmp_path):
+    pcm = PageCacheMonitor(
+        str(tmp_path), 1, 120, "var/log/pagecache.log", active_probes=True
+    )
+    assert pcm.active_monitor.tmp_directory == str(tmp_path / "active")
+    assert pcm.active_monitor.promote_probes
+
+    with patch.object(ProbeClock, "time_ns", return_value=1693739406000000000):
+        pcm._tick()
+    with patch.object(ProbeClock, "time_ns", return_value=1693739408000000000):
+        pcm._tick()
+
+    # Both probe classes are tracked separately
+    assert sorted(os.listdir(tmp_path)) == [
+        "1693739406000000000",
+        "1693739408000000000",
+        "active",
+    ]
+    assert list(pcm.active_monitor.probe_index) == [
+        1693739408000000000,
+        1693739406000000000,
+    ]
+    assert pcm.tick_metrics["active_min_cached_time"] == 2.0
+
+
+def test_tick_stats_windows(tmp_path):
+    pcm = PageCacheMonitor(
+        str(tmp_path), 1, 120, "var/log/pagecache.log", stats_windows=(60,)
+    )
+    with patch.object(ProbeClock, "time_ns", return_value=1693739406000000000):
+        pcm._tick()
+    with patch.object(ProbeClock, "time_ns", return_value=1693739408000000000):
+        assert pcm._tick() == 2.0
+
+    assert pcm.tick_metrics["min_cached_time_1m_min"] == 0.0
+    assert pcm.tick_metrics["min_cached_time_1m_max"] == 2.0
+
+
+def test_adaptive_thin_probes(tmp_path):
+    now = 1693739410000000000
+    # Ages of 1, 2, 3, 4, 8 and 10 seconds
+    probes = [now - age * 1000000000 for age in (1, 2, 3, 4, 8, 10)]
+    [Path("{}/{}".format(tmp_path, str(probe))).touch() for probe in probes]
+    pcm = PageCacheMonitor(
+        str(tmp_path), 1, 120, "var/log/pagecache.log", adaptive_error=0.5
+    )
+
+    assert pcm._get_probes_to_thin(pcm.probe_index, now) == [probes[2]]
+    pcm._thin_probes(pcm.probe_index, now)
+    assert list(pcm.probe_index) == probes[:2] + probes[3:]
+    assert not os.path.exists("{}/{}".format(tmp_path, probes[2]))
+
+    # The interval follows the min cached time within its bounds
+    pcm._update_interval(10.0)
+    assert pcm.current_interval_seconds == 5.0
+    pcm._update_interval(1.0)
+    assert pcm.current_interval_seconds == 1
+    pcm._update_interval(3600.0)
+    assert pcm.current_interval_seconds == 60
+
+
+def test_adaptive_bounded_probes(tmp_path):
+    pcm = PageCacheMonitor(
+        str(tmp_path), 1, 3600, "var/log/pagecache.log", adaptive_error=0.1
+    )
+    now = 1693739410000000000
+    # Nothing is evicted, the probes are created every interval
+    for tick in range(500):
+        with patch.object(ProbeClock, "time_ns", return_value=now):
+            pcm._tick()
+        now += int(pcm.current_interval_seconds * 1000000000)
+
+    # ~1 / adaptive_error probes at the current interval plus the log spaced older ones
+    assert pcm.current_interval_seconds == 60
+    assert len(pcm.probe_index) < 60
+
+
+def test_tick_proc_estimator(tmp_path):
+    pcm = PageCacheMonitor(
+        str(tmp_path), 1, 120, "var/log/pagecache.log", proc_estimator=True
+    )
+    pcm._tick()
+    assert "inactive_file_kb" in pcm.tick_metrics
+
+
+def test_report_metric_ndjson(tmp_path):
+    output = tmp_path / "metrics.ndjson"
+    pcm = PageCacheMonitor(
+        str(tmp_path), 1, 120, "var/log/pagecache.log", ndjson_output=str(output)
+    )
+    pcm.probe_index.reset(EXISTING_FILES)
+    pcm.last_tick_time = 1693739410000000000
+    pcm.oldest_cached_probe = 1693739348000000000
+
+    pcm._report_metric(62.0)
+    assert json.loads(output.read_text()) == {
+        "timestamp": 1693739410.0,
+        "min_cached_time": 62.0,
+        "live_probes": 7,
+        "oldest_cached_probe": 1693739348.0,
+        "first_evicted_probe": None,
+    }
+
+    # The sinks are independent, NDJSON is written along with DogStatsD
+    pcm.send_metrics_to_dogstatsd = True
+    with patch.object(
+        PageCacheMonitor, "_deliver_metrics_to_dogstatsd"
+    ) as mock_deliver_metrics_to_dogstatsd, patch("builtins.print") as mock_print:
+        pcm._report_metric(63.0)
+    mock_deliver_metrics_to_dogstatsd.assert_called_once_with(63.0)
+    mock_print.assert_not_called()
+    pcm.ndjson_sink.close()
+    records = output.read_text().splitlines()
+    assert len(records) == 2
+    assert json.loads(records[1])["min_cached_time"] == 63.0
+
+
+def test_tick_eviction_curve(tmp_path):
+    [Path("{}/{}".format(tmp_path, str(file))).touch() for file in EXISTING_FILES]
+    pcm = PageCacheMonitor(
+        str(tmp_path), 1, 120, "var/log/pagecache.log", eviction_curve=True
+    )
+
+    # Ages of 0, 4, 5, 6, 7, 8, 61 and 62 seconds, the probe of 7 seconds evicted early
+    with patch.object(
+        ProbeClock, "time_ns", return_value=1693739410000000000
+    ), patch.object(
+        cache,
+        "ratio_batch",
+        return_value=[(1, 1)] * 4 + [(0, 1), (1, 1), (0, 1), (0, 1)],
+    ):
+        assert pcm._tick() == 6.0
+
+    assert pcm.tick_metrics["evicted_50_age_seconds"] == 7.5
+    assert round(pcm.tick_metrics["evicted_90_age_seconds"], 4) == 50.7
+    assert round(pcm.tick_metrics["evicted_99_age_seconds"], 4) == 60.42
+    # Evicted probes are kept until they expire as the tail of the curve
+    assert len(pcm.probe_index) == 8
+    assert pcm.first_evicted_probe == EXISTING_FILES[3]
+
+    # Only the cached probes are reported as live
+    pcm.prometheus_exporter = PrometheusExporter(age_buckets=(5, 60))
+    pcm._report_metric(6.0)
+    lines = pcm.prometheus_exporter.body.decode().splitlines()
+    assert "pagecache_ttl_live_probes 4" in lines
+    assert 'pagecache_ttl_cached_probe_age_seconds_bucket{le="+Inf"} 4' in lines
+    assert pcm.get_record(6.0)["live_probes"] == 4
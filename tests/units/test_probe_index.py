@@ -0,0 +1,44 @@
+from pagecache.probe_index import ProbeIndex, count_newer_probes
+
+PROBES = [1693739402, 1693739403, 1693739404, 1693739405, 1693739406]
+
+
+def test_newest_first_order():
+    probe_index = ProbeIndex([1693739404, 1693739402, 1693739403])
+    probe_index.append(1693739405)
+
+    assert len(probe_index) == 4
+    assert list(probe_index) == [1693739405, 1693739404, 1693739403, 1693739402]
+    assert probe_index[0] == 1693739405
+    assert probe_index[-1] == 1693739402
+    assert probe_index[1:3] == [1693739404, 1693739403]
+    assert probe_index.newest() == 1693739405
+    assert ProbeIndex().newest() is None
+
+
+def test_trim():
+    probe_index = ProbeIndex(PROBES)
+
+    # Removes the two oldest probes
+    probe_index.trim(3)
+    assert list(probe_index) == [1693739406, 1693739405, 1693739404]
+    assert probe_index[-1] == 1693739404
+
+    # The array is compacted once half of it is unused
+    probe_index.trim(2)
+    assert list(probe_index) == [1693739406, 1693739405]
+    assert len(probe_index._probes) == 2
+
+    probe_index.append(1693739407)
+    probe_index.trim(0)
+    assert list(probe_index) == []
+    assert probe_index.newest() is None
+
+
+def test_count_newer_probes():
+    probe_index = ProbeIndex(PROBES)
+
+    assert count_newer_probes(probe_index, 1693739404) == 3
+    assert count_newer_probes(probe_index, 1693739407) == 0
+    assert count_newer_probes(probe_index, 0) == 5
+    assert count_newer_probes(ProbeIndex(), 1693739407) == 0
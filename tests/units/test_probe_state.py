@@ -0,0 +1,42 @@
+import os
+from unittest.mock import patch
+
+from pagecache.probe_index import ProbeIndex
+from pagecache.probe_state import ProbeStateCheckpoint
+
+PROBES = [1693739406000000000, 1693739405000000000, 1693739404000000000]
+
+
+def test_save_and_load(tmp_path):
+    checkpoint = ProbeStateCheckpoint(str(tmp_path))
+    probe_index = ProbeIndex(PROBES)
+    probe_index.trim(2)
+    with patch.object(os, "fsync", wraps=os.fsync) as mock_fsync:
+        checkpoint.save(probe_index, 1693739407000000000, PROBES[1], None)
+    # The file before the rename and the directory after it
+    assert mock_fsync.call_count == 2
+    assert os.listdir(tmp_path) == [ProbeStateCheckpoint.FILENAME]
+
+    loaded_index = ProbeIndex()
+    assert checkpoint.load(loaded_index) == (1693739407000000000, PROBES[1], None)
+    assert list(loaded_index) == PROBES[:2]
+
+
+def test_load_invalid(tmp_path):
+    checkpoint = ProbeStateCheckpoint(str(tmp_path))
+    probe_index = ProbeIndex(PROBES)
+
+    # Missing checkpoint
+    assert checkpoint.load(probe_index) is None
+
+    # Truncated checkpoint
+    checkpoint.save(probe_index, 1693739407000000000, PROBES[-1], None)
+    with open(checkpoint.path, "r+b") as fd:
+        fd.truncate(40)
+    assert checkpoint.load(probe_index) is None
+
+    # Another layout
+    with open(checkpoint.path, "wb") as fd:
+        fd.write(b"X" * 64)
+    assert checkpoint.load(probe_index) is None
+    assert list(probe_index) == PROBES
@@ -0,0 +1,54 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+import cache
+from pagecache.probe_writer import (
+    WRITE_STRATEGIES,
+    measure_write_strategies,
+    sync_probe,
+    write_probe_file,
+)
+
+
+def test_write_probe_file(tmp_path):
+    for write_strategy in WRITE_STRATEGIES:
+        probe_file = tmp_path / write_strategy
+        write_probe_file(str(probe_file), b"1693739406000000000", write_strategy)
+        assert probe_file.read_bytes() == b"1693739406000000000"
+
+    # Promoted probes are read back twice
+    with patch.object(os, "pread", wraps=os.pread) as mock_pread:
+        write_probe_file(str(tmp_path / "active"), b"1693739406000000000", "none", True)
+    assert mock_pread.call_count == 2
+    assert (tmp_path / "active").read_bytes() == b"1693739406000000000"
+
+
+def test_sync_probe():
+    with patch.object(os, "fsync") as mock_fsync, patch.object(
+        os, "fdatasync"
+    ) as mock_fdatasync, patch.object(cache, "sync_file_range") as mock_sync_range:
+        sync_probe(3, 0, 4096, "fsync")
+        sync_probe(3, 0, 4096, "fdatasync")
+        sync_probe(3, 4096, 4096, "sync_file_range")
+        sync_probe(3, 0, 4096, "none")
+
+    mock_fsync.assert_called_once_with(3)
+    mock_fdatasync.assert_called_once_with(3)
+    mock_sync_range.assert_called_once_with(3, 4096, 4096, cache.SYNC_FILE_RANGE_WRITE)
+
+    with pytest.raises(ValueError):
+        sync_probe(3, 0, 4096, "unknown")
+
+
+def test_measure_write_strategies(tmp_path):
+    report = measure_write_strategies(str(tmp_path), samples=2)
+
+    assert list(report) == list(WRITE_STRATEGIES)
+    for cost in report.values():
+        assert cost["mean_ms"] <= cost["max_ms"]
+        # A written page is always cached right after the write
+        assert cost["cached_ratio"] == 1.0
+    # Measurement files are removed
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from pagecache.proc_estimator import ProcEstimator
+
+PAGE_SIZE_KB = os.sysconf("SC_PAGE_SIZE") // 1024
+MEMINFO = """MemTotal:       16329940 kB
+Active(anon):    1204312 kB
+Inactive(anon):   112340 kB
+Active(file):    3000000 kB
+Inactive(file):  {} kB
+"""
+VMSTAT = """nr_free_pages 102400
+workingset_refault_anon 0
+workingset_refault_file {}
+pgsteal_kswapd 900
+pgsteal_direct 100
+pgscan_kswapd 1000
+pgscan_direct 200
+pgscan_file {}
+pgsteal_file {}
+"""
+
+
+def write_proc(proc_root, inactive_file_pages, refaults, pgscan, pgsteal):
+    (proc_root / "meminfo").write_text(
+        MEMINFO.format(inactive_file_pages * PAGE_SIZE_KB)
+    )
+    (proc_root / "vmstat").write_text(VMSTAT.format(refaults, pgscan, pgsteal))
+
+
+def test_sample(tmp_path):
+    write_proc(tmp_path, 100000, 10, 5000, 4000)
+    estimator = ProcEstimator(str(tmp_path))
+
+    # Rates need two samples
+    assert estimator.sample(1000000000) == {
+        "inactive_file_kb": 100000 * PAGE_SIZE_KB,
+        "active_file_kb": 3000000,
+    }
+
+    # The files are kept open and read again
+    write_proc(tmp_path, 100000, 30, 15000, 14000)
+    metrics = estimator.sample(3000000000)
+    assert metrics["pgscan_per_second"] == 5000.0
+    assert metrics["pgsteal_per_second"] == 5000.0
+    assert metrics["workingset_refault_per_second"] == 10.0
+    # 100000 inactive pages stolen at 5000 pages per second
+    assert metrics["estimated_inactive_ttl_seconds"] == pytest.approx(20.0)
+    estimator.close()
+
+
+def test_sample_older_kernel(tmp_path):
+    # Kernels without the file counters, the kswapd and direct counters are added
+    (tmp_path / "meminfo").write_text(MEMINFO.format(1000))
+    (tmp_path / "vmstat").write_text(
+        "workingset_refault 5\npgsteal_kswapd 900\npgsteal_direct 100\n"
+        "pgscan_kswapd 1000\npgscan_direct 200\n"
+    )
+    estimator = ProcEstimator(str(tmp_path))
+    assert estimator._read_counters() == {
+        "inactive_file_kb": 1000,
+        "active_file_kb": 3000000,
+        "pgscan": 1200,
+        "pgsteal": 1000,
+        "workingset_refault": 5,
+    }
+    estimator.close()
+
+
+def test_sample_proc():
+    estimator = ProcEstimator()
+    estimator.sample(1000000000)
+    assert "inactive_file_kb" in estimator.sample(2000000000)
+    estimator.close()
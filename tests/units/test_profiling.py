@@ -0,0 +1,58 @@
+from unittest.mock import patch
+
+from pagecache import profiling
+from pagecache.profiling import TickProfiler
+
+
+def test_disabled_profiler():
+    profiler = TickProfiler(enabled=False)
+    with profiler.phase("create_probe"):
+        profiler.count("syscalls_estimated", 4)
+
+    assert profiler.end_tick() == {}
+    assert profiler.summary() == {}
+    assert profiler.ticks == 0
+
+
+def test_end_tick():
+    profiler = TickProfiler(enabled=True, window=3)
+    # Every phase takes 1ms
+    clock = iter(range(0, 10**8, 10**6))
+    with patch.object(profiling.time, "perf_counter_ns", side_effect=clock):
+        for tick in range(4):
+            with profiler.phase("create_probe"):
+                profiler.count("syscalls_estimated", 4)
+            with profiler.phase("search_boundary"):
+                profiler.count("probes", tick)
+                profiler.count("syscalls_estimated", 6 * tick)
+            metrics = profiler.end_tick()
+
+    assert metrics == {
+        "phase_create_probe_seconds": 0.001,
+        "phase_search_boundary_seconds": 0.001,
+        "tick_syscalls_estimated": 22,
+        "tick_probes": 3,
+    }
+    assert profiler.ticks == 4
+    assert profiler.summary()["create_probe"] == {
+        "last": 0.001,
+        "p50": 0.001,
+        "p99": 0.001,
+        "max": 0.001,
+    }
+    # Only the last 3 iterations are kept
+    assert profiler.counts_summary()["probes"] == {
+        "last": 3,
+        "p50": 2,
+        "p99": 2,
+        "max": 3,
+    }
+    assert profiler.summary_metrics()["tick_probes_p99"] == 2
+    assert profiler.summary_metrics()["phase_create_probe_seconds_p50"] == 0.001
+    assert profiler.format_breakdown().splitlines()[0].split() == [
+        "phase",
+        "last",
+        "p50",
+        "p99",
+        "max",
+    ]
@@ -0,0 +1,69 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from pagecache.prometheus_exporter import PrometheusExporter, escape_label_value
+
+NOW = 1693739410000000000
+# Ages of 4, 8, 61 and 150 seconds
+LIVE_PROBES = [
+    1693739406000000000,
+    1693739402000000000,
+    1693739349000000000,
+    1693739260000000000,
+]
+
+
+def test_update():
+    exporter = PrometheusExporter(age_buckets=(5, 60, 120))
+    exporter.update(
+        150.0,
+        NOW,
+        LIVE_PROBES,
+        oldest_cached_probe=1693739260000000000,
+        first_evicted_probe=1693739200000000000,
+        extra_metrics={"probe_dirty_pages": 2},
+    )
+    lines = exporter.body.decode().splitlines()
+
+    assert "pagecache_ttl_min_cached_time_seconds 150.0" in lines
+    assert "pagecache_ttl_live_probes 4" in lines
+    assert 'pagecache_ttl_cached_probe_age_seconds_bucket{le="5"} 1' in lines
+    assert 'pagecache_ttl_cached_probe_age_seconds_bucket{le="60"} 2' in lines
+    assert 'pagecache_ttl_cached_probe_age_seconds_bucket{le="120"} 3' in lines
+    assert 'pagecache_ttl_cached_probe_age_seconds_bucket{le="+Inf"} 4' in lines
+    assert "pagecache_ttl_cached_probe_age_seconds_sum 223.0" in lines
+    assert "pagecache_ttl_cached_probe_age_seconds_count 4" in lines
+    assert "pagecache_ttl_oldest_cached_probe_timestamp_seconds 1693739260.0" in lines
+    assert "pagecache_ttl_first_evicted_probe_timestamp_seconds 1693739200.0" in lines
+    assert "pagecache_ttl_probe_dirty_pages 2" in lines
+
+
+def test_escape_label_values():
+    assert escape_label_value('/data "1"\\x\n') == '/data \\"1\\"\\\\x\\n'
+
+    # Every sample stays in a single valid line
+    exporter = PrometheusExporter()
+    exporter.update(8.0, NOW, LIVE_PROBES, labels={"tmp_dir": '/data "1"\n'})
+    assert (
+        'pagecache_ttl_live_probes{tmp_dir="/data \\"1\\"\\n"} 4'
+        in exporter.body.decode().splitlines()
+    )
+
+
+def test_serve_metrics():
+    exporter = PrometheusExporter("127.0.0.1", 0)
+    exporter.start()
+    try:
+        exporter.update(8.0, NOW, LIVE_PROBES[:2])
+        url = "http://127.0.0.1:{}".format(exporter.port)
+
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert response.status == 200
+            assert response.read() == exporter.body
+
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + "/")
+    finally:
+        exporter.stop()
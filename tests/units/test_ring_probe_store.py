@@ -0,0 +1,170 @@
+import os
+from unittest.mock import call, patch
+
+import cache
+from pagecache.ring_probe_store import RingProbeStore
+
+TIMESTAMPS = [1693739402, 1693739403, 1693739404, 1693739405, 1693739406]
+
+
+def _resident_vector(store, not_cached_slots=()):
+    return bytes(
+        0 if page - store.header_pages in not_cached_slots else 1
+        for page in range(store.header_pages + store.slots)
+    )
+
+
+def test_preallocate(tmp_path):
+    store = RingProbeStore(str(tmp_path), 8)
+
+    # Single file holding the header and one page per slot
+    assert os.listdir(tmp_path) == [RingProbeStore.FILENAME]
+    assert os.path.getsize(store.path) == store.file_size
+    assert store.file_size == (store.header_pages + 8) * store.page_size
+    assert list(store.timestamps) == [0] * 8
+    store.close()
+
+
+def test_add_probe_wraps_around(tmp_path):
+    store = RingProbeStore(str(tmp_path), 3)
+    for timestamp in TIMESTAMPS:
+        store.add_probe(timestamp)
+
+    # The two oldest samples were overwritten in ring order
+    assert list(store.timestamps) == [1693739405, 1693739406, 1693739404]
+    assert store.next_slot == 2
+
+    # Every slot page holds its probe timestamp
+    with open(store.path, "rb") as fd:
+        fd.seek(store._slot_offset(1))
+        assert RingProbeStore.TIMESTAMP.unpack(fd.read(8))[0] == 1693739406
+    store.close()
+
+
+def test_load_header(tmp_path):
+    store = RingProbeStore(str(tmp_path), 8)
+    for timestamp in TIMESTAMPS:
+        store.add_probe(timestamp)
+    store.close()
+
+    # Reopening with the same layout keeps the samples and the ring position
+    store = RingProbeStore(str(tmp_path), 8)
+    assert list(store.timestamps) == TIMESTAMPS + [0, 0, 0]
+    assert store.next_slot == 5
+    store.close()
+
+    # A different layout recreates an empty ring
+    store = RingProbeStore(str(tmp_path), 4)
+    assert list(store.timestamps) == [0] * 4
+    assert store.next_slot == 0
+    store.close()
+
+
+def test_get_oldest_cached_probe(tmp_path):
+    store = RingProbeStore(str(tmp_path), 8)
+    for timestamp in TIMESTAMPS:
+        store.add_probe(timestamp)
+
+    # Every probe is cached and within the time window
+    with patch.object(cache, "residency", return_value=_resident_vector(store)):
+        assert store.get_oldest_cached_probe(1693739410, 120) == 1693739402
+
+    # Slot 2 (1693739404) is not cached, it and the older ones are released
+    with patch.object(
+        cache, "residency", return_value=_resident_vector(store, (2,))
+    ) as mock_residency:
+        assert store.get_oldest_cached_probe(1693739410, 120) == 1693739405
+    mock_residency.assert_called_once_with(store.fd)
+    assert list(store.timestamps) == [0, 0, 0, 1693739405, 1693739406, 0, 0, 0]
+
+    # 1693739405 is expired
+    with patch.object(cache, "residency", return_value=_resident_vector(store)):
+        assert store.get_oldest_cached_probe(1693739410, 4) == 1693739406
+    assert list(store.timestamps) == [0, 0, 0, 0, 1693739406, 0, 0, 0]
+    store.close()
+
+
+def test_add_probe_drops_reused_slot(tmp_path):
+    store = RingProbeStore(str(tmp_path), 2)
+    for timestamp in TIMESTAMPS[:2]:
+        store.add_probe(timestamp)
+
+    # The old page of the slot is dropped before the new probe is written, not promoted
+    with patch.object(os, "posix_fadvise", wraps=os.posix_fadvise) as mock_fadvise:
+        store.add_probe(TIMESTAMPS[2])
+    mock_fadvise.assert_called_once_with(
+        store.fd, store._slot_offset(0), store.page_size, os.POSIX_FADV_DONTNEED
+    )
+    with open(store.path, "rb") as fd:
+        fd.seek(store._slot_offset(0))
+        assert RingProbeStore.TIMESTAMP.unpack(fd.read(8))[0] == TIMESTAMPS[2]
+    store.close()
+
+
+def test_add_probe_writes_only_the_slot(tmp_path):
+    store = RingProbeStore(str(tmp_path), 1024, write_strategy="sync_file_range")
+    store.add_probe(TIMESTAMPS[0])
+
+    # The probe page and the 8 bytes of its timestamp, not the whole header
+    with patch.object(os, "pwrite", wraps=os.pwrite) as mock_pwrite, patch.object(
+        cache, "sync_file_range"
+    ) as mock_sync_file_range:
+        store.add_probe(TIMESTAMPS[1])
+    assert mock_pwrite.call_args_list == [
+        call(store.fd, store.page, store._slot_offset(1)),
+        call(
+            store.fd,
+            RingProbeStore.TIMESTAMP.pack(TIMESTAMPS[1]),
+            RingProbeStore.HEADER_PREFIX.size + RingProbeStore.TIMESTAMP.size,
+        ),
+    ]
+    # Only the header page of the slot and the probe page are written back
+    assert mock_sync_file_range.call_args_list == [
+        call(store.fd, 0, store.page_size, cache.SYNC_FILE_RANGE_WRITE),
+        call(
+            store.fd,
+            store._slot_offset(1),
+            store.page_size,
+            cache.SYNC_FILE_RANGE_WRITE,
+        ),
+    ]
+    store.close()
+
+    # The header read back matches the slots
+    store = RingProbeStore(str(tmp_path), 1024)
+    assert list(store.timestamps[:3]) == TIMESTAMPS[:2] + [0]
+    store.close()
+
+
+def test_release_slots_writes_only_the_cleared_range(tmp_path):
+    store = RingProbeStore(str(tmp_path), 4)
+    for timestamp in TIMESTAMPS:
+        store.add_probe(timestamp)
+    # Slots in ring order: 1693739406, 1693739403, 1693739404, 1693739405
+
+    # 1693739404 is not cached, slots 2 and 1 are cleared, next to each other
+    with patch.object(
+        cache, "residency", return_value=_resident_vector(store, (2,))
+    ), patch.object(os, "pwrite", wraps=os.pwrite) as mock_pwrite:
+        assert store.get_oldest_cached_probe(1693739410, 120) == 1693739405
+    assert mock_pwrite.call_args_list == [
+        call(store.fd, bytes(16), store._timestamp_offset(1))
+    ]
+    store.close()
+
+    store = RingProbeStore(str(tmp_path), 4)
+    assert list(store.timestamps) == [1693739406, 0, 0, 1693739405]
+
+    # 1693739405 is expired, the cleared slot 3 and slot 0 wrap around the ring
+    store.add_probe(1693739407)
+    store.add_probe(1693739408)
+    # Slots in ring order: 1693739406, 1693739407, 1693739408, 1693739405
+    with patch.object(
+        cache, "residency", return_value=_resident_vector(store)
+    ), patch.object(os, "pwrite", wraps=os.pwrite) as mock_pwrite:
+        assert store.get_oldest_cached_probe(1693739410, 3.5) == 1693739407
+    assert mock_pwrite.call_args_list == [
+        call(store.fd, bytes(8), store._timestamp_offset(0)),
+        call(store.fd, bytes(8), store._timestamp_offset(3)),
+    ]
+    store.close()
@@ -0,0 +1,114 @@
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from pagecache.simulate import (  # noqa: E402
+    ACTIVE,
+    INACTIVE,
+    LRUSimulator,
+    generate_workload,
+    get_inactive_ratio,
+    load_trace,
+    main,
+)
+
+
+def test_get_inactive_ratio():
+    assert get_inactive_ratio(1000) == 1
+    assert get_inactive_ratio(10 * 262144) == 10
+
+
+def test_lru_simulator_inactive_fifo():
+    simulator = LRUSimulator(4, 10, batch_size=1, interval_seconds=1)
+    simulator.replay(numpy.arange(10.0), numpy.arange(10))
+
+    # Pages written once are evicted in order, the 4 newest ones stay cached
+    assert list(numpy.flatnonzero(simulator.state)) == [6, 7, 8, 9]
+    result = simulator.get_result()
+    assert result["min_cached_time"] == 3.0
+    assert result["hit_ratio"] == 0.0
+    assert result["evicted_pages"] == 6
+
+
+def test_lru_simulator_promotion():
+    simulator = LRUSimulator(4, 10, batch_size=1, interval_seconds=1)
+    # Page 0 is read right after being written
+    simulator.replay(
+        numpy.array([0.0, 1, 2, 3, 4, 5, 6, 7]), numpy.array([0, 0, 1, 2, 3, 4, 5, 6])
+    )
+
+    assert list(simulator.state[:7]) == [ACTIVE, 0, 0, 0, INACTIVE, INACTIVE, INACTIVE]
+    result = simulator.get_result()
+    assert result["min_cached_time"] == 2.0
+    assert result["hit_ratio"] == 1 / 8
+
+
+def test_lru_simulator_not_full():
+    simulator = LRUSimulator(100, 10)
+    simulator.replay(numpy.arange(10.0), numpy.arange(10))
+    assert simulator.get_result()["min_cached_time"] is None
+
+
+def test_generate_workload():
+    # 1 page per second and a consumer 2 seconds behind
+    chunks = list(generate_workload(1 / 256, [2], 6, chunk_seconds=3))
+    times = numpy.concatenate([times for times, _ in chunks])
+    pages = numpy.concatenate([pages for _, pages in chunks])
+    assert list(times) == [0, 1, 2, 2, 3, 3, 4, 4, 5, 5]
+    assert list(pages) == [0, 1, 2, 0, 3, 1, 4, 2, 5, 3]
+
+
+def test_load_trace(tmp_path):
+    trace = tmp_path / "trace.txt"
+    trace.write_text("2 4294967296\n1 7\n3 7\n")
+    total_pages, chunks = load_trace(str(trace))
+    # Sorted by time with dense page ids
+    assert total_pages == 2
+    ((times, pages),) = list(chunks)
+    assert list(times) == [1.0, 2.0, 3.0]
+    assert list(pages) == [0, 1, 0]
+
+    numpy.savez(str(tmp_path / "trace.npz"), times=[2, 1, 3], pages=[4294967296, 7, 7])
+    total_pages, chunks = load_trace(str(tmp_path / "trace.npz"))
+    assert total_pages == 2
+    ((npz_times, npz_pages),) = list(chunks)
+    assert list(npz_times) == list(times)
+    assert list(npz_pages) == list(pages)
+
+
+def test_load_trace_chunks(tmp_path):
+    trace = tmp_path / "trace.txt"
+    trace.write_text("0.5 10\n0.25 20\n1.5 10\n2.75 30\n3 20\n")
+    total_pages, chunks = load_trace(str(trace), chunk_lines=2)
+    assert total_pages == 3
+    # Fractional times, read two accesses at a time
+    assert [(list(times), list(pages)) for times, pages in chunks] == [
+        ([0.25, 0.5], [1, 0]),
+        ([1.5, 2.75], [0, 2]),
+        ([3.0], [1]),
+    ]
+
+    # Accesses out of order across chunks
+    trace.write_text("1 10\n2 20\n0.5 10\n")
+    with pytest.raises(ValueError):
+        load_trace(str(trace), chunk_lines=2)
+
+
+def test_main(capsys):
+    main(
+        [
+            "--memory-mb",
+            "1",
+            "4",
+            "--produce-mb-per-second",
+            "0.5",
+            "--duration-seconds",
+            "60",
+        ]
+    )
+    results = capsys.readouterr().out.splitlines()
+    assert len(results) == 2
+    # More memory, pages stay cached longer
+    small, large = [eval(result) for result in results]
+    assert small["memory_mb"] == 1.0
+    assert large["min_cached_time"] > small["min_cached_time"]
@@ -0,0 +1,134 @@
+import io
+import os
+import sys
+from unittest.mock import Mock, call, patch
+
+import cache
+from pagecache.pagecache_monitor import PageCacheMonitor
+from pagecache.prometheus_exporter import PrometheusExporter
+from pagecache.target_tracker import (
+    TargetFileTracker,
+    format_heatmap,
+    resize_bitmap,
+    xor_bitmaps,
+)
+
+
+def test_bitmaps():
+    assert xor_bitmaps(b"\x01\x01\x00\x00", b"\x01\x00\x01\x00") == b"\x00\x01\x01\x00"
+    assert resize_bitmap(b"\x01\x01", 3) == b"\x01\x01\x00"
+    assert resize_bitmap(b"\x01\x01\x01", 2) == b"\x01\x01"
+    assert format_heatmap([0.0, 0.5, 1.0]) == " +@"
+
+
+def test_update(tmp_path):
+    segment = tmp_path / "00000000000000012345.log"
+    segment.write_bytes(b"x" * (os.sysconf("SC_PAGE_SIZE") * 4))
+    tracker = TargetFileTracker([str(segment), str(tmp_path / "deleted.log")], ranges=2)
+
+    # mincore() bytes, only the lowest bit is the residency
+    with patch.object(cache, "residency", return_value=b"\x01\x81\x00\x00"):
+        reports = tracker.update()
+    # Files which can't be read are skipped
+    assert reports == [
+        {
+            "path": str(segment),
+            "pages": 4,
+            "cached_ratio": 0.5,
+            "loaded_pages": 2,
+            "evicted_pages": 0,
+            "churn_ratio": 0.5,
+            "heatmap": "@ ",
+            "range_cached_ratios": [1.0, 0.0],
+        }
+    ]
+
+    with patch.object(cache, "residency", return_value=b"\x00\x01\x01\x01"):
+        report = tracker.update()[0]
+    assert report["loaded_pages"] == 2
+    assert report["evicted_pages"] == 1
+    assert report["range_cached_ratios"] == [0.5, 1.0]
+
+    # The history is rebuilt from the compressed diffs
+    assert [bitmap for _, bitmap in tracker.get_bitmaps(str(segment))] == [
+        b"\x00\x01\x01\x01",
+        b"\x01\x01\x00\x00",
+    ]
+
+
+def test_report(tmp_path):
+    segment = tmp_path / "00000000000000012345.log"
+    segment.write_bytes(b"x" * (os.sysconf("SC_PAGE_SIZE") * 4))
+    tracker = TargetFileTracker([str(segment)], ranges=2)
+    tracker.statsd = Mock()
+    tracker.prometheus_exporter = PrometheusExporter()
+    tracker.ndjson_sink = Mock()
+
+    with patch.object(cache, "residency", return_value=b"\x01\x01\x00\x00"):
+        tracker.run_once()
+
+    # Tagged by file, the range ratios by range too
+    tags = ["target_file:{}".format(segment)]
+    assert (
+        call("pagecache_ttl.target_cached_ratio", 0.5, tags=tags)
+        in tracker.statsd.gauge.call_args_list
+    )
+    assert (
+        call("pagecache_ttl.target_range_cached_ratio", 1.0, tags=tags + ["range:0"])
+        in tracker.statsd.gauge.call_args_list
+    )
+    tracker.statsd.flush.assert_called_once()
+    body = tracker.prometheus_exporter.body.decode().splitlines()
+    assert (
+        'pagecache_ttl_target_churn_ratio{{target_file="{}"}} 0.5'.format(segment)
+        in body
+    )
+    assert (
+        'pagecache_ttl_target_range_cached_ratio{{target_file="{}",range="1"}} 0.0'.format(
+            segment
+        )
+        in body
+    )
+    record = tracker.ndjson_sink.write.call_args[0][0]
+    assert record["path"] == str(segment)
+    assert record["timestamp"] == tracker.last_update_time / 1000000000
+
+
+def test_tracked_by_the_probe_monitor(tmp_path):
+    segment = tmp_path / "00000000000000012345.log"
+    segment.write_bytes(b"x" * os.sysconf("SC_PAGE_SIZE"))
+    (tmp_path / "probes").mkdir()
+    pcm = PageCacheMonitor(str(tmp_path / "probes"), 1, 120, "var/log/pagecache.log")
+    pcm.target_tracker = TargetFileTracker([str(segment)])
+
+    # Both are reported by every iteration
+    captured_stdout = io.StringIO()
+    sys.stdout = captured_stdout
+    pcm.run_once()
+    sys.stdout = sys.__stdout__
+    lines = captured_stdout.getvalue().splitlines()
+    assert lines[0].startswith("{{'path': '{}'".format(segment))
+    assert lines[1].startswith("{'min_cached_time'")
+
+
+def test_coalesced_with_the_probe_monitor(tmp_path):
+    segment = tmp_path / "00000000000000012345.log"
+    segment.write_bytes(b"x" * os.sysconf("SC_PAGE_SIZE"))
+    (tmp_path / "probes").mkdir()
+    pcm = PageCacheMonitor(
+        str(tmp_path / "probes"),
+        1,
+        120,
+        "var/log/pagecache.log",
+        send_metrics_to_dogstatsd=True,
+    )
+    pcm.target_tracker = TargetFileTracker([str(segment)], ranges=2)
+    pcm.target_tracker.statsd = pcm.statsd
+    pcm.statsd.socket = Mock()
+
+    # The gauges of the probes and the target file go in a single datagram per iteration
+    pcm.run_once()
+    pcm.statsd.socket.send.assert_called_once()
+    packet = pcm.statsd.socket.send.call_args[0][0].decode().splitlines()
+    assert packet[0].startswith("pagecache_ttl.target_pages:1|g|#target_file:")
+    assert "pagecache_ttl.dogstatsd_dropped_packets:0|g" in packet
@@ -0,0 +1,43 @@
+from benchmarks.tick_benchmark import (
+    START_TIME,
+    BurstyEviction,
+    CleanEviction,
+    OutOfOrderEviction,
+    run_scenario,
+)
+from pagecache.pagecache_monitor import NANOSECONDS
+
+
+def test_oracles():
+    ttl = 10 * NANOSECONDS
+    clean = CleanEviction(ttl)
+    assert clean.is_cached(START_TIME - 9 * NANOSECONDS, START_TIME)
+    assert not clean.is_cached(START_TIME - 10 * NANOSECONDS, START_TIME)
+
+    # Every probe is evicted early when every=1
+    out_of_order = OutOfOrderEviction(ttl, every=1)
+    assert out_of_order.is_cached(START_TIME - 4 * NANOSECONDS, START_TIME)
+    assert not out_of_order.is_cached(START_TIME - 6 * NANOSECONDS, START_TIME)
+
+    # The ttl collapses during the burst
+    bursty = BurstyEviction(ttl, 60 * NANOSECONDS, 5 * NANOSECONDS)
+    assert not bursty.is_cached(START_TIME - 2 * NANOSECONDS, START_TIME)
+    assert bursty.is_cached(START_TIME + 8 * NANOSECONDS, START_TIME + 10 * NANOSECONDS)
+
+
+def test_run_scenario():
+    for probe_store, search_mode in (
+        ("files", "linear"),
+        ("files", "bisect"),
+        ("ring", "linear"),
+    ):
+        result = run_scenario(50, "clean", probe_store, search_mode, ticks=3)
+
+        # Steady state, one probe created and one evicted every iteration
+        assert result["live_probes"] == 50
+        assert result["samples"] == 50
+        assert result["tick_ms_p50"] <= result["tick_ms_max"]
+        assert result["estimated_syscalls_per_tick_p50"] > 0
+        # Clean evictions are found exactly
+        assert result["min_cached_time_error_seconds_max"] == 0
+        assert result["missed_evictions_max"] == 0
@@ -0,0 +1,70 @@
+import pytest
+
+from pagecache.ttl_stats import (
+    RollingWindow,
+    TTLStatsStore,
+    format_window,
+    get_bin,
+    get_bin_value,
+)
+
+NANOSECONDS = 1000000000
+
+
+def test_bins():
+    assert get_bin(0) == 0
+    for value in (0.01, 1.5, 60, 3600, 86400):
+        # The middle of the bin is within the bin relative error
+        assert get_bin_value(get_bin(value)) == pytest.approx(value, rel=0.12)
+
+
+def test_format_window():
+    assert format_window(60) == "1m"
+    assert format_window(300) == "5m"
+    assert format_window(3600) == "1h"
+    assert format_window(90) == "90s"
+
+
+def test_rolling_window():
+    window = RollingWindow(10, 11)
+    assert window.summary() is None
+
+    for second, value in enumerate([50, 40, 5, 45, 60, 55, 50, 50, 50, 50]):
+        window.add(second * NANOSECONDS, value)
+    summary = window.summary()
+    assert (summary["min"], summary["max"]) == (5, 60)
+    assert summary["p50"] == pytest.approx(50, rel=0.12)
+    assert summary["p99"] == pytest.approx(60, rel=0.12)
+
+    # The dip and the peak expire once they are older than the window
+    for second in range(10, 15):
+        window.add(second * NANOSECONDS, 50)
+    summary = window.summary()
+    assert (summary["min"], summary["max"]) == (50, 55)
+    assert window.count == 10
+
+
+def test_rolling_window_capacity():
+    # Readings faster than expected are expired by the fixed capacity
+    window = RollingWindow(60, 3)
+    for tick, value in enumerate([1, 2, 3, 4]):
+        window.add(tick, value)
+    assert window.count == 3
+    assert window.summary()["min"] == 2
+
+
+def test_ttl_stats_store():
+    store = TTLStatsStore((60, 3600), 1)
+    assert store.windows["1m"].capacity == 61
+    store.add(NANOSECONDS, 30.0)
+
+    assert store.get_metrics("min_cached_time") == {
+        "min_cached_time_1m_min": 30.0,
+        "min_cached_time_1m_p50": 30.0,
+        "min_cached_time_1m_p99": 30.0,
+        "min_cached_time_1m_max": 30.0,
+        "min_cached_time_1h_min": 30.0,
+        "min_cached_time_1h_p50": 30.0,
+        "min_cached_time_1h_p99": 30.0,
+        "min_cached_time_1h_max": 30.0,
+    }